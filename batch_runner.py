@@ -0,0 +1,170 @@
+# Processes many match videos in parallel worker processes
+#   python batch_runner.py input_videos/ --output-dir output_videos/batch --workers 4
+#   python batch_runner.py manifest.txt --workers 8 --threads-per-worker 4
+# A manifest is a .txt file with one video path per line, or a .json list of paths.
+# Every job writes <output-dir>/<name>.mp4 (or .avi), its detection stubs in <output-dir>/<name>/ and a
+# <output-dir>/<name>.done marker. <name> is the video's file name, videos with the same file name in
+# different directories get a hash of their directory appended (e.g. match-3f2a9c1d). Jobs with a marker are skipped on the next run unless --force is given.
+# Status and timing of every job go to <output-dir>/summary.json, rewritten as jobs finish.
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from utils.process_utils import limit_threads
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.m4v')
+
+
+def list_videos(input_path):
+    # Videos of a directory (sorted) or the entries of a manifest file
+    if os.path.isdir(input_path):
+        return [os.path.join(input_path, name) for name in sorted(os.listdir(input_path))
+                if name.lower().endswith(VIDEO_EXTENSIONS)]
+    with open(input_path) as f:
+        if input_path.endswith('.json'):
+            return list(json.load(f))
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def job_names(video_paths):
+    # {video_path: output name}, unique per video. Names that would collide get a hash of the directory,
+    # names that don't keep the plain file name, so outputs of earlier runs are still found
+    names = {video_path: os.path.splitext(os.path.basename(video_path))[0] for video_path in video_paths}
+    counts = {}
+    for name in names.values():
+        counts[name] = counts.get(name, 0) + 1
+    for video_path, name in names.items():
+        if counts[name] > 1:
+            directory = os.path.dirname(os.path.abspath(video_path))
+            names[video_path] = f"{name}-{hashlib.sha1(directory.encode()).hexdigest()[:8]}"
+    return names
+
+
+def job_paths(video_path, output_dir, extension, name = None):
+    if name is None:
+        name = os.path.splitext(os.path.basename(video_path))[0]
+    return {
+        'output_video_path': os.path.join(output_dir, name + extension),
+        'player_stub_path': os.path.join(output_dir, name, 'player_detections.det'),
+        'ball_stub_path': os.path.join(output_dir, name, 'ball_detections.det'),
+        'done_path': os.path.join(output_dir, name + '.done'),
+    }
+
+
+def run_job(video_path, paths, options):
+    # Runs in a worker process, main is only imported here so the parent never loads the models
+    from main import process_video
+    start = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        # Stubs of an earlier, interrupted run are reused. Stores are moved into place once complete (see
+        # write_columns), frame_offsets also rules out partial stores of older versions, it was written last
+        read_from_stub = all(os.path.exists(os.path.join(paths[key], 'frame_offsets.npy'))
+                             for key in ('player_stub_path', 'ball_stub_path'))
+        result = process_video(video_path, paths['output_video_path'],
+                               player_stub_path=paths['player_stub_path'],
+                               ball_stub_path=paths['ball_stub_path'],
+                               read_from_stub=read_from_stub,
+                               **options)
+        status = {'status': 'done', **result}
+    except Exception as e:
+        status = {'status': 'failed', 'error': f"{type(e).__name__}: {e}", 'traceback': traceback.format_exc()}
+    status['seconds'] = round(time.perf_counter() - start, 2)
+    status['cpu_seconds'] = round(time.process_time() - start_cpu, 2)
+
+    if status['status'] == 'done':
+        # Marker is written last, so a crashed job is never seen as complete
+        with open(paths['done_path'] + '.tmp', 'w') as f:
+            json.dump(status, f, indent=2)
+        os.replace(paths['done_path'] + '.tmp', paths['done_path'])
+    return status
+
+
+def write_summary(summary_path, jobs, start):
+    summary = {
+        'seconds': round(time.perf_counter() - start, 2),
+        'counts': {status: sum(job['status'] == status for job in jobs.values())
+                   for status in ('done', 'skipped', 'failed', 'queued')},
+        'jobs': jobs,
+    }
+    with open(summary_path + '.tmp', 'w') as f:
+        json.dump(summary, f, indent=2)
+    os.replace(summary_path + '.tmp', summary_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Process a directory or manifest of pickleball videos in parallel')
+    parser.add_argument('input', help='directory of videos or manifest file (.txt, one path per line, or .json list)')
+    parser.add_argument('--output-dir', default='output_videos/batch')
+    parser.add_argument('--workers', type=int, default=2, help='videos processed at the same time')
+    parser.add_argument('--threads-per-worker', type=int, help='torch / OpenCV threads per worker, default cores / workers')
+    parser.add_argument('--force', action='store_true', help='re-run jobs that already have a .done marker')
+    parser.add_argument('--summary', help='summary file, default <output-dir>/summary.json')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--player-stride', type=int, default=1)
+    parser.add_argument('--ball-window', type=int)
+    parser.add_argument('--projection', default='keypoint', choices=['keypoint', 'homography'])
+    args = parser.parse_args()
+
+    num_threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+    summary_path = args.summary or os.path.join(args.output_dir, 'summary.json')
+    os.makedirs(args.output_dir, exist_ok=True)
+    options = {
+        'detection_batch_size': args.batch_size,
+        'player_detection_stride': args.player_stride,
+        'ball_search_window_size': args.ball_window,
+        'mini_court_projection': args.projection,
+        # Rendering gets the worker's share of the cores, not all of them
+        'render_workers': num_threads,
+    }
+
+    from shutil import which
+    extension = '.mp4' if which('ffmpeg') else '.avi'
+    start = time.perf_counter()
+    jobs = {}
+    pending = []
+    # A video listed twice is processed once
+    video_paths = list(dict.fromkeys(os.path.normpath(video_path) for video_path in list_videos(args.input)))
+    names = job_names(video_paths)
+    for video_path in video_paths:
+        paths = job_paths(video_path, args.output_dir, extension, names[video_path])
+        if not args.force and os.path.exists(paths['done_path']):
+            jobs[video_path] = {'status': 'skipped', 'output_video_path': paths['output_video_path']}
+        else:
+            os.makedirs(os.path.dirname(paths['player_stub_path']), exist_ok=True)
+            jobs[video_path] = {'status': 'queued'}
+            pending.append((video_path, paths))
+    print(f"{len(jobs)} videos, {len(pending)} to process on {args.workers} workers x {num_threads} threads")
+    write_summary(summary_path, jobs, start)
+
+    # spawn: workers start clean (no inherited torch / CUDA state) and apply the thread limits before any import
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(args.workers, mp_context=context, initializer=limit_threads, initargs=(num_threads,)) as executor:
+        futures = {}
+        for video_path, paths in pending:
+            futures[executor.submit(run_job, video_path, paths, options)] = video_path
+
+        for future in as_completed(futures):
+            video_path = futures[future]
+            try:
+                jobs[video_path] = future.result()
+            except Exception as e:
+                # The worker process itself died (e.g. out of memory)
+                jobs[video_path] = {'status': 'failed', 'error': f"{type(e).__name__}: {e}"}
+            job = jobs[video_path]
+            print(f"{job['status']:>7s} {video_path} ({job.get('seconds', 0):.1f}s) {job.get('error', '')}")
+            write_summary(summary_path, jobs, start)
+
+    counts = {status: sum(job['status'] == status for job in jobs.values()) for status in ('done', 'skipped', 'failed')}
+    print(f"{counts['done']} done, {counts['skipped']} skipped, {counts['failed']} failed in "
+          f"{time.perf_counter() - start:.1f}s, summary in {summary_path}")
+    if counts['failed']:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Per-frame cost and agreement of BallTracker's predicted-window search against the full-frame search
+# Run from the repo root: python -m benchmarks.ball_search_window --video input_videos/input_video2p.mp4 --frames 300
+import argparse
+import time
+from itertools import islice
+import numpy as np
+from utils import read_video_frames
+from trackers import BallTracker
+
+
+def run(model_path, frames, **options):
+    # Fresh tracker per run so prev_center / vel / misses start from the same state
+    ball_tracker = BallTracker(model_path=model_path)
+    ball_tracker.detect_frame(frames[0]) # warm up
+    ball_tracker = BallTracker(model_path=model_path)
+    ball_tracker.model # models load lazily, keep loading out of the timed run
+
+    start = time.perf_counter()
+    detections = ball_tracker.detect_frames(frames, **options)
+    return detections, time.perf_counter() - start, ball_tracker.search_stats
+
+
+def center_distances(reference, detections):
+    # Distance between ball centers on frames where both runs found the ball, and frames found by only one of them
+    distances = []
+    only_one = 0
+    for ref_dict, det_dict in zip(reference, detections):
+        if (1 in ref_dict) != (1 in det_dict):
+            only_one += 1
+        elif 1 in ref_dict:
+            ref_center = np.add(ref_dict[1][:2], ref_dict[1][2:]) / 2
+            det_center = np.add(det_dict[1][:2], det_dict[1][2:]) / 2
+            distances.append(np.hypot(*(ref_center - det_center)))
+    return np.array(distances), only_one
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--video', default='input_videos/input_video2p.mp4')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--model', default='models/yolov8n_last.pt')
+    parser.add_argument('--window-sizes', type=int, nargs='+', default=[320, 416, 512, 640])
+    parser.add_argument('--max-misses', type=int, default=5)
+    args = parser.parse_args()
+
+    frames = list(islice(read_video_frames(args.video), args.frames))
+    reference, reference_time, _ = run(args.model, frames)
+    reference = reference.to_detections()
+    print(f"full frame : {reference_time / len(frames) * 1000:6.1f} ms/frame, ball found on {sum(1 in d for d in reference)} frames")
+
+    for window_size in args.window_sizes:
+        detections, elapsed, search_stats = run(args.model, frames, search_window_size=window_size, max_misses=args.max_misses)
+        distances, only_one = center_distances(reference, detections)
+        print(f"window {window_size:4d}: {elapsed / len(frames) * 1000:6.1f} ms/frame ({reference_time / elapsed:4.1f}x), "
+              f"{search_stats['full_frame']} full-frame fallbacks | same ball (< 3px) on "
+              f"{np.mean(distances < 3) if len(distances) else 0:6.2%} of common frames, found by only one run on {only_one} frames")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Regression check and benchmark for BallTracker.get_ball_shot_frames
+# Compares the vectorized and the online (streaming) versions with the original per-frame loop, on a stub
+# and/or a synthetic trajectory.
+# Run from the repo root: python -m benchmarks.ball_shot_frames --stub tracker_stubs/ball_detections2p.det
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from utils import Tracks, load_stub
+from trackers import BallTracker, OnlineBallInterpolator, OnlineShotDetector
+
+
+def reference_ball_shot_frames(ball_positions):
+    # Original loop implementation (with .loc instead of the chained assignment, which is a no-op under copy-on-write)
+    ball_positions = [x.get(1, []) for x in ball_positions]
+    df_ball_positions = pd.DataFrame(ball_positions, columns=['x1', 'y1', 'x2', 'y2'])
+
+    df_ball_positions['ball_hit'] = 0
+    df_ball_positions['mid_y'] = (df_ball_positions['y1'] + df_ball_positions['y2']) / 2
+    df_ball_positions['mid_y_rolling_mean'] = df_ball_positions['mid_y'].rolling(window = 5, min_periods = 1, center = False).mean()
+    df_ball_positions['delta_y'] = df_ball_positions['mid_y_rolling_mean'].diff()
+    minimum_change_frames_for_hit = 18
+    for i in range(1, len(df_ball_positions) - int(minimum_change_frames_for_hit * 1.2)):
+        negative_position_change = df_ball_positions['delta_y'].iloc[i] > 0 and df_ball_positions['delta_y'].iloc[i + 1] < 0
+        positive_position_change = df_ball_positions['delta_y'].iloc[i] < 0 and df_ball_positions['delta_y'].iloc[i + 1] > 0
+
+        if negative_position_change or positive_position_change:
+            change_count = 0
+            for change_frame in range(i + 1, i + int(minimum_change_frames_for_hit * 1.2)+1):
+                negative_position_change_following_frame = df_ball_positions['delta_y'].iloc[i] > 0 and df_ball_positions['delta_y'].iloc[change_frame] < 0
+                positive_position_change_following_frame = df_ball_positions['delta_y'].iloc[i] < 0 and df_ball_positions['delta_y'].iloc[change_frame] > 0
+
+                if negative_position_change and negative_position_change_following_frame:
+                    change_count += 1
+                elif positive_position_change and positive_position_change_following_frame:
+                    change_count += 1
+
+            if change_count > minimum_change_frames_for_hit-1:
+                df_ball_positions.loc[i, 'ball_hit'] = 1
+
+    return df_ball_positions[df_ball_positions['ball_hit'] == 1].index.tolist()
+
+
+def synthetic_ball_track(num_frames, seed = 0):
+    # Ball going back and forth between the baselines in arcs of 30-60 frames, with noise and missed detections
+    rng = np.random.default_rng(seed)
+    mid_y = np.empty(num_frames)
+    frame_num = 0
+    going_far = True
+    while frame_num < num_frames:
+        length = int(rng.integers(30, 61))
+        t = np.linspace(0, 1, length)
+        y = 300 + 600 * (1 - t if going_far else t) - 80 * np.sin(np.pi * t)
+        mid_y[frame_num:frame_num + length] = y[:num_frames - frame_num]
+        frame_num += length
+        going_far = not going_far
+    mid_y += rng.normal(0, 1.5, num_frames)
+    mid_x = 960 + 200 * np.sin(np.arange(num_frames) / 50)
+
+    detections = []
+    for i in range(num_frames):
+        if rng.random() < 0.15:
+            detections.append({})
+        else:
+            detections.append({1: [mid_x[i] - 6, mid_y[i] - 6, mid_x[i] + 6, mid_y[i] + 6]})
+    return detections
+
+
+def online_ball_shot_frames(detections):
+    # Streaming path: raw detections go through the online interpolator and shot detector frame by frame
+    interpolator = OnlineBallInterpolator()
+    shot_detector = OnlineShotDetector()
+    hits = []
+    for ball_dict in detections:
+        for _, interpolated_dict in interpolator.update(ball_dict):
+            hits.extend(shot_detector.update(interpolated_dict))
+    for _, interpolated_dict in interpolator.flush():
+        hits.extend(shot_detector.update(interpolated_dict))
+    return hits
+
+
+def compare(name, ball_tracker, ball_positions, repeat):
+    raw_detections = ball_positions.to_detections()
+    ball_positions = ball_tracker.interpolate_ball_positions(ball_positions)
+    detections = ball_positions.to_detections()
+
+    start = time.perf_counter()
+    expected = reference_ball_shot_frames(detections)
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = ball_tracker.get_ball_shot_frames(ball_positions)
+    vectorized_time = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    online_result = online_ball_shot_frames(raw_detections)
+    online_time = time.perf_counter() - start
+
+    ok = result == expected and online_result == expected
+    status = 'OK' if ok else 'MISMATCH'
+    print(f"{name}: {len(ball_positions)} frames, {len(result)} hits, {status} | "
+          f"loop {reference_time:.3f}s, vectorized {vectorized_time * 1000:.2f}ms "
+          f"({reference_time / vectorized_time:.0f}x), online {online_time / len(ball_positions) * 1e6:.1f}us/frame")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stub', help='ball detection stub (.det store or .pkl)')
+    parser.add_argument('--frames', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # The model is never used, skip loading it
+    ball_tracker = BallTracker.__new__(BallTracker)
+
+    ok = True
+    if args.stub:
+        ok &= compare(args.stub, ball_tracker, load_stub(args.stub), args.repeat)
+    ok &= compare('synthetic', ball_tracker, Tracks.from_detections(synthetic_ball_track(args.frames)), args.repeat)
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
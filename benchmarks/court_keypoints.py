@@ -0,0 +1,90 @@
+# Latency and accuracy of the CourtLineDetector backends on the Pickleball-Court-Keypoints-6 validation split
+# The split's images are not in the repo, download the dataset from Roboflow (see README) into the split folder.
+# Run from the repo root: python -m benchmarks.court_keypoints --model models/keypoint_model2.pth
+import argparse
+import json
+import os
+import time
+import cv2
+import numpy as np
+from court_line_detector import CourtLineDetector
+
+CONFIGS = [
+    ('pytorch (current)', {}),
+    ('pytorch + fast preprocess', {'fast_preprocess': True}),
+    ('pytorch + channels_last + int8', {'fast_preprocess': True, 'channels_last': True, 'quantize': True}),
+    ('torchscript', {'backend': 'torchscript', 'fast_preprocess': True, 'channels_last': True}),
+    ('torchscript + int8', {'backend': 'torchscript', 'fast_preprocess': True, 'channels_last': True, 'quantize': True}),
+    ('onnx', {'backend': 'onnx', 'fast_preprocess': True}),
+    ('onnx + int8', {'backend': 'onnx', 'fast_preprocess': True, 'quantize': True}),
+]
+
+
+def load_split(split_dir):
+    # Images and (12, 2) ground truth keypoints from the COCO export
+    with open(os.path.join(split_dir, '_annotations.coco.json')) as f:
+        coco = json.load(f)
+    keypoints_by_image = {annotation['image_id']: np.array(annotation['keypoints'], np.float32).reshape(-1, 3)[:, :2]
+                          for annotation in coco['annotations'] if annotation.get('keypoints')}
+
+    images = []
+    ground_truth = []
+    for image_info in coco['images']:
+        image = cv2.imread(os.path.join(split_dir, image_info['file_name']))
+        if image is None or image_info['id'] not in keypoints_by_image:
+            continue
+        images.append(image)
+        ground_truth.append(keypoints_by_image[image_info['id']])
+    return images, np.array(ground_truth)
+
+
+def mean_pixel_error(predicted, expected):
+    # Mean euclidean distance per keypoint, predicted is (n, 24) and expected (n, 12, 2)
+    return float(np.linalg.norm(predicted.reshape(len(predicted), -1, 2) - expected.reshape(len(predicted), -1, 2), axis=2).mean())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default='models/keypoint_model2.pth')
+    parser.add_argument('--split-dir', default='training/Pickleball-Court-Keypoints-6/valid')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    images, ground_truth = load_split(args.split_dir)
+    if not images:
+        raise SystemExit(f"No images found in {args.split_dir}, download the dataset images first")
+    print(f"{len(images)} validation images")
+
+    baseline = None
+    for name, options in CONFIGS:
+        try:
+            court_line_detector = CourtLineDetector(args.model, **options)
+            # Backends are imported when the model loads, load it here so a missing one is skipped
+            court_line_detector.load_model()
+        except ImportError as e:
+            print(f"{name:32s} skipped: {e}")
+            continue
+
+        court_line_detector.predict(images[0]) # warm up
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            predictions = np.array([court_line_detector.predict(image) for image in images])
+        single_latency = (time.perf_counter() - start) / (args.repeat * len(images))
+
+        batch = (images * args.batch_size)[:args.batch_size]
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            court_line_detector.predict_batch(batch)
+        batch_latency = (time.perf_counter() - start) / (args.repeat * len(batch))
+
+        if baseline is None:
+            baseline = predictions
+        print(f"{name:32s} {single_latency * 1000:7.1f} ms/img (batch 1) {batch_latency * 1000:7.1f} ms/img "
+              f"(batch {args.batch_size}) | error vs labels {mean_pixel_error(predictions, ground_truth):6.2f}px, "
+              f"vs current {mean_pixel_error(predictions, baseline):6.2f}px")
+
+
+if __name__ == "__main__":
+    main()
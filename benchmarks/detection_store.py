@@ -0,0 +1,39 @@
+# Regression check for the detection store: boxes, detector scores and class ids must survive
+# Detections -> Tracks -> store -> Tracks, through both writers (save_tracks and save_detections).
+# Run from the repo root: python -m benchmarks.detection_store
+import os
+import tempfile
+import numpy as np
+from utils import Detections, Tracks, DetectionStore, save_tracks, save_detections
+
+
+def check_round_trip(name, save, detections, tracks, store_path):
+    save(store_path)
+    store = DetectionStore(store_path)
+    loaded = store.to_tracks()
+    ok = (store.to_detections() == [dict(frame_dict) for frame_dict in detections] and
+          np.allclose(np.asarray(store.confidence), [0.9, 0.55, 0.75]) and
+          all(np.array_equal(loaded.track(track_id).confidence, tracks.track(track_id).confidence) for track_id in (1, 2)) and
+          (np.asarray(store.class_id) == 0).all())
+    print(f"{name}: {'ok' if ok else 'MISMATCH'}")
+    return ok
+
+
+def main():
+    detections = [Detections({1: [10, 20, 30, 40], 2: [50, 60, 70, 80]}, {1: 0.9, 2: 0.55}),
+                  Detections(),
+                  Detections({2: [52, 61, 72, 83]}, {2: 0.75})]
+    tracks = Tracks.from_detections(detections)
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        ok &= check_round_trip('save_tracks', lambda path: save_tracks(tracks, path, class_id=0),
+                               detections, tracks, os.path.join(tmp, 'tracks.det'))
+        ok &= check_round_trip('save_detections', lambda path: save_detections(detections, path, class_id=0),
+                               detections, tracks, os.path.join(tmp, 'detections.det'))
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
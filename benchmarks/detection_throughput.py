@@ -0,0 +1,60 @@
+# Throughput of per-frame vs batched YOLO inference for PlayerTracker and BallTracker
+# Run from the repo root: python -m benchmarks.detection_throughput --video input_videos/input_video2p.mp4
+import argparse
+import time
+from itertools import islice
+from utils import read_video_frames
+from trackers import PlayerTracker, BallTracker
+
+
+def time_detection(tracker_cls, model_path, frames, batch_size):
+    # Fresh tracker per run so prev_center / track IDs start from the same state
+    tracker = tracker_cls(model_path=model_path)
+    tracker.detect_frames(frames[:batch_size], batch_size=batch_size) # warm up
+    tracker = tracker_cls(model_path=model_path)
+    tracker.model # models load lazily, keep loading out of the timed run
+
+    start = time.perf_counter()
+    detections = tracker.detect_frames(frames, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    return detections, elapsed
+
+
+def count_mismatches(reference, detections):
+    # Frames where the batched run picked different ids or boxes (> 1px) than the per-frame run
+    mismatches = 0
+    for ref_dict, det_dict in zip(reference, detections):
+        if len(ref_dict) != len(det_dict):
+            mismatches += 1
+            continue
+        for ref_bbox, det_bbox in zip(sorted(ref_dict.values()), sorted(det_dict.values())):
+            if max(abs(a - b) for a, b in zip(ref_bbox, det_bbox)) > 1.0:
+                mismatches += 1
+                break
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--video', default='input_videos/input_video2p.mp4')
+    parser.add_argument('--frames', type=int, default=240)
+    parser.add_argument('--player-model', default='yolov8x.pt')
+    parser.add_argument('--ball-model', default='models/yolov8n_last.pt')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[4, 8, 16])
+    args = parser.parse_args()
+
+    frames = list(islice(read_video_frames(args.video), args.frames))
+    print(f"{len(frames)} frames from {args.video}")
+
+    for name, tracker_cls, model_path in [('player', PlayerTracker, args.player_model),
+                                          ('ball', BallTracker, args.ball_model)]:
+        reference, base_time = time_detection(tracker_cls, model_path, frames, 1)
+        print(f"{name:6s} batch  1: {len(frames) / base_time:7.2f} fps")
+        for batch_size in args.batch_sizes:
+            detections, elapsed = time_detection(tracker_cls, model_path, frames, batch_size)
+            print(f"{name:6s} batch {batch_size:2d}: {len(frames) / elapsed:7.2f} fps "
+                  f"({base_time / elapsed:.2f}x), {count_mismatches(reference, detections)} frames differ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# Encode speed vs file size of the save_video encoder backends
+# Run from the repo root: python -m benchmarks.encoders --video input_videos/input_video2p.mp4 --frames 300
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from itertools import islice
+from utils import read_video_frames, get_video_fps, save_video
+
+CONFIGS = [
+    ('opencv MJPG (current)', '.avi', {'encoder': 'opencv', 'fourcc': 'MJPG'}),
+    ('opencv mp4v', '.mp4', {'encoder': 'opencv', 'fourcc': 'mp4v'}),
+    ('ffmpeg x264 ultrafast crf 23', '.mp4', {'encoder': 'ffmpeg', 'codec': 'libx264', 'preset': 'ultrafast', 'crf': 23}),
+    ('ffmpeg x264 veryfast crf 23', '.mp4', {'encoder': 'ffmpeg', 'codec': 'libx264', 'preset': 'veryfast', 'crf': 23}),
+    ('ffmpeg x264 medium crf 23', '.mp4', {'encoder': 'ffmpeg', 'codec': 'libx264', 'preset': 'medium', 'crf': 23}),
+    ('ffmpeg x265 fast crf 28', '.mp4', {'encoder': 'ffmpeg', 'codec': 'libx265', 'preset': 'fast', 'crf': 28}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--video', default='input_videos/input_video2p.mp4')
+    parser.add_argument('--frames', type=int, default=300)
+    args = parser.parse_args()
+
+    # Decode once up front so only encoding is timed
+    frames = list(islice(read_video_frames(args.video), args.frames))
+    if not frames:
+        raise SystemExit(f"Could not read frames from {args.video}")
+    fps = get_video_fps(args.video)
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]} at {fps:.2f} fps")
+
+    baseline_size = None
+    with tempfile.TemporaryDirectory() as output_dir:
+        for name, extension, options in CONFIGS:
+            if options['encoder'] == 'ffmpeg' and not shutil.which('ffmpeg'):
+                print(f"{name:30s} skipped: ffmpeg not installed")
+                continue
+            output_path = os.path.join(output_dir, 'output' + extension)
+            start = time.perf_counter()
+            try:
+                # Not in the background, the thread would only hide the encode time here
+                save_video(frames, output_path, fps=fps, background=False, **options)
+            except RuntimeError as e:
+                print(f"{name:30s} failed: {e}")
+                continue
+            elapsed = time.perf_counter() - start
+
+            size = os.path.getsize(output_path)
+            if baseline_size is None:
+                baseline_size = size
+            print(f"{name:30s} {len(frames) / elapsed:7.1f} fps encode | {size / 1e6:8.2f} MB "
+                  f"({size / baseline_size:5.1%} of MJPG, {size * 8 / (len(frames) / fps) / 1e6:6.2f} Mbit/s)")
+            os.remove(output_path)
+
+
+if __name__ == "__main__":
+    main()
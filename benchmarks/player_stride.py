@@ -0,0 +1,77 @@
+# Accuracy vs speed of PlayerTracker.detect_frames(detection_stride=k)
+# Boxes at every stride are compared with full-rate detections by IoU. Without --video the full-rate stub is
+# subsampled and interpolated (no model needed, only accuracy), with --video the detector really runs per stride.
+# Run from the repo root: python -m benchmarks.player_stride --stub tracker_stubs/player_detections2p.det
+#                    or:  python -m benchmarks.player_stride --video input_videos/input_video2p.mp4 --frames 300
+import argparse
+import time
+from itertools import islice
+import numpy as np
+from utils import Track, Tracks, load_stub, read_video_frames, measure_iou
+
+
+def subsample(tracks, stride):
+    # Keep only the frames the detector would see with this stride and interpolate the rest
+    num_frames = len(tracks)
+    detected = np.zeros(num_frames, bool)
+    detected[::stride] = True
+    detected[-1] = True
+    return Tracks(num_frames, {track_id: Track(track_id, track.frames[detected[track.frames]], track.values[detected[track.frames]])
+                               for track_id, track in tracks.tracks.items()}).interpolate(max_gap=stride)
+
+
+def match_iou(reference, tracks):
+    # For every reference box, IoU with the best matching box in the same frame (track IDs can differ between runs)
+    # Returns the IoU of every reference box (0 when nothing matches) and the number of extra boxes
+    ious = []
+    extra_boxes = 0
+    for reference_dict, frame_dict in zip(reference, tracks):
+        boxes = np.array(list(frame_dict.values())).reshape(-1, 4)
+        for bbox in reference_dict.values():
+            ious.append(measure_iou(bbox, boxes).max() if len(boxes) else 0.0)
+        extra_boxes += max(0, len(boxes) - len(reference_dict))
+    return np.array(ious), extra_boxes
+
+
+def print_row(stride, ious, extra_boxes, seconds = None, num_frames = None):
+    timing = f" | {seconds:6.1f}s ({num_frames / seconds:6.1f} fps)" if seconds else ""
+    print(f"stride {stride:2d}: mean IoU {ious.mean():.3f}, p5 IoU {np.percentile(ious, 5):.3f}, "
+          f"IoU < 0.5 {np.mean(ious < 0.5):6.2%}, extra boxes {extra_boxes}{timing}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stub', help='full-rate player detections (.det store or .pkl)')
+    parser.add_argument('--video', help='run the detector on this video instead of subsampling a stub')
+    parser.add_argument('--model', default='yolov8x.pt')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--strides', type=int, nargs='+', default=[1, 2, 3, 4, 6, 8])
+    args = parser.parse_args()
+    if not args.stub and not args.video:
+        parser.error('pass --stub and/or --video')
+
+    if args.video:
+        from trackers import PlayerTracker
+        frames = list(islice(read_video_frames(args.video), args.frames))
+        reference = None
+        for stride in sorted(set(args.strides) | {1}):
+            # Fresh tracker per run so track IDs start from the same state
+            player_tracker = PlayerTracker(model_path=args.model)
+            player_tracker.model # models load lazily, keep loading out of the timed run
+            start = time.perf_counter()
+            tracks = player_tracker.detect_frames(frames, batch_size=args.batch_size, detection_stride=stride)
+            seconds = time.perf_counter() - start
+            if reference is None:
+                reference = tracks.to_detections()
+            print_row(stride, *match_iou(reference, tracks), seconds, len(frames))
+    else:
+        reference = load_stub(args.stub)
+        reference_detections = reference.to_detections()
+        print(f"{len(reference)} frames, model-free estimate (detector time scales with 1 / stride)")
+        for stride in args.strides:
+            print_row(stride, *match_iou(reference_detections, subsample(reference, stride)))
+
+
+if __name__ == "__main__":
+    main()
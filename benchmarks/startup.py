@@ -0,0 +1,79 @@
+# Import and startup time of the packages and detectors, each measured in a fresh interpreter
+# Model files are optional: without them only construction is timed (models load lazily on first use).
+# Run from the repo root: python -m benchmarks.startup --court-model models/keypoint_model2.pth
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Modules that should only be imported once a model actually runs
+HEAVY_MODULES = ('torch', 'torchvision', 'ultralytics', 'pandas')
+
+# name -> code run in a fresh interpreter, after `import time; start = time.perf_counter()`
+STARTUP_CASES = {
+    'import_utils': 'import utils',
+    'import_trackers': 'import trackers',
+    'import_court_line_detector': 'import court_line_detector',
+    'import_mini_court': 'import mini_court',
+    'import_main': 'import main',
+    'create_detectors': ("import trackers, court_line_detector\n"
+                         "start = time.perf_counter()\n"
+                         "trackers.PlayerTracker('yolov8x.pt'); trackers.BallTracker('models/yolov8n_last.pt')\n"
+                         "court_line_detector.CourtLineDetector('models/keypoint_model2.pth')"),
+}
+
+
+def time_in_subprocess(code, repeat = 3):
+    # Best wall time of code in a fresh interpreter (timed inside it, so interpreter startup is not included)
+    # and the heavy modules it left imported
+    script = (f"import time, sys\nstart = time.perf_counter()\n{code}\n"
+              f"print(time.perf_counter() - start)\n"
+              f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    best = float('inf')
+    heavy = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                                cwd=os.getcwd(), check=True).stdout.splitlines()
+        best = min(best, float(output[-2]))
+        heavy = [m for m in output[-1].split(',') if m]
+    return best, heavy
+
+
+def startup_results(repeat = 3, cases = STARTUP_CASES):
+    # {name: (seconds, heavy modules imported)}
+    return {name: time_in_subprocess(code, repeat) for name, code in cases.items()}
+
+
+def model_load_cases(player_model = None, ball_model = None, court_model = None):
+    # Time to first usable model, for the model files that exist
+    cases = {}
+    if player_model and os.path.exists(player_model):
+        cases['load_player_model'] = f"import trackers\nstart = time.perf_counter()\ntrackers.PlayerTracker({player_model!r}).model"
+    if ball_model and os.path.exists(ball_model):
+        cases['load_ball_model'] = f"import trackers\nstart = time.perf_counter()\ntrackers.BallTracker({ball_model!r}).model"
+    if court_model and os.path.exists(court_model):
+        cases['load_court_model'] = (f"import court_line_detector\nstart = time.perf_counter()\n"
+                                     f"court_line_detector.CourtLineDetector({court_model!r}).model")
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--player-model', default='yolov8x.pt')
+    parser.add_argument('--ball-model', default='models/yolov8n_last.pt')
+    parser.add_argument('--court-model', default='models/keypoint_model2.pth')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=True)
+    print(f"{'interpreter startup':>28s}: {(time.perf_counter() - start) * 1000:8.1f} ms (not included below)")
+
+    cases = {**STARTUP_CASES, **model_load_cases(args.player_model, args.ball_model, args.court_model)}
+    for name, (seconds, heavy) in startup_results(args.repeat, cases).items():
+        print(f"{name:>28s}: {seconds * 1000:8.1f} ms | heavy modules imported: {', '.join(heavy) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+# Model-free benchmark of every pipeline stage on synthetic pickleball video
+# A court (from constants) in perspective, two players and a ball flying in arcs between them are drawn
+# with OpenCV, and stub detectors return the ground-truth boxes, so no footage or model weights are needed.
+# Every stage is timed at each video length and resolution (best of --repeat runs).
+# Run from the repo root:
+#   python -m benchmarks.synthetic_suite --save benchmarks/results/baseline.json
+#   python -m benchmarks.synthetic_suite --baseline benchmarks/results/baseline.json
+# With --baseline, stages slower than the baseline by more than their threshold fail the run (exit code 1).
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from itertools import cycle, islice
+import cv2
+import numpy as np
+import constants
+from utils import read_video_frames, save_video, get_player_stats_lines, draw_player_stats_lines
+from trackers import PlayerTracker, BallTracker, detect_players_and_ball
+from court_line_detector import CourtLineDetector
+from mini_court import MiniCourt
+from main import FrameRenderer, compute_player_stats
+from benchmarks.startup import startup_results
+
+# Allowed slowdown against the baseline per stage (or group, e.g. 'startup'), DEFAULT_THRESHOLD for the rest.
+# Video IO and imports depend on disk and page cache and are noisier.
+DEFAULT_THRESHOLD = 0.20
+THRESHOLDS = {
+    'save_video': 0.35,
+    'read_video_frames': 0.35,
+    'startup': 0.35,
+}
+# Distinct frames drawn per resolution, longer videos repeat them
+SCENE_FRAMES = 60
+
+
+def court_points_in_meters():
+    # The 12 court keypoints in CourtLineDetector / MiniCourt order, (x across, y from the far baseline) in meters
+    width, length, kitchen = constants.COURT_WIDTH, constants.COURT_LENGTH, constants.KITCHEN_LENGTH
+    net = constants.HALF_COURT_LENGTH
+    return np.array([
+        [0, length], [0, 0], [width, 0], [width, length],                           # corners
+        [0, net + kitchen], [width, net + kitchen], [width, net - kitchen], [0, net - kitchen], # kitchen lines
+        [width / 2, net + kitchen], [width / 2, net - kitchen],                     # kitchen middles
+        [width / 2, 0], [width / 2, length],                                        # baseline middles
+    ], np.float32)
+
+
+def court_homography(width, height):
+    # Broadcast-style view from behind the near baseline: the far baseline is narrower and higher up
+    source = np.float32([[0, 0], [constants.COURT_WIDTH, 0], [constants.COURT_WIDTH, constants.COURT_LENGTH], [0, constants.COURT_LENGTH]])
+    target = np.float32([[0.36 * width, 0.28 * height], [0.64 * width, 0.28 * height],
+                         [0.82 * width, 0.92 * height], [0.18 * width, 0.92 * height]])
+    return cv2.getPerspectiveTransform(source, target)
+
+
+def to_image(points, homography):
+    return cv2.perspectiveTransform(np.asarray(points, np.float32).reshape(-1, 1, 2), homography).reshape(-1, 2)
+
+
+def pixels_per_meter(points, homography):
+    # Horizontal image scale at court points, used for player and ball heights
+    points = np.asarray(points, np.float32)
+    return np.linalg.norm(to_image(points + [1, 0], homography) - to_image(points, homography), axis=1)
+
+
+def synthetic_match(num_frames, width, height, seed = 0, ball_miss_rate = 0.15):
+    """
+    Ground truth for a synthetic rally.
+
+    Returns:
+    dict: court_keypoints (24,), player_dicts and ball_dicts (per-frame detection dicts, the ball is
+          missing on ball_miss_rate of the frames) and the court lines in image pixels.
+    """
+    rng = np.random.default_rng(seed)
+    homography = court_homography(width, height)
+    frames = np.arange(num_frames)
+
+    # Players move side to side and back and forth around their positions (meters)
+    player_positions = {
+        1: np.stack([constants.COURT_WIDTH * (0.5 + 0.3 * np.sin(frames / 40)), constants.COURT_LENGTH * (0.9 + 0.05 * np.sin(frames / 65))], axis=1),
+        2: np.stack([constants.COURT_WIDTH * (0.5 + 0.3 * np.sin(frames / 55 + 1)), constants.COURT_LENGTH * (0.1 + 0.05 * np.sin(frames / 50))], axis=1),
+    }
+    player_dicts = [{} for _ in frames]
+    for player_id, positions in player_positions.items():
+        feet = to_image(positions, homography)
+        heights = pixels_per_meter(positions, homography) * constants.PLAYER_1_HEIGHT_METERS
+        boxes = np.stack([feet[:, 0] - heights * 0.2, feet[:, 1] - heights, feet[:, 0] + heights * 0.2, feet[:, 1]], axis=1)
+        for frame_num in frames:
+            player_dicts[frame_num][player_id] = boxes[frame_num].tolist()
+
+    # Ball flies from one player to the other in arcs of 30-60 frames, up to 2.5m above the court
+    ball_ground = np.empty((num_frames, 2), np.float32)
+    ball_height = np.empty(num_frames, np.float32)
+    frame_num = 0
+    hitter, receiver = 1, 2
+    while frame_num < num_frames:
+        length = min(int(rng.integers(30, 61)), num_frames - frame_num)
+        t = np.linspace(0, 1, length, endpoint=False)[:, None]
+        shot = slice(frame_num, frame_num + length)
+        ball_ground[shot] = player_positions[hitter][frame_num] * (1 - t) + player_positions[receiver][min(frame_num + length, num_frames - 1)] * t
+        ball_height[shot] = 1 + 1.5 * np.sin(np.pi * t[:, 0])
+        frame_num += length
+        hitter, receiver = receiver, hitter
+    ball_centers = to_image(ball_ground, homography)
+    ball_centers[:, 1] -= ball_height * pixels_per_meter(ball_ground, homography)
+    ball_dicts = [{} if rng.random() < ball_miss_rate else {1: [x - 6, y - 6, x + 6, y + 6]}
+                  for x, y in ball_centers.tolist()]
+
+    # Lines as in MiniCourt.lines, plus the net
+    court_keypoints = to_image(court_points_in_meters(), homography)
+    net = to_image([[-0.3, constants.HALF_COURT_LENGTH], [constants.COURT_WIDTH + 0.3, constants.HALF_COURT_LENGTH]], homography)
+    lines = [(court_keypoints[a], court_keypoints[b]) for a, b in [(0, 1), (1, 2), (2, 3), (3, 0), (10, 11), (4, 5), (7, 6)]]
+    lines.append((net[0], net[1]))
+
+    return {'court_keypoints': court_keypoints.reshape(-1), 'player_dicts': player_dicts, 'ball_dicts': ball_dicts, 'lines': lines}
+
+
+def draw_scene(width, height, match, frame_num):
+    # One frame of the synthetic video: court surface, lines, players and the ball
+    frame = np.full((height, width, 3), (60, 110, 50), np.uint8)
+    corners = match['court_keypoints'].reshape(-1, 2)[[0, 1, 2, 3]].astype(np.int32)
+    cv2.fillPoly(frame, [corners], (140, 90, 40))
+    for start, end in match['lines']:
+        cv2.line(frame, tuple(int(v) for v in start), tuple(int(v) for v in end), (255, 255, 255), 2, cv2.LINE_AA)
+    for player_id, (x1, y1, x2, y2) in match['player_dicts'][frame_num].items():
+        cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (40, 40, 200) if player_id == 1 else (200, 60, 40), -1)
+    ball_dict = match['ball_dicts'][frame_num]
+    if 1 in ball_dict:
+        x1, y1, x2, y2 = ball_dict[1]
+        cv2.circle(frame, (int((x1 + x2) / 2), int((y1 + y2) / 2)), 6, (60, 230, 230), -1, cv2.LINE_AA)
+    return frame
+
+
+class StubPlayerTracker(PlayerTracker):
+    # Hands out the ground-truth player dicts in frame order instead of running YOLO and ByteTrack
+    def __init__(self, player_dicts):
+        self.tracker = None
+        self.detection_stride = 1
+        self.player_dicts = player_dicts
+        self.frame_num = 0
+
+    def detect_frame(self, frame):
+        player_dict = self.player_dicts[self.frame_num]
+        self.frame_num += 1
+        return player_dict
+
+    def detect_batch(self, frames):
+        return [self.detect_frame(frame) for frame in frames]
+
+
+class StubBallTracker(BallTracker):
+    # Hands out the ground-truth ball dicts in frame order
+    def __init__(self, ball_dicts):
+        self.ball_cls = 0
+        self.ball_dicts = ball_dicts
+        self.frame_num = 0
+
+    def detect_frame(self, frame, person_boxes = None):
+        ball_dict = self.ball_dicts[self.frame_num]
+        self.frame_num += 1
+        return ball_dict
+
+    def detect_batch(self, frames, person_boxes = None):
+        return [self.detect_frame(frame) for frame in frames]
+
+
+class StubCourtLineDetector(CourtLineDetector):
+    # Only the drawing side of CourtLineDetector, no keypoint model
+    def __init__(self):
+        self.keypoint_overlays = {}
+
+
+def time_best(fn, repeat):
+    # Best wall time of repeat runs and the result of the last one
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def time_per_frame(frames, num_frames, draw, repeat):
+    # Times draw(frame_num, frame) over num_frames copies of the scene frames, copying is timed separately
+    def copy_only():
+        for frame_num, frame in enumerate(islice(cycle(frames), num_frames)):
+            frame.copy()
+
+    def run():
+        for frame_num, frame in enumerate(islice(cycle(frames), num_frames)):
+            draw(frame_num, frame.copy())
+
+    copy_seconds, _ = time_best(copy_only, repeat)
+    seconds, _ = time_best(run, repeat)
+    return max(seconds - copy_seconds, 0.0)
+
+
+def run_suite(num_frames, width, height, repeat, output_dir):
+    # {stage: seconds} for one video length and resolution
+    match = synthetic_match(num_frames, width, height)
+    frames = [draw_scene(width, height, match, frame_num) for frame_num in range(min(num_frames, SCENE_FRAMES))]
+    frame_source = lambda: islice(cycle(frames), num_frames)
+    results = {}
+
+    # -- Video IO
+    video_path = os.path.join(output_dir, f"synthetic_{width}x{height}_{num_frames}.avi")
+    results['save_video'], _ = time_best(lambda: save_video(frame_source(), video_path, fps=30, background=False), repeat)
+    results['read_video_frames'], _ = time_best(lambda: sum(1 for _ in read_video_frames(video_path)), repeat)
+    os.remove(video_path)
+
+    # -- Detection loop with the stub detectors (batching, stride bookkeeping, Tracks building)
+    def detect():
+        return detect_players_and_ball(StubPlayerTracker(match['player_dicts']), StubBallTracker(match['ball_dicts']),
+                                       frame_source(), batch_size=8)
+    results['detection_loop'], (player_detections, ball_detections) = time_best(detect, repeat)
+
+    # -- Analysis
+    ball_tracker = StubBallTracker(match['ball_dicts'])
+    player_tracker = StubPlayerTracker(match['player_dicts'])
+    court_keypoints = match['court_keypoints']
+    results['interpolate_ball_positions'], ball_detections = time_best(lambda: ball_tracker.interpolate_ball_positions(ball_detections), repeat)
+    results['get_ball_shot_frames'], ball_shot_frames = time_best(lambda: ball_tracker.get_ball_shot_frames(ball_detections), repeat)
+    results['choose_and_filter_players'], player_detections = time_best(
+        lambda: player_tracker.choose_and_filter_players(court_keypoints, player_detections), repeat)
+
+    mini_court = MiniCourt(frames[0])
+    results['mini_court_projection_homography'], _ = time_best(
+        lambda: mini_court.convert_bounding_boxes_to_mini_court_coordinates(player_detections, ball_detections, court_keypoints,
+                                                                            projection='homography'), repeat)
+    results['mini_court_projection'], (player_mini_court_detections, ball_mini_court_detections) = time_best(
+        lambda: mini_court.convert_bounding_boxes_to_mini_court_coordinates(player_detections, ball_detections, court_keypoints), repeat)
+
+    results['player_stats'], player_stats_data_df = time_best(
+        lambda: compute_player_stats(ball_shot_frames, ball_mini_court_detections, player_mini_court_detections, mini_court, num_frames), repeat)
+    results['player_stats_lines'], player_stats_lines = time_best(lambda: get_player_stats_lines(player_stats_data_df), repeat)
+
+    # -- Drawing, per call over every frame
+    court_line_detector = StubCourtLineDetector()
+    draws = {
+        'draw_player_bbox': lambda frame_num, frame: player_tracker.draw_bbox(frame, player_detections[frame_num]),
+        'draw_ball_bbox': lambda frame_num, frame: ball_tracker.draw_bbox(frame, ball_detections[frame_num]),
+        'draw_court_keypoints': lambda frame_num, frame: court_line_detector.draw_keypoints_overlay(frame, court_keypoints),
+        'draw_mini_court': lambda frame_num, frame: mini_court.draw_mini_court_frame(frame),
+        'draw_mini_court_points': lambda frame_num, frame: mini_court.draw_points(frame, player_mini_court_detections[frame_num]),
+        'draw_player_stats': lambda frame_num, frame: draw_player_stats_lines(frame, player_stats_lines[frame_num]),
+    }
+    for name, draw in draws.items():
+        results[name] = time_per_frame(frames, num_frames, draw, repeat)
+
+    frame_renderer = FrameRenderer(player_tracker, ball_tracker, court_line_detector, mini_court,
+                                   player_detections, ball_detections, court_keypoints,
+                                   player_mini_court_detections, ball_mini_court_detections, player_stats_lines)
+    results['render_frame'] = time_per_frame(frames, num_frames, frame_renderer.render, repeat)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, min_delta_ms):
+    # Slowdowns beyond the stage threshold (and min_delta_ms, so sub-millisecond jitter never fails), as a list of keys
+    failures = []
+    for key, entry in results.items():
+        if key not in baseline:
+            continue
+        group, stage = key.split('/')[0], key.rsplit('/', 1)[1]
+        seconds, baseline_seconds = entry['seconds'], baseline[key]['seconds']
+        threshold = THRESHOLDS.get(stage, THRESHOLDS.get(group, DEFAULT_THRESHOLD))
+        entry['baseline_seconds'] = baseline_seconds
+        entry['change'] = round(seconds / baseline_seconds - 1, 4) if baseline_seconds else None
+        if seconds > baseline_seconds * (1 + threshold) and (seconds - baseline_seconds) * 1000 > min_delta_ms:
+            entry['regression'] = True
+            failures.append(key)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time every pipeline stage on synthetic video with stub detectors')
+    parser.add_argument('--lengths', type=int, nargs='+', default=[300, 1800], help='video lengths in frames')
+    parser.add_argument('--resolutions', nargs='+', default=['1280x720', '1920x1080'])
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage, the best one counts')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='results JSON of an earlier run to compare against')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='ignore slowdowns smaller than this')
+    args = parser.parse_args()
+
+    # Imports and detector construction, each in a fresh interpreter
+    results = {}
+    print("-- startup")
+    for name, (seconds, heavy) in startup_results(args.repeat).items():
+        results[f"startup/{name}"] = {'seconds': round(seconds, 6), 'heavy_modules': heavy}
+        print(f"{name:>34s}: {seconds * 1000:9.2f} ms, heavy modules imported: {', '.join(heavy) or 'none'}")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        for resolution in args.resolutions:
+            width, height = (int(v) for v in resolution.split('x'))
+            for num_frames in args.lengths:
+                print(f"-- {width}x{height}, {num_frames} frames")
+                for stage, seconds in run_suite(num_frames, width, height, args.repeat, output_dir).items():
+                    results[f"{width}x{height}/{num_frames}/{stage}"] = {
+                        'seconds': round(seconds, 6),
+                        'us_per_frame': round(seconds / num_frames * 1e6, 2),
+                    }
+                    print(f"{stage:>34s}: {seconds * 1000:9.2f} ms, {seconds / num_frames * 1e6:9.1f} us/frame")
+
+    failures = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = compare(results, baseline['results'], args.min_delta_ms)
+        print(f"\nAgainst {args.baseline} (commit {baseline.get('git_commit')}):")
+        for key, entry in results.items():
+            if entry.get('change') is not None:
+                flag = 'SLOWER' if entry.get('regression') else ''
+                print(f"{key:>58s}: {entry['baseline_seconds'] * 1000:9.2f} -> {entry['seconds'] * 1000:9.2f} ms ({entry['change']:+7.1%}) {flag}")
+
+    if args.save:
+        if os.path.dirname(args.save):
+            os.makedirs(os.path.dirname(args.save), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump({
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'git_commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'opencv': cv2.__version__,
+                'repeat': args.repeat,
+                'results': results,
+            }, f, indent=2)
+        print(f"Results written to {args.save}")
+
+    if failures:
+        print(f"{len(failures)} stages slower than the baseline: {', '.join(failures)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,51 @@
-import torch
-import torchvision.transforms as transforms
-import torchvision.models as models
 import cv2
+import os
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import OverlaySprite, get_profiler
+
+# ImageNet normalization used by the keypoint model
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], np.float32)
 
 class CourtLineDetector:
-    def __init__(self, model_path):
-        self.model = models.resnet50(pretrained=False)
-        self.model.fc = torch.nn.Linear(self.model.fc.in_features, 12 * 2)
-        self.model.load_state_dict(torch.load(model_path, map_location=torch.device('cpu')))
+    def __init__(self, model_path, backend = 'pytorch', quantize = False, channels_last = False, fast_preprocess = False):
+        # backend: 'pytorch' (eager), 'torchscript' (traced + frozen) or 'onnx' (onnxruntime, exported next to model_path)
+        # quantize: dynamic int8 weights, channels_last: NHWC memory layout for the convolutions,
+        # fast_preprocess: OpenCV/NumPy resize and normalize instead of the PIL transform
+        # torch is imported and the weights are loaded on the first prediction (see load_model), drawing never needs them
+        if backend not in ('pytorch', 'torchscript', 'onnx'):
+            raise ValueError(f"Unknown keypoint model backend: {backend}")
+        self.model_path = model_path
+        self.backend = backend
+        self.quantize = quantize
+        self.channels_last = channels_last
+        self.fast_preprocess = fast_preprocess
+        self.keypoint_overlays = {} # pre-rendered keypoint sprites, see draw_keypoints_overlay
+        self._model = None
+        self.transform = None
+        self.onnx_session = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            self.load_model()
+        return self._model
+
+    def __getstate__(self):
+        # Render workers only draw keypoints, the model and its backend session are not pickled
+        state = self.__dict__.copy()
+        state['_model'] = None
+        state['transform'] = None
+        state['onnx_session'] = None
+        return state
+
+    def load_model(self):
+        import torch
+        import torchvision.transforms as transforms
 
+        self._model = self.create_resnet(self.model_path)
         self.transform = transforms.Compose([
             transforms.ToPILImage(),
             transforms.Resize((224, 224)), # Resized here so should be proper below
@@ -16,22 +53,173 @@ class CourtLineDetector:
             transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
         ])
 
-    def predict(self, image):
-        # Predict the first frame only
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        image_tensor = self.transform(image_rgb).unsqueeze(0)
+        if self.backend == 'onnx':
+            self.onnx_session = self.create_onnx_session(os.path.splitext(self.model_path)[0] + '.onnx')
+            return
+
+        if self.quantize:
+            # Only Linear layers support dynamic quantization, so this shrinks/speeds up the fc head
+            self._model = torch.ao.quantization.quantize_dynamic(self._model, {torch.nn.Linear}, dtype=torch.qint8)
+        if self.channels_last:
+            self._model = self._model.to(memory_format=torch.channels_last)
+        if self.backend == 'torchscript':
+            self._model = self.trace_model(self._model)
+
+    def create_resnet(self, model_path):
+        import torch
+        import torchvision.models as models
+
+        try:
+            # Memory-mapped: tensors are paged in from the file instead of reading it into a buffer first,
+            # and assign=True makes them the parameters directly, so the random init on the meta device is skipped
+            state_dict = torch.load(model_path, map_location=torch.device('cpu'), mmap=True)
+            with torch.device('meta'):
+                model = models.resnet50(pretrained=False)
+                model.fc = torch.nn.Linear(model.fc.in_features, 12 * 2)
+            model.load_state_dict(state_dict, assign=True)
+        except (TypeError, RuntimeError):
+            # torch < 2.1 (no mmap / assign) or an old, non-zipfile checkpoint
+            model = models.resnet50(pretrained=False)
+            model.fc = torch.nn.Linear(model.fc.in_features, 12 * 2)
+            model.load_state_dict(torch.load(model_path, map_location=torch.device('cpu')))
+        model.eval()
+        return model
+
+    def trace_model(self, model):
+        import torch
+        example = torch.zeros(1, 3, 224, 224)
+        if self.channels_last:
+            example = example.contiguous(memory_format=torch.channels_last)
+        with torch.no_grad():
+            traced = torch.jit.trace(model, example)
+            traced = torch.jit.freeze(traced)
+            return torch.jit.optimize_for_inference(traced)
+
+    def export_torchscript(self, output_path):
+        import torch
+        torch.jit.save(self.trace_model(self.model), output_path)
+        return output_path
+
+    def export_onnx(self, output_path):
+        # fp32 export with a dynamic batch dimension
+        import torch
+        torch.onnx.export(self.model, torch.zeros(1, 3, 224, 224), output_path,
+                          input_names=['images'], output_names=['keypoints'],
+                          dynamic_axes={'images': {0: 'batch'}, 'keypoints': {0: 'batch'}},
+                          opset_version=17)
+        return output_path
+
+    def create_onnx_session(self, onnx_path):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("backend='onnx' needs onnxruntime (pip install onnxruntime)") from e
+
+        if not os.path.exists(onnx_path):
+            self.export_onnx(onnx_path)
+        if self.quantize:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantized_path = os.path.splitext(onnx_path)[0] + '_int8.onnx'
+            if not os.path.exists(quantized_path):
+                quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8)
+            onnx_path = quantized_path
 
+        return onnxruntime.InferenceSession(onnx_path, providers=['CPUExecutionProvider'])
+
+    def preprocess(self, images):
+        # Batch of model inputs for a list of BGR frames
+        import torch
+        if not self.fast_preprocess:
+            if self.transform is None:
+                self.load_model()
+            return torch.stack([self.transform(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)) for image in images])
+
+        # Resize, BGR -> RGB and normalize with OpenCV/NumPy into an NHWC buffer. Permuting it to NCHW
+        # gives a channels-last tensor without a copy.
+        batch = np.empty((len(images), 224, 224, 3), np.float32)
+        for i, image in enumerate(images):
+            batch[i] = cv2.resize(image, (224, 224), interpolation=cv2.INTER_AREA)[:, :, ::-1]
+        batch *= 1.0 / 255.0
+        batch -= IMAGENET_MEAN
+        batch /= IMAGENET_STD
+        return torch.from_numpy(batch).permute(0, 3, 1, 2)
+
+    def run_model(self, image_tensors):
+        import torch
+        model = self.model
+        if self.backend == 'onnx':
+            inputs = np.ascontiguousarray(image_tensors.numpy(), np.float32)
+            return self.onnx_session.run(None, {self.onnx_session.get_inputs()[0].name: inputs})[0]
+
+        if self.channels_last:
+            image_tensors = image_tensors.contiguous(memory_format=torch.channels_last)
+        else:
+            image_tensors = image_tensors.contiguous()
         with torch.no_grad():
-            outputs = self.model(image_tensor)
+            outputs = model(image_tensors)
+        return outputs.cpu().numpy()
 
-        keypoints = outputs.squeeze().cpu().numpy()
-        original_h, original_w = image.shape[:2]
+    def predict(self, image):
+        # Predict the first frame only
+        return self.predict_batch([image])[0]
 
-        # Rescale keypoints to original image size
-        keypoints[::2] *= original_w/224.0
-        keypoints[1::2] *= original_h/224.0
+    def predict_batch(self, images):
+        # One forward pass for a list of images, returns (n, 24) keypoints in original image pixels
+        with get_profiler().timer('court_keypoints', frames=len(images)):
+            keypoints = self.run_model(self.preprocess(images)).reshape(len(images), -1)
+        for i, image in enumerate(images):
+            original_h, original_w = image.shape[:2]
+
+            # Rescale keypoints to original image size
+            keypoints[i, ::2] *= original_w/224.0
+            keypoints[i, 1::2] *= original_h/224.0
 
         return keypoints
+
+    def get_motion_thumbnail(self, frame):
+        # Small blurred grayscale copy of the frame, cheap to compare for camera motion
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        thumbnail = cv2.resize(gray, (64, 36), interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(thumbnail, (3, 3), 0)
+
+    def has_camera_moved(self, reference_thumbnail, thumbnail, pixel_threshold = 20, changed_fraction = 0.25):
+        # Players only cover a small part of the frame, a pan or zoom changes most of it
+        changed = cv2.absdiff(reference_thumbnail, thumbnail) > pixel_threshold
+        return changed.mean() > changed_fraction
+
+    def predict_frames(self, frames, batch_size = 8, pixel_threshold = 20, changed_fraction = 0.25):
+        # Per-frame keypoints (num_frames, 24). The model only runs on frames where the view changed
+        # compared to the last frame it ran on, other frames carry those keypoints forward.
+        keyframe_indices = []
+        keyframe_keypoints = []
+        pending_frames = []
+        reference_thumbnail = None
+        num_frames = 0
+
+        for frame_num, frame in enumerate(frames):
+            num_frames = frame_num + 1
+            thumbnail = self.get_motion_thumbnail(frame)
+            if reference_thumbnail is not None and not self.has_camera_moved(reference_thumbnail, thumbnail,
+                                                                             pixel_threshold, changed_fraction):
+                continue
+
+            reference_thumbnail = thumbnail
+            keyframe_indices.append(frame_num)
+            pending_frames.append(frame)
+            if len(pending_frames) == batch_size:
+                keyframe_keypoints.append(self.predict_batch(pending_frames))
+                pending_frames = []
+
+        if pending_frames:
+            keyframe_keypoints.append(self.predict_batch(pending_frames))
+        if not keyframe_indices:
+            return np.empty((0, 24), np.float32)
+
+        keyframe_keypoints = np.concatenate(keyframe_keypoints)
+        # Index of the last keyframe at or before every frame
+        keyframe_of_frame = np.searchsorted(keyframe_indices, np.arange(num_frames), side='right') - 1
+        print(f"Court keypoints predicted on {len(keyframe_indices)} of {num_frames} frames")
+        return keyframe_keypoints[keyframe_of_frame]
     
     def draw_keypoints(self, image, keypoints):
         SCALE_X = 1.06   # widen
@@ -46,9 +234,24 @@ class CourtLineDetector:
             cv2.circle(image, (x, y), 5, (0, 0, 255), -1)
         return image
     
+    def draw_keypoints_overlay(self, frame, keypoints):
+        # Same output as draw_keypoints, but the circles and labels are rendered once per keypoint set
+        # and only their bounding box is blended into each frame
+        key = (frame.shape, np.asarray(keypoints).astype(int).tobytes())
+        overlay = self.keypoint_overlays.get(key)
+        if overlay is None:
+            if len(self.keypoint_overlays) >= 32:
+                self.keypoint_overlays.clear()
+            overlay = OverlaySprite.render(frame.shape, lambda canvas: self.draw_keypoints(canvas, keypoints))
+            self.keypoint_overlays[key] = overlay
+        return overlay.composite(frame)
+
     def draw_keypoints_on_video(self, video_frames, keypoints):
+        # keypoints is a single (24,) set for the whole video or per-frame (num_frames, 24) from predict_frames
+        keypoints = np.asarray(keypoints)
         output_video_frames = []
-        for frame in video_frames:
-            frame = self.draw_keypoints(frame, keypoints)
+        for frame_num, frame in enumerate(video_frames):
+            frame_keypoints = keypoints[frame_num] if keypoints.ndim == 2 else keypoints
+            frame = self.draw_keypoints_overlay(frame, frame_keypoints)
             output_video_frames.append(frame)
         return output_video_frames
\ No newline at end of file
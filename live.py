@@ -0,0 +1,413 @@
+# Live analysis of a camera or stream: players, ball, mini court and shot stats are drawn on every frame as it arrives
+#   python live.py --source 0 --show                                  camera 0
+#   python live.py --source rtsp://camera.local/stream --output output_videos/live.mp4
+#   python live.py --source input_videos/input_video2p.mp4 --show     a file, replayed at its native fps
+# Every frame has a latency budget (--latency-budget, ms from capture to the annotated frame). When the detectors
+# are slower than the source, two things keep the output within it:
+# - the capture thread only keeps the newest frame, frames not picked up in time are dropped (never shown)
+# - detection is skipped on a frame when its age plus the expected detection and drawing time would exceed the
+#   budget, the frame is drawn with the last player boxes and the ball counts as missed
+# End-to-end latency percentiles and the drop / skip rates are printed at the end (--report to save them as JSON).
+import argparse
+import json
+import os
+import shutil
+import time
+import numpy as np
+import cv2
+import constants
+from utils import (LiveSource,
+                   BackgroundEncoder,
+                   create_encoder,
+                   measure_distance,
+                   draw_player_stats_lines,
+                   convert_pixel_distance_to_meters,
+                   Profiler,
+                   get_profiler,
+                   set_profiler)
+from utils.player_stats_drawer_utils import format_player_stats, PLAYER_STATS
+from trackers import PlayerTracker, BallTracker, OnlineBallInterpolator, OnlineShotDetector
+from court_line_detector import CourtLineDetector
+from mini_court import MiniCourt
+
+
+class LivePlayerStats:
+    # Running version of compute_player_stats for players 1 and 2, updated on every confirmed shot from the
+    # mini court positions at that shot and the previous one. The time between shots comes from the capture
+    # timestamps, so dropped frames don't change the speeds.
+    def __init__(self, mini_court):
+        self.mini_court = mini_court
+        self.stats = {f'player_{player_id}_{name}': 0 for player_id in (1, 2)
+                      for name in ('number_of_shots', 'total_shot_speed', 'last_shot_speed', 'total_player_speed', 'last_player_speed')}
+        self.previous_shot = None # (capture_time, player positions, ball position) of the last shot
+        self.lines = self.format_lines()
+
+    def add_shot(self, capture_time, player_positions, ball_position):
+        # Returns True when the panel text changed
+        previous_shot = self.previous_shot
+        self.previous_shot = (capture_time, player_positions, ball_position)
+        if previous_shot is None:
+            return False
+        start_time, start_player_positions, start_ball_position = previous_shot
+        seconds = capture_time - start_time
+        if seconds <= 0 or start_ball_position is None or ball_position is None:
+            return False
+        if not all(player_id in start_player_positions and player_id in player_positions for player_id in (1, 2)):
+            return False
+
+        # Speed of the ball shot in km/h
+        speed_of_ball_shot = self.to_meters(measure_distance(start_ball_position, ball_position)) / seconds * 3.6
+
+        # Player with the ball and the opponent's speed until the next shot
+        player_shot_ball = min((1, 2), key=lambda player_id: measure_distance(start_player_positions[player_id], start_ball_position))
+        opponent_player_id = 1 if player_shot_ball == 2 else 2
+        speed_of_opponent = self.to_meters(measure_distance(start_player_positions[opponent_player_id],
+                                                            player_positions[opponent_player_id])) / seconds * 3.6
+
+        self.stats[f'player_{player_shot_ball}_number_of_shots'] += 1
+        self.stats[f'player_{player_shot_ball}_total_shot_speed'] += speed_of_ball_shot
+        self.stats[f'player_{player_shot_ball}_last_shot_speed'] = speed_of_ball_shot
+        self.stats[f'player_{player_shot_ball}_total_player_speed'] += speed_of_opponent
+        self.stats[f'player_{player_shot_ball}_last_player_speed'] = speed_of_opponent
+        self.lines = self.format_lines()
+        return True
+
+    def to_meters(self, mini_court_pixels):
+        return convert_pixel_distance_to_meters(mini_court_pixels, constants.COURT_WIDTH, self.mini_court.get_width_of_mini_court())
+
+    def format_lines(self):
+        # Same columns as compute_player_stats, including its averages (player speed over the opponent's shots)
+        def ratio(total, count):
+            return total / count if count else float('nan')
+        values = dict(self.stats)
+        for player_id, opponent_id in ((1, 2), (2, 1)):
+            values[f'player_{player_id}_average_shot_speed'] = ratio(values[f'player_{player_id}_total_shot_speed'],
+                                                                     values[f'player_{player_id}_number_of_shots'])
+            values[f'player_{player_id}_average_player_speed'] = ratio(values[f'player_{player_id}_total_player_speed'],
+                                                                       values[f'player_{opponent_id}_number_of_shots'])
+        return format_player_stats([1, 2], [[values[f'player_{player_id}_{suffix}'] for player_id in (1, 2)]
+                                            for _, suffix in PLAYER_STATS])
+
+
+class LiveAnalyzer:
+    # Incremental version of process_video: one frame in, one annotated frame out, state only for the last few frames.
+    # Court keypoints come from the first frame (and again whenever the camera moves, with track_court_keypoints).
+    # Positions go to the mini court through the court homography, the keypoint projection needs player
+    # heights from frames that have not arrived yet. The two players closest to the court keypoints in the
+    # first frame with two players become players 1 and 2.
+    # Shots are confirmed OnlineShotDetector.latency processed frames after the hit (0.7s at 30 fps).
+    def __init__(self, player_tracker, ball_tracker, court_line_detector, player_detection_stride = 1,
+                 ball_search_window_size = None, max_misses = 5, ball_max_gap = 15, track_court_keypoints = False):
+        self.player_tracker = player_tracker
+        self.ball_tracker = ball_tracker
+        self.court_line_detector = court_line_detector
+        self.player_detection_stride = player_detection_stride
+        self.ball_search_window_size = ball_search_window_size
+        self.max_misses = max_misses
+        self.ball_max_gap = ball_max_gap
+        self.track_court_keypoints = track_court_keypoints
+
+        self.detection_seconds = 0.0 # running estimates, used to decide whether detection fits in the budget
+        self.render_seconds = 0.0
+        self.shots = 0
+
+    def start(self, frame):
+        # Court keypoints and mini court from the first frame, and warm-up detections: the first inference
+        # of each model loads the weights and sets up the predictor, which should not land on a live frame
+        self.court_keypoints = self.court_line_detector.predict(frame)
+        self.mini_court = MiniCourt(frame)
+        self.homography = self.mini_court.fit_homography(self.court_keypoints)
+        self.reference_thumbnail = self.court_line_detector.get_motion_thumbnail(frame)
+
+        for _ in range(2):
+            start = time.perf_counter()
+            self.detect(frame)
+            # The second run shows the steady-state cost
+            self.detection_seconds = time.perf_counter() - start
+        self.player_tracker.reset()
+        self.ball_tracker.reset()
+        self.player_tracker.detection_stride = self.player_detection_stride
+
+        self.player_numbers = None # track_id -> player number, once chosen
+        self.player_dict = {}
+        self.interpolator = OnlineBallInterpolator(max_gap=self.ball_max_gap)
+        self.shot_detector = OnlineShotDetector()
+        self.stats = LivePlayerStats(self.mini_court)
+        self.history = {} # step -> {'time', 'players', 'ball'} until the shot detector is done with the step
+        self.step = 0 # frames processed
+
+        # The court, mini court and stats overlays are rendered once and cached, do that here too
+        start = time.perf_counter()
+        self.draw(0, frame.copy(), {}, {}, {})
+        self.render_seconds = time.perf_counter() - start
+
+    def detect(self, frame):
+        # Single-frame batch: ByteTrack runs on our side, so reset() can start it over
+        player_dict = self.player_tracker.detect_batch([frame])[0]
+        person_boxes = list(player_dict.values())
+        if self.ball_search_window_size is not None:
+            ball_dict = self.ball_tracker.track_frame(frame, self.ball_search_window_size, self.max_misses, person_boxes)
+        else:
+            ball_dict = self.ball_tracker.detect_frame(frame, person_boxes)
+        return player_dict, ball_dict
+
+    def update_court(self, frame):
+        # Re-predicts the keypoints when most of the view changed (pan / zoom), like predict_frames
+        thumbnail = self.court_line_detector.get_motion_thumbnail(frame)
+        if self.court_line_detector.has_camera_moved(self.reference_thumbnail, thumbnail):
+            self.reference_thumbnail = thumbnail
+            self.court_keypoints = self.court_line_detector.predict(frame)
+            self.homography = self.mini_court.fit_homography(self.court_keypoints)
+
+    def choose_players(self, player_dict):
+        if self.player_numbers is None:
+            if len(player_dict) < 2:
+                return player_dict
+            chosen_players = self.player_tracker.choose_players(self.court_keypoints, player_dict)
+            self.player_numbers = {track_id: number for number, track_id in enumerate(sorted(chosen_players), start=1)}
+        return {self.player_numbers[track_id]: bbox for track_id, bbox in player_dict.items() if track_id in self.player_numbers}
+
+    def project(self, points):
+        # {id: (x, y)} image points -> {id: (x, y)} mini court points
+        if not points:
+            return {}
+        projected = self.mini_court.project_points_with_homography(list(points.values()), self.homography)
+        return {key: tuple(point) for key, point in zip(points, projected)}
+
+    def process(self, frame_num, frame, capture_time, detect = True):
+        # Annotated frame. Without detect the last player boxes are kept and the ball counts as missed.
+        profiler = get_profiler()
+        step = self.step
+        self.step += 1
+
+        if detect:
+            start = time.perf_counter()
+            with profiler.timer('live_detection'):
+                if self.track_court_keypoints:
+                    self.update_court(frame)
+                player_dict, ball_dict = self.detect(frame)
+                self.player_dict = self.choose_players(player_dict)
+            self.detection_seconds = 0.8 * self.detection_seconds + 0.2 * (time.perf_counter() - start)
+        else:
+            ball_dict = {}
+            if self.ball_search_window_size is not None:
+                # The search window keeps moving with the ball's velocity over skipped frames
+                self.ball_tracker.update_motion(ball_dict)
+
+        # -- Mini court positions and shots
+        player_positions = self.project({player_id: ((bbox[0] + bbox[2]) / 2, bbox[3]) for player_id, bbox in self.player_dict.items()})
+        ball_positions = self.project({1: ((ball_dict[1][0] + ball_dict[1][2]) / 2, (ball_dict[1][1] + ball_dict[1][3]) / 2)} if 1 in ball_dict else {})
+        self.history[step] = {'time': capture_time, 'players': player_positions, 'ball': None}
+        for ball_step, interpolated_ball_dict in self.interpolator.update(ball_dict):
+            self.update_shots(ball_step, interpolated_ball_dict)
+
+        # -- Draw
+        start = time.perf_counter()
+        with profiler.timer('live_render'):
+            frame = self.draw(frame_num, frame, ball_dict, player_positions, ball_positions, detect)
+        self.render_seconds = 0.8 * self.render_seconds + 0.2 * (time.perf_counter() - start)
+        return frame
+
+    def draw(self, frame_num, frame, ball_dict, player_positions, ball_positions, detected = True):
+        frame = self.player_tracker.draw_bbox(frame, self.player_dict)
+        frame = self.ball_tracker.draw_bbox(frame, ball_dict)
+        frame = self.court_line_detector.draw_keypoints_overlay(frame, self.court_keypoints)
+        frame = self.mini_court.draw_mini_court_frame(frame)
+        frame = self.mini_court.draw_points(frame, player_positions)
+        frame = self.mini_court.draw_points(frame, ball_positions, color = (0, 255, 255))
+        frame = draw_player_stats_lines(frame, self.stats.lines)
+        cv2.putText(frame, f"Frame: {frame_num}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        if not detected:
+            cv2.putText(frame, "detection skipped", (10, 65), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 165, 255), 2)
+        return frame
+
+    def update_shots(self, step, ball_dict):
+        # Called with the interpolated ball of every processed frame, in order
+        entry = self.history.get(step)
+        if entry is not None and 1 in ball_dict:
+            box = ball_dict[1]
+            entry['ball'] = self.project({1: ((box[0] + box[2]) / 2, (box[1] + box[3]) / 2)})[1]
+        for hit_step in self.shot_detector.update(ball_dict):
+            hit = self.history.get(hit_step)
+            if hit is not None:
+                self.shots += 1
+                self.stats.add_shot(hit['time'], hit['players'], hit['ball'])
+        # Steps the shot detector can no longer return
+        for old_step in [s for s in self.history if s < step - self.shot_detector.latency]:
+            del self.history[old_step]
+
+
+class LiveRunner:
+    # Pulls the newest frame from a LiveSource, decides whether detection fits in the latency budget and
+    # yields annotated frames. report() has the end-to-end latency (capture to annotated frame) and drop rates.
+    def __init__(self, source, analyzer, latency_budget_ms = 150, max_skipped_detections = 15):
+        self.source = source
+        self.analyzer = analyzer
+        self.latency_budget = latency_budget_ms / 1000
+        # Detection still runs after this many skips in a row, so the overlays never freeze for good
+        self.max_skipped_detections = max_skipped_detections
+        self.latencies = []
+        self.detections = 0
+        self.skipped_detections = 0
+        self.captured_at_start = 0
+        self.dropped_at_start = 0
+        self.start_time = None
+        self.end_time = None
+
+    def run(self, max_frames = None):
+        # Generator of (frame_num, annotated frame, latency in seconds)
+        self.source.start()
+        try:
+            item = self.source.read()
+            if item is None:
+                return
+            self.analyzer.start(item[1])
+            # Frames captured while the models warmed up don't count, the one waiting to be read does
+            self.captured_at_start = self.source.frames_read + self.source.frames_dropped
+            self.dropped_at_start = self.source.frames_dropped
+            self.start_time = time.perf_counter()
+
+            skipped_in_a_row = 0
+            steps = 0
+            while max_frames is None or steps < max_frames:
+                item = self.source.read()
+                if item is None:
+                    break
+                frame_num, frame, capture_time = item
+
+                due = steps % self.analyzer.player_detection_stride == 0
+                age = time.perf_counter() - capture_time
+                fits = age + self.analyzer.detection_seconds + self.analyzer.render_seconds <= self.latency_budget
+                detect = due and (fits or skipped_in_a_row >= self.max_skipped_detections)
+                if detect:
+                    self.detections += 1
+                    skipped_in_a_row = 0
+                elif due:
+                    self.skipped_detections += 1
+                    skipped_in_a_row += 1
+
+                frame = self.analyzer.process(frame_num, frame, capture_time, detect)
+                latency = time.perf_counter() - capture_time
+                self.latencies.append(latency)
+                steps += 1
+                yield frame_num, frame, latency
+        finally:
+            self.end_time = time.perf_counter()
+            self.source.stop()
+
+    def report(self):
+        captured = self.source.frames_captured - self.captured_at_start
+        dropped = self.source.frames_dropped - self.dropped_at_start
+        wall = (self.end_time or time.perf_counter()) - self.start_time if self.start_time is not None else 0
+        report = {
+            'latency_budget_ms': round(self.latency_budget * 1000, 1),
+            'source_fps': round(self.source.fps, 2),
+            'frames_captured': captured,
+            'frames_processed': len(self.latencies),
+            'frames_dropped': dropped,
+            'drop_rate': round(dropped / captured, 4) if captured else None,
+            'detections': self.detections,
+            'detections_skipped': self.skipped_detections,
+            'detection_skip_rate': round(self.skipped_detections / (self.detections + self.skipped_detections), 4)
+                                   if self.detections + self.skipped_detections else None,
+            'output_fps': round(len(self.latencies) / wall, 2) if wall > 0 else None,
+            'shots': self.analyzer.shots,
+        }
+        if self.latencies:
+            ms = np.array(self.latencies) * 1000
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            report['latency_ms'] = {'mean': round(ms.mean(), 2), 'p50': round(p50, 2), 'p95': round(p95, 2),
+                                    'p99': round(p99, 2), 'max': round(ms.max(), 2)}
+            report['over_budget_rate'] = round(float((ms > self.latency_budget * 1000).mean()), 4)
+        return report
+
+    def print_report(self):
+        report = self.report()
+        if not report['frames_captured']:
+            print("No frames captured")
+            return
+        print(f"{report['frames_processed']} of {report['frames_captured']} frames processed at {report['output_fps']} fps "
+              f"(source {report['source_fps']} fps), {report['frames_dropped']} dropped ({report['drop_rate']:.1%})")
+        print(f"detection ran on {report['detections']} frames, skipped on {report['detections_skipped']}")
+        if 'latency_ms' in report:
+            latency = report['latency_ms']
+            print(f"end-to-end latency p50 {latency['p50']:.1f}ms, p95 {latency['p95']:.1f}ms, p99 {latency['p99']:.1f}ms, "
+                  f"max {latency['max']:.1f}ms, {report['over_budget_rate']:.1%} over the {report['latency_budget_ms']:.0f}ms budget")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyze a live camera or stream (or replay a file) with a latency budget')
+    parser.add_argument('--source', default='input_videos/input_video2p.mp4', help='camera index, stream URL or video file')
+    parser.add_argument('--player-model', default='yolov8x.pt')
+    parser.add_argument('--ball-model', default='models/yolov8n_last.pt')
+    parser.add_argument('--court-model', default='models/keypoint_model2.pth')
+    parser.add_argument('--latency-budget', type=float, default=150, help='ms from capture to the annotated frame')
+    parser.add_argument('--max-skipped-detections', type=int, default=15, help='run detection after this many skipped frames, even over budget')
+    parser.add_argument('--player-stride', type=int, default=1, help='detect every k frames, the boxes are held in between')
+    parser.add_argument('--ball-window', type=int, help='e.g. 512 to search the ball around its predicted position')
+    parser.add_argument('--track-court-keypoints', action='store_true', help='re-predict court keypoints when the camera moves')
+    parser.add_argument('--no-realtime', action='store_true', help='read a file as fast as possible instead of at its fps')
+    parser.add_argument('--show', action='store_true', help='show the annotated frames in a window (q to quit)')
+    parser.add_argument('--output', help='also write the annotated stream to this video')
+    parser.add_argument('--max-frames', type=int, help='stop after this many processed frames')
+    parser.add_argument('--report', metavar='PATH', help='write the latency / drop report as JSON')
+    parser.add_argument('--profile', nargs='?', const='output_videos/live_profile.json', metavar='PATH',
+                        help='write detection / draw timings to PATH and a Chrome trace next to it')
+    args = parser.parse_args()
+
+    profiler = set_profiler(Profiler(enabled=args.profile is not None))
+    source = LiveSource(args.source, realtime=False if args.no_realtime else None)
+    analyzer = LiveAnalyzer(PlayerTracker(model_path=args.player_model),
+                            BallTracker(model_path=args.ball_model),
+                            CourtLineDetector(args.court_model),
+                            player_detection_stride=args.player_stride,
+                            ball_search_window_size=args.ball_window,
+                            track_court_keypoints=args.track_court_keypoints)
+    runner = LiveRunner(source, analyzer, args.latency_budget, args.max_skipped_detections)
+
+    out = None
+    last_frame_num = None
+    try:
+        for frame_num, frame, _ in runner.run(args.max_frames):
+            if args.output:
+                if out is None:
+                    if os.path.dirname(args.output):
+                        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+                    if shutil.which('ffmpeg') is not None:
+                        encoder = create_encoder(args.output, source.fps, (frame.shape[1], frame.shape[0]), 'ffmpeg',
+                                                 codec='libx264', preset='veryfast', crf=23)
+                    else:
+                        encoder = create_encoder(args.output, source.fps, (frame.shape[1], frame.shape[0]))
+                    out = BackgroundEncoder(encoder)
+                # Dropped frames are filled with the last annotated frame, so the video keeps the source's timing
+                repeats = 1 if last_frame_num is None else frame_num - last_frame_num
+                for _ in range(repeats):
+                    out.write(frame)
+                last_frame_num = frame_num
+            if args.show:
+                cv2.imshow('live', frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if out is not None:
+            out.close()
+        if args.show:
+            cv2.destroyAllWindows()
+
+    runner.print_report()
+    if args.report:
+        if os.path.dirname(args.report):
+            os.makedirs(os.path.dirname(args.report), exist_ok=True)
+        with open(args.report, 'w') as f:
+            json.dump(runner.report(), f, indent=2)
+        print(f"Report written to {args.report}")
+    if profiler.enabled:
+        profiler.print_report()
+        summary_path, trace_path = profiler.save(args.profile)
+        print(f"Profile written to {summary_path} and {trace_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,81 @@
 # Import necessary modules
-from utils import (read_video, 
+from utils import (read_video_frames,
+                   read_first_frame,
                    save_video,
+                   get_video_fps,
+                   get_frame_count,
                    measure_distance,
-                   draw_player_stats,
+                   get_player_stats_lines,
+                   draw_player_stats_lines,
+                   FramePipeline,
+                   ParallelRenderer,
+                   Profiler,
+                   get_profiler,
+                   set_profiler,
                    convert_meters_to_pixel_distance,
                    convert_pixel_distance_to_meters)
 import constants
-from trackers import PlayerTracker, BallTracker
+from trackers import PlayerTracker, BallTracker, detect_players_and_ball, detect_players_and_ball_segmented
 from court_line_detector import CourtLineDetector
 from mini_court import MiniCourt
+import argparse
 import cv2
-import pandas as pd
+import os
+import shutil
 from copy import deepcopy
 
-def main():
-    # Read Video
-    input_video_path = 'input_videos/input_video2p.mp4' # rename - 2p/4p based on players
-    video_frames = read_video(input_video_path)
-
+class FrameRenderer:
+    # Draws every overlay onto a single frame so output frames can be rendered and written one at a time
+    def __init__(self, player_tracker, ball_tracker, court_line_detector, mini_court,
+                 player_detections, ball_detections, court_keypoints,
+                 player_mini_court_detections, ball_mini_court_detections, player_stats_lines):
+        self.player_tracker = player_tracker
+        self.ball_tracker = ball_tracker
+        self.court_line_detector = court_line_detector
+        self.mini_court = mini_court
+        self.player_detections = player_detections
+        self.ball_detections = ball_detections
+        self.court_keypoints = court_keypoints
+        self.player_mini_court_detections = player_mini_court_detections
+        self.ball_mini_court_detections = ball_mini_court_detections
+        self.player_stats_lines = player_stats_lines # panel text per frame, see get_player_stats_lines
 
-    # Detect Players and Ball
-    player_tracker = PlayerTracker(model_path='yolov8x.pt')
-    ball_tracker = BallTracker(model_path='models/yolov8n_last.pt')
-    player_detections = player_tracker.detect_frames(video_frames,
-                                                     read_from_stub=True, # Run False for first time or to re-generate stubs
-                                                     stub_path='tracker_stubs/player_detections2p.pkl' # 2p/4p based on players
-                                                     )
-    ball_detections = ball_tracker.detect_frames(video_frames,
-                                                     read_from_stub=True, # Run False for first time or to re-generate stubs
-                                                     stub_path='tracker_stubs/ball_detections2p.pkl' # 2p/4p based on players
-                                                     )
-    ball_detections = ball_tracker.interpolate_ball_positions(ball_detections)
+    def render(self, frame_num, frame):
+        profiler = get_profiler()
+        # -- Draw Player and Ball Bounding Boxes
+        with profiler.timer('draw_bboxes'):
+            if frame_num < len(self.player_detections):
+                frame = self.player_tracker.draw_bbox(frame, self.player_detections[frame_num])
+            if frame_num < len(self.ball_detections):
+                frame = self.ball_tracker.draw_bbox(frame, self.ball_detections[frame_num])
 
+        # -- Draw Court Keypoints (one set for the video or one per frame)
+        with profiler.timer('draw_court_keypoints'):
+            frame_court_keypoints = self.court_keypoints[min(frame_num, len(self.court_keypoints) - 1)] if self.court_keypoints.ndim == 2 else self.court_keypoints
+            frame = self.court_line_detector.draw_keypoints_overlay(frame, frame_court_keypoints)
 
-    # Court Line Detector Model
-    court_model_path = "models/keypoint_model2.pth" # Change model path to 2 for second larger dataset keypoint model
-    court_line_detector = CourtLineDetector(court_model_path)
-    court_keypoints = court_line_detector.predict(video_frames[0])
-
-    # Choose Players
-    player_detections = player_tracker.choose_and_filter_players(court_keypoints, player_detections)
+        # -- Draw Mini Court
+        with profiler.timer('draw_mini_court'):
+            frame = self.mini_court.draw_mini_court_frame(frame)
+            if frame_num < len(self.player_mini_court_detections):
+                frame = self.mini_court.draw_points(frame, self.player_mini_court_detections[frame_num])
+            if frame_num < len(self.ball_mini_court_detections):
+                frame = self.mini_court.draw_points(frame, self.ball_mini_court_detections[frame_num], color = (0, 255, 255))
 
-    # MiniCourt
-    mini_court = MiniCourt(video_frames[0])
+        # -- Draw Player Stats
+        with profiler.timer('draw_player_stats'):
+            if frame_num < len(self.player_stats_lines):
+                frame = draw_player_stats_lines(frame, self.player_stats_lines[frame_num])
 
-    # Detect Ball Shots
-    ball_shot_frames = ball_tracker.get_ball_shot_frames(ball_detections)
-    print(f"Ball Shots detected at frames: {ball_shot_frames}")
+        # -- Draw Frame Number on Top Left Corner
+        cv2.putText(frame, f"Frame: {frame_num}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        return frame
 
-    # Convert positions to mini court positions
-    player_mini_court_detections, ball_mini_court_detections = mini_court.convert_bounding_boxes_to_mini_court_coordinates(player_detections,
-                                                                                                        ball_detections,
-                                                                                                        court_keypoints)
 
+def compute_player_stats(ball_shot_frames, ball_mini_court_detections, player_mini_court_detections, mini_court, num_frames, fps = 24):
+    # Per-frame DataFrame of shot counts and ball / opponent speeds, carried forward from each shot frame.
+    # fps is the source video's frame rate, it turns the frames between two shots into seconds
+    import pandas as pd # only needed here, keeps `import main` (and --help) fast
     # Player stats data
     player_stats_data = [{
         'frame_num': 0,
@@ -62,7 +85,7 @@ def main():
         'player_1_last_shot_speed': 0,
         'player_1_total_player_speed': 0,
         'player_1_last_player_speed': 0,
-        
+    
         'player_2_number_of_shots': 0,
         'player_2_total_shot_speed': 0,
         'player_2_last_shot_speed': 0,
@@ -74,7 +97,7 @@ def main():
     for ball_shot_ind in range(len(ball_shot_frames)-1):
         start_frame = ball_shot_frames[ball_shot_ind]
         end_frame = ball_shot_frames[ball_shot_ind + 1]
-        ball_shot_time_in_seconds = (end_frame - start_frame) / 24
+        ball_shot_time_in_seconds = (end_frame - start_frame) / fps
 
         # Get distance covered by the ball
         distance_covered_by_ball_pixels = measure_distance(ball_mini_court_detections[start_frame][1],
@@ -91,7 +114,7 @@ def main():
         player_positions = player_mini_court_detections[start_frame]
         player_shot_ball = min(player_positions.keys(), key=lambda player_id: measure_distance(player_positions[player_id],
                                                                                                 ball_mini_court_detections[start_frame][1]))
-        
+    
         # Opponent Player Speed
         # -- Tutorial video has 2 players. Pickleball example is doubles so 4 players. (ID 1-2 close side, ID 3-4(weird issue ID skips 3 so 4-5 currently) far side)
         opponent_player_id = 1 if player_shot_ball == 2 else 2
@@ -116,48 +139,222 @@ def main():
         player_stats_data.append(current_player_stats)
 
     player_stats_data_df = pd.DataFrame(player_stats_data)
-    frames_df = pd.DataFrame({'frame_num': list(range(len(video_frames)))})
+    frames_df = pd.DataFrame({'frame_num': list(range(num_frames))})
     player_stats_data_df = pd.merge(frames_df, player_stats_data_df, on = 'frame_num', how = 'left')
     player_stats_data_df = player_stats_data_df.ffill()
-   
+
     # Avg shot speed of players
     player_stats_data_df['player_1_average_shot_speed'] = player_stats_data_df['player_1_total_shot_speed'] / player_stats_data_df['player_1_number_of_shots']
     player_stats_data_df['player_2_average_shot_speed'] = player_stats_data_df['player_2_total_shot_speed'] / player_stats_data_df['player_2_number_of_shots']
     # player_stats_data_df['player_3_average_shot_speed'] = player_stats_data_df['player_3_total_shot_speed'] / player_stats_data_df['player_3_number_of_shots']
     # player_stats_data_df['player_4_average_shot_speed'] = player_stats_data_df['player_4_total_shot_speed'] / player_stats_data_df['player_4_number_of_shots']
-    
+
     # Avg player speed
     player_stats_data_df['player_1_average_player_speed'] = player_stats_data_df['player_1_total_player_speed'] / player_stats_data_df['player_2_number_of_shots']
     player_stats_data_df['player_2_average_player_speed'] = player_stats_data_df['player_2_total_player_speed'] / player_stats_data_df['player_1_number_of_shots']
     # player_stats_data_df['player_3_average_player_speed'] = player_stats_data_df['player_3_total_player_speed'] / player_stats_data_df['player_4_number_of_shots']
     # player_stats_data_df['player_4_average_player_speed'] = player_stats_data_df['player_4_total_player_speed'] / player_stats_data_df['player_3_number_of_shots']
 
+    return player_stats_data_df
+
+
+def report_progress(frames, progress, stage, total_frames, every = 25):
+    # Passes the frames through, calling progress(stage, frames_done, total_frames) every few frames and at the end
+    frames_done = 0
+    for frame in frames:
+        yield frame
+        frames_done += 1
+        if frames_done % every == 0:
+            progress(stage, frames_done, total_frames)
+    progress(stage, frames_done, total_frames)
+
+
+def process_video(input_video_path, output_video_path = None, player_model_path = 'yolov8x.pt',
+                  ball_model_path = 'models/yolov8n_last.pt', court_model_path = 'models/keypoint_model2.pth',
+                  player_stub_path = None, ball_stub_path = None, read_from_stub = False,
+                  detection_batch_size = 8, player_detection_stride = 1, ball_search_window_size = None,
+                  track_court_keypoints = False, mini_court_projection = 'keypoint', render_workers = 1,
+                  detection_workers = 1, player_tracker = None, ball_tracker = None, court_line_detector = None,
+                  progress = None):
+    # Runs the whole analysis on one video and writes the annotated video, returns a small summary dict.
+    # output_video_path defaults to output_videos/<input name>.mp4 (H.264, needs ffmpeg) or .avi (MJPG).
+    # Video is streamed: frames are decoded once for detection and once more for rendering,
+    # so memory use does not grow with the length of the video.
+    # Stages are timed by the current profiler (see utils/profiler.py, main --profile)
+    # Already loaded detectors can be passed in (service.py keeps them warm), the trackers are reset first.
+    # progress(stage, frames_done, total_frames) is called during 'detection' and 'rendering' and once for 'analysis'.
+    profiler = get_profiler()
+    if progress is None:
+        progress = lambda stage, frames_done, total_frames: None
+    total_frames = get_frame_count(input_video_path)
+    fps = get_video_fps(input_video_path)
+    first_frame = read_first_frame(input_video_path)
+
+
+    # Detect Players and Ball
+    with profiler.stage('load_detection_models'):
+        if player_tracker is None:
+            player_tracker = PlayerTracker(model_path=player_model_path)
+        else:
+            player_tracker.reset()
+        if ball_tracker is None:
+            ball_tracker = BallTracker(model_path=ball_model_path)
+        else:
+            ball_tracker.reset()
+    progress('detection', 0, total_frames)
+    with profiler.stage('detection'):
+        if detection_workers > 1:
+            # Segments of the video detected in parallel processes, track IDs stitched across segments
+            player_detections, ball_detections = detect_players_and_ball_segmented(input_video_path,
+                                                                                   player_model_path=player_model_path,
+                                                                                   ball_model_path=ball_model_path,
+                                                                                   num_workers=detection_workers,
+                                                                                   read_from_stub=read_from_stub,
+                                                                                   player_stub_path=player_stub_path,
+                                                                                   ball_stub_path=ball_stub_path,
+                                                                                   batch_size=detection_batch_size,
+                                                                                   detection_stride=player_detection_stride,
+                                                                                   search_window_size=ball_search_window_size
+                                                                                   )
+        else:
+            # One pass over the video: each frame is decoded once (in its own thread, overlapping with inference),
+            # players are detected first and their boxes filter the ball candidates of the same frame
+            player_detections, ball_detections = detect_players_and_ball(player_tracker, ball_tracker,
+                                                                         report_progress(FramePipeline([]).run(read_video_frames(input_video_path)),
+                                                                                         progress, 'detection', total_frames),
+                                                                         read_from_stub=read_from_stub,
+                                                                         player_stub_path=player_stub_path,
+                                                                         ball_stub_path=ball_stub_path,
+                                                                         batch_size=detection_batch_size,
+                                                                         detection_stride=player_detection_stride,
+                                                                         search_window_size=ball_search_window_size
+                                                                         )
+    profiler.add_frames('detection', len(player_detections))
+    progress('analysis', 0, len(player_detections))
+    with profiler.stage('ball_interpolation', frames=len(ball_detections)):
+        ball_detections = ball_tracker.interpolate_ball_positions(ball_detections)
+
+
+    # Court Line Detector Model
+    with profiler.stage('load_court_model'):
+        if court_line_detector is None:
+            court_line_detector = CourtLineDetector(court_model_path)
+    with profiler.stage('court_keypoints'):
+        if track_court_keypoints:
+            court_keypoints = court_line_detector.predict_frames(FramePipeline([]).run(read_video_frames(input_video_path)))
+            first_frame_court_keypoints = court_keypoints[0]
+        else:
+            court_keypoints = court_line_detector.predict(first_frame)
+            first_frame_court_keypoints = court_keypoints
+
+    # Choose Players
+    with profiler.stage('choose_players', frames=len(player_detections)):
+        player_detections = player_tracker.choose_and_filter_players(first_frame_court_keypoints, player_detections)
+
+    # MiniCourt
+    mini_court = MiniCourt(first_frame)
+
+    # Detect Ball Shots
+    with profiler.stage('ball_shot_frames', frames=len(ball_detections)):
+        ball_shot_frames = ball_tracker.get_ball_shot_frames(ball_detections)
+    print(f"Ball Shots detected at frames: {ball_shot_frames}")
+
+    # Convert positions to mini court positions
+    with profiler.stage('mini_court_projection', frames=len(player_detections)):
+        player_mini_court_detections, ball_mini_court_detections = mini_court.convert_bounding_boxes_to_mini_court_coordinates(player_detections,
+                                                                                                            ball_detections,
+                                                                                                            court_keypoints,
+                                                                                                            projection=mini_court_projection)
+
+    with profiler.stage('player_stats', frames=len(player_detections)):
+        player_stats_data_df = compute_player_stats(ball_shot_frames, ball_mini_court_detections, player_mini_court_detections,
+                                                    mini_court, len(player_detections), fps)
+
     # --------------------
     # --- Draw Output ---
     # --------------------
 
-    # -- Draw Player Bounding Boxes
-    output_video_frames = player_tracker.draw_bboxes(video_frames, player_detections)
-    output_video_frames = ball_tracker.draw_bboxes(output_video_frames, ball_detections)
+    with profiler.stage('player_stats_lines', frames=len(player_stats_data_df)):
+        player_stats_lines = get_player_stats_lines(player_stats_data_df)
+    frame_renderer = FrameRenderer(player_tracker, ball_tracker, court_line_detector, mini_court,
+                                   player_detections, ball_detections, court_keypoints,
+                                   player_mini_court_detections, ball_mini_court_detections,
+                                   player_stats_lines)
+    if render_workers is None:
+        render_workers = os.cpu_count() or 1
+    if render_workers > 1:
+        # -- Frames are independent once everything is computed, render them on render_workers processes (opt-in,
+        # each worker starts fresh and gets a copy of the renderer without the models, see ParallelRenderer).
+        # Decode runs in its own thread, frames go to the workers through shared memory and come back in order.
+        render_pipeline = ParallelRenderer(frame_renderer.render, num_workers=render_workers)
+        output_video_frames = render_pipeline.run(FramePipeline([]).run(read_video_frames(input_video_path)))
+    else:
+        # -- Decode, render and encode overlap: decode and render get their own threads, encoding runs here
+        render_pipeline = FramePipeline([('render', lambda item: frame_renderer.render(*item))])
+        output_video_frames = render_pipeline.run(enumerate(read_video_frames(input_video_path)))
 
+    output_video_frames = report_progress(output_video_frames, progress, 'rendering', len(player_detections))
 
-    # -- Draw Court Keypoints
-    output_video_frames = court_line_detector.draw_keypoints_on_video(output_video_frames, court_keypoints)
+    # -- H.264 through ffmpeg when it is installed (much smaller files), MJPG through OpenCV otherwise.
+    # Encoding runs in a background thread at the source video's frame rate.
+    use_ffmpeg = shutil.which('ffmpeg') is not None
+    if output_video_path is None:
+        output_video_path = os.path.join('output_videos', os.path.splitext(os.path.basename(input_video_path))[0] + ('.mp4' if use_ffmpeg else '.avi'))
+    # Decode, draw and encode all happen while save_video consumes the frames, they are timed as one stage
+    with profiler.stage('render_and_encode'):
+        if use_ffmpeg:
+            num_frames = save_video(output_video_frames, output_video_path, fps=fps,
+                                    encoder='ffmpeg', codec='libx264', preset='veryfast', crf=23)
+        else:
+            num_frames = save_video(output_video_frames, output_video_path, fps=fps)
+    profiler.add_frames('render_and_encode', num_frames)
+    render_pipeline.print_report()
 
-    # -- Draw Mini Court
-    output_video_frames = mini_court.draw_mini_court(output_video_frames)
-    output_video_frames = mini_court.draw_points_on_mini_court(output_video_frames, player_mini_court_detections)
-    output_video_frames = mini_court.draw_points_on_mini_court(output_video_frames, ball_mini_court_detections, color = (0, 255, 255))
+    return {'output_video_path': output_video_path, 'frames': num_frames, 'ball_shots': len(ball_shot_frames)}
 
-    # -- Draw Player Stats
-    output_video_frames = draw_player_stats(output_video_frames, player_stats_data_df)
-
-    # -- Draw Frame Number on Top Left Corner
-    for i, frame in enumerate(output_video_frames):
-        cv2.putText(frame, f"Frame: {i}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
 
+def main():
+    parser = argparse.ArgumentParser(description='Analyze a pickleball video and write the annotated video')
+    parser.add_argument('--input', default='input_videos/input_video2p.mp4', help='input video (2p/4p based on players)')
+    parser.add_argument('--output', help='output video, default output_videos/<input name>.mp4 (.avi without ffmpeg)')
+    parser.add_argument('--player-model', default='yolov8x.pt')
+    parser.add_argument('--ball-model', default='models/yolov8n_last.pt')
+    parser.add_argument('--court-model', default='models/keypoint_model2.pth', help='2 is the model trained on the second, larger keypoint dataset')
+    parser.add_argument('--player-stub', default='tracker_stubs/player_detections2p.det', help='convert old .pkl stubs with python -m utils.detection_store')
+    parser.add_argument('--ball-stub', default='tracker_stubs/ball_detections2p.det')
+    parser.add_argument('--regenerate-stubs', action='store_true', help='run the detectors and overwrite the stubs (needed the first time)')
+    parser.add_argument('--batch-size', type=int, default=8, help='frames per detector forward pass')
+    parser.add_argument('--player-stride', type=int, default=1, help='detect players every k frames and interpolate in between (see benchmarks/player_stride.py)')
+    parser.add_argument('--ball-window', type=int, help='e.g. 512 to search the ball around its predicted position (see benchmarks/ball_search_window.py)')
+    parser.add_argument('--track-court-keypoints', action='store_true', help='re-predict court keypoints whenever the camera moves (pan/zoom)')
+    parser.add_argument('--projection', default='keypoint', choices=['keypoint', 'homography'],
+                        help="'homography' maps all players (2p or 4p) without player height constants")
+    parser.add_argument('--render-workers', type=int, default=1, help='processes for rendering, default 1 (render in a thread), 0 for all cores')
+    parser.add_argument('--detection-workers', type=int, default=1, help='processes detecting separate segments of the video')
+    parser.add_argument('--profile', nargs='?', const='output_videos/profile.json', metavar='PATH',
+                        help='write per-stage timings to PATH (default output_videos/profile.json) and a Chrome trace '
+                             'next to it (.trace.json), draw call latencies need --render-workers 1')
+    args = parser.parse_args()
 
-    save_video(output_video_frames, 'output_videos/output_video.avi')
+    profiler = set_profiler(Profiler(enabled=args.profile is not None))
+    process_video(args.input, args.output,
+                  player_model_path=args.player_model,
+                  ball_model_path=args.ball_model,
+                  court_model_path=args.court_model,
+                  player_stub_path=args.player_stub,
+                  ball_stub_path=args.ball_stub,
+                  read_from_stub=not args.regenerate_stubs,
+                  detection_batch_size=args.batch_size,
+                  player_detection_stride=args.player_stride,
+                  ball_search_window_size=args.ball_window,
+                  track_court_keypoints=args.track_court_keypoints,
+                  mini_court_projection=args.projection,
+                  render_workers=args.render_workers or None,
+                  detection_workers=args.detection_workers)
+    if profiler.enabled:
+        profiler.print_report()
+        summary_path, trace_path = profiler.save(args.profile)
+        print(f"Profile written to {summary_path} and {trace_path}")
 
 
 if __name__ == "__main__":
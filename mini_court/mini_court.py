@@ -10,7 +10,12 @@ from utils import(convert_pixel_distance_to_meters,
                   get_height_of_bbox,
                   measure_xy_distance,
                   get_center_of_bbox,
-                  measure_distance)
+                  measure_distance,
+                  Track,
+                  Tracks,
+                  as_tracks,
+                  rolling_max,
+                  OverlaySprite)
 
 class MiniCourt:
     def __init__(self, frame):
@@ -24,6 +29,9 @@ class MiniCourt:
         self.set_court_drawing_key_points()
         self.set_court_lines()
 
+        # Background box and court are static, rendered once per frame size (see draw_mini_court_frame)
+        self.overlays = {}
+
     def convert_meters_to_pixels(self, meters):
         return convert_meters_to_pixel_distance(meters,
                                                     constants.COURT_WIDTH,
@@ -146,12 +154,21 @@ class MiniCourt:
     def draw_mini_court(self, frames):
         output_frames = []
         for frame in frames:
-            frame = self.draw_background_rectangle(frame)
-            frame = self.draw_court(frame)
+            frame = self.draw_mini_court_frame(frame)
             output_frames.append(frame)
 
         return output_frames
 
+    def draw_mini_court_frame(self, frame):
+        # Same as draw_background_rectangle + draw_court, composited from a pre-rendered sprite inside the box only
+        overlay = self.overlays.get(frame.shape)
+        if overlay is None:
+            overlay = OverlaySprite.render(frame.shape, self.draw_court,
+                                           translucent_rect=(self.start_x, self.start_y, self.end_x, self.end_y),
+                                           translucent_color=(255, 255, 255), translucent_alpha=0.5)
+            self.overlays[frame.shape] = overlay
+        return overlay.composite(frame)
+
 
     def get_start_point_of_mini_court(self):
         return (self.court_start_x, self.court_start_y)
@@ -192,7 +209,108 @@ class MiniCourt:
         return mini_court_player_position
 
 
-    def convert_bounding_boxes_to_mini_court_coordinates(self, player_boxes, ball_boxes, original_court_key_points):
+    def project_positions(self, positions, player_heights_in_pixels, player_heights_in_meters, original_court_key_points):
+        # Array version of get_closest_key_point_index + get_mini_court_coordinates for many positions at once.
+        # positions is (n, 2), heights are (n,) arrays or scalars, NaN rows stay NaN.
+        # Court keypoints are one (24,) set or one row per position (n, 24).
+        rows = np.arange(len(positions))
+        key_points = np.broadcast_to(np.asarray(original_court_key_points, float), (len(positions), 24))
+        drawing_key_points = np.asarray(self.drawing_key_points, float)
+
+        # Closest key point by vertical distance - using points(0-close, 1-far, 8-close_middle, 9-far_middle)
+        candidate_indices = np.array([0, 1, 8, 9])
+        vertical_distances = np.abs(positions[:, 1:2] - key_points[:, candidate_indices*2 + 1])
+        closest_key_point_index = candidate_indices[np.argmin(np.nan_to_num(vertical_distances, nan=np.inf), axis=1)]
+
+        distance_from_x_keypoint_pixels = np.abs(positions[:, 0] - key_points[rows, closest_key_point_index*2])
+        distance_from_y_keypoint_pixels = np.abs(positions[:, 1] - key_points[rows, closest_key_point_index*2 + 1])
+
+        # Convert pixel distances to meters
+        distance_from_x_keypoint_meters = convert_pixel_distance_to_meters(distance_from_x_keypoint_pixels,
+                                                                           player_heights_in_meters,
+                                                                           player_heights_in_pixels)
+        distance_from_y_keypoint_meters = convert_pixel_distance_to_meters(distance_from_y_keypoint_pixels,
+                                                                           player_heights_in_meters,
+                                                                           player_heights_in_pixels)
+
+        # Convert to mini court pixel coordinates
+        mini_court_x_distance_pixels = self.convert_meters_to_pixels(distance_from_x_keypoint_meters)
+        mini_court_y_distance_pixels = self.convert_meters_to_pixels(distance_from_y_keypoint_meters)
+        return np.stack([drawing_key_points[closest_key_point_index*2] + mini_court_x_distance_pixels,
+                         drawing_key_points[closest_key_point_index*2 + 1] + mini_court_y_distance_pixels], axis=1)
+
+    def fit_homography(self, original_court_key_points):
+        # Perspective transform from the 12 detected court keypoints to the mini court drawing key points.
+        # RANSAC drops a badly predicted keypoint, least squares over all points is the fallback.
+        source_points = np.asarray(original_court_key_points, np.float32).reshape(-1, 2)
+        target_points = np.asarray(self.drawing_key_points, np.float32).reshape(-1, 2)
+        homography, _ = cv2.findHomography(source_points, target_points, cv2.RANSAC, 10.0)
+        if homography is None:
+            homography, _ = cv2.findHomography(source_points, target_points, 0)
+        if homography is None:
+            raise ValueError("Could not fit a homography to the court keypoints")
+        return homography
+
+    def project_points_with_homography(self, points, homography):
+        # Maps (n, 2) image points to mini court coordinates with one perspectiveTransform, NaN rows stay NaN
+        points = np.asarray(points, float)
+        projected = np.full(points.shape, np.nan)
+        valid = ~np.isnan(points).any(axis=1)
+        if valid.any():
+            projected[valid] = cv2.perspectiveTransform(points[valid].reshape(-1, 1, 2), homography).reshape(-1, 2)
+        return projected
+
+    def project_track_with_homography(self, track, positions, original_court_key_points):
+        # One homography for a (24,) keypoint set, or one per run of identical rows for per-frame keypoints
+        court_key_points = np.asarray(original_court_key_points, float)
+        if court_key_points.ndim == 1:
+            return self.project_points_with_homography(positions, self.fit_homography(court_key_points))
+
+        projected = np.full(positions.shape, np.nan)
+        segment_starts = np.concatenate(([0], np.flatnonzero((court_key_points[1:] != court_key_points[:-1]).any(axis=1)) + 1))
+        segment_ends = np.append(segment_starts[1:], len(court_key_points))
+        for segment_start, segment_end in zip(segment_starts, segment_ends):
+            first, last = np.searchsorted(track.frames, [segment_start, segment_end])
+            if first == last:
+                continue
+            homography = self.fit_homography(court_key_points[segment_start])
+            projected[first:last] = self.project_points_with_homography(positions[first:last], homography)
+        return projected
+
+    def convert_bounding_boxes_to_mini_court_coordinates_with_homography(self, player_boxes, ball_boxes, original_court_key_points):
+        # No player heights needed: every track's foot points and the ball centers go through the court homography
+        player_boxes = as_tracks(player_boxes)
+        ball_boxes = as_tracks(ball_boxes)
+        num_frames = len(player_boxes)
+
+        output_player_positions = {}
+        for player_id in player_boxes.track_ids():
+            track = player_boxes.track(player_id)
+            boxes = track.values.astype(float)
+            foot_positions = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, boxes[:, 3]], axis=1)
+            output_player_positions[int(player_id)] = Track(int(player_id), track.frames,
+                                                            self.project_track_with_homography(track, foot_positions, original_court_key_points))
+
+        output_ball_positions = {}
+        if 1 in ball_boxes:
+            track = ball_boxes.track(1)
+            track_in_range = track.frames < num_frames
+            track = Track(1, track.frames[track_in_range], track.values[track_in_range])
+            boxes = track.values.astype(float)
+            ball_positions = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+            output_ball_positions[1] = Track(1, track.frames,
+                                             self.project_track_with_homography(track, ball_positions, original_court_key_points))
+
+        return Tracks(num_frames, output_player_positions), Tracks(num_frames, output_ball_positions)
+
+    def convert_bounding_boxes_to_mini_court_coordinates(self, player_boxes, ball_boxes, original_court_key_points, projection = 'keypoint'):
+        # projection: 'keypoint' (closest keypoint + player height scale) or 'homography'.
+        # original_court_key_points is one (24,) set or per-frame (num_frames, 24) from CourtLineDetector.predict_frames
+        if projection == 'homography':
+            return self.convert_bounding_boxes_to_mini_court_coordinates_with_homography(player_boxes, ball_boxes, original_court_key_points)
+        if projection != 'keypoint':
+            raise ValueError(f"Unknown mini court projection: {projection}")
+
         player_heights = {
             1: constants.PLAYER_1_HEIGHT_METERS,
             2: constants.PLAYER_2_HEIGHT_METERS
@@ -200,80 +318,68 @@ class MiniCourt:
             # 4: constants.PLAYER_4_HEIGHT_METERS
         }
 
-        output_player_boxes = []
-        output_ball_boxes = []
-
-        for frame_num, player_bbox in enumerate(player_boxes):
-            ball_bbox = ball_boxes[frame_num][1]
-            ball_position = get_center_of_bbox(ball_bbox)
-            closest_player_id_to_ball = min(player_bbox.keys(), key=lambda x: measure_distance(ball_position, get_foot_position(player_bbox[x])))
-
-            output_player_bboxes_dict = {}
-            for player_id, bbox in player_bbox.items():
-                pid = int(player_id)
-                # only work with players we have height constants for (1..4)
-                if pid not in player_heights:
-                    continue
-
-                foot_position = get_foot_position(bbox)
-
-                # Get the closest key point on the court to the foot position - using points(0-close, 1-far, 8-close_middle, 9-far_middle)
-                closest_key_point_index = get_closest_key_point_index(foot_position, original_court_key_points, [0, 1, 8, 9])
-                closest_key_point = (original_court_key_points[closest_key_point_index*2], 
-                                     original_court_key_points[closest_key_point_index*2 + 1])
-
-                # Get player height in pixels
-                # frame_index_min = max(0, frame_num - 20)
-                # frame_index_max = min(len(player_boxes), frame_num + 50)
-                # bbox_heights_in_pixels = [get_height_of_bbox(player_boxes[i][player_id]) for i in range(frame_index_min, frame_index_max)]
-                # max_player_height_in_pixels = max(bbox_heights_in_pixels)
-                frame_index_min = max(0, frame_num - 20)
-                frame_index_max = min(len(player_boxes), frame_num + 50)
-                heights = [
-                    get_height_of_bbox(player_boxes[i][player_id])
-                    for i in range(frame_index_min, frame_index_max)
-                    if player_id in player_boxes[i]      # <-- only frames where this player is present
-                ]
-                if heights:
-                    max_player_height_in_pixels = max(heights)
-                else:
-                    # player vanished in this window; fall back to current bbox height
-                    max_player_height_in_pixels = get_height_of_bbox(bbox)
-
-
-                mini_court_player_position = self.get_mini_court_coordinates(foot_position,
-                                                                            closest_key_point,
-                                                                            closest_key_point_index,
-                                                                            max_player_height_in_pixels,
-                                                                            player_heights[pid])
-                
-                output_player_bboxes_dict[pid] = mini_court_player_position
-
-                if closest_player_id_to_ball == player_id:
-                   # Get the closest key point on the court to the foot position - using points(0-close, 1-far, 8-close_middle, 9-far_middle)
-                    closest_key_point_index = get_closest_key_point_index(ball_position, original_court_key_points, [0, 1, 8, 9])
-                    closest_key_point = (original_court_key_points[closest_key_point_index*2], 
-                                        original_court_key_points[closest_key_point_index*2 + 1])
-                    mini_court_player_position = self.get_mini_court_coordinates(ball_position,
-                                                                            closest_key_point,
-                                                                            closest_key_point_index,
-                                                                            max_player_height_in_pixels,
-                                                                            player_heights[pid])
-                    
-                    output_ball_boxes.append({1:mini_court_player_position})
-            output_player_boxes.append(output_player_bboxes_dict)
-
-        return output_player_boxes, output_ball_boxes
+        player_boxes = as_tracks(player_boxes)
+        ball_boxes = as_tracks(ball_boxes)
+        num_frames = len(player_boxes)
+        player_ids = player_boxes.track_ids()
+
+        # Whole tracks at once: (num_frames, 4) boxes per player, NaN where the player is missing
+        foot_positions = {}
+        max_player_heights_in_pixels = {}
+        for player_id in player_ids:
+            boxes = player_boxes.dense(player_id).astype(float)
+            foot_positions[player_id] = np.stack([np.trunc((boxes[:, 0] + boxes[:, 2]) / 2), np.trunc(boxes[:, 3])], axis=1)
+            # Tallest bbox from 20 frames before to 50 frames after (sliding window max over present frames)
+            max_player_heights_in_pixels[player_id] = rolling_max(boxes[:, 3] - boxes[:, 1], 20, 49)
+
+        output_player_positions = {}
+        for player_id in player_ids:
+            pid = int(player_id)
+            # only work with players we have height constants for (1..4)
+            if pid not in player_heights:
+                continue
+            output_player_positions[pid] = self.project_positions(foot_positions[player_id],
+                                                                  max_player_heights_in_pixels[player_id],
+                                                                  player_heights[pid],
+                                                                  original_court_key_points)
+
+        output_ball_positions = np.full((num_frames, 2), np.nan)
+        if 1 in ball_boxes and player_ids:
+            ball = ball_boxes.dense(1).astype(float)[:num_frames]
+            ball_positions = np.full((num_frames, 2), np.nan)
+            ball_positions[:len(ball)] = np.stack([np.trunc((ball[:, 0] + ball[:, 2]) / 2), np.trunc((ball[:, 1] + ball[:, 3]) / 2)], axis=1)
+
+            # Ball is projected with the height of the player whose feet are closest to it
+            distances = np.stack([((ball_positions[:, 0] - foot_positions[player_id][:, 0]) ** 2 +
+                                   (ball_positions[:, 1] - foot_positions[player_id][:, 1]) ** 2) ** 0.5
+                                  for player_id in player_ids], axis=1)
+            closest_player = np.argmin(np.nan_to_num(distances, nan=np.inf), axis=1)
+            has_closest_player = ~np.isnan(distances).all(axis=1)
+
+            frame_nums = np.arange(num_frames)
+            heights_in_pixels = np.stack([max_player_heights_in_pixels[player_id] for player_id in player_ids], axis=1)[frame_nums, closest_player]
+            heights_in_meters = np.array([player_heights.get(int(player_id), np.nan) for player_id in player_ids])[closest_player]
+            heights_in_pixels[~has_closest_player] = np.nan
+
+            output_ball_positions = self.project_positions(ball_positions, heights_in_pixels, heights_in_meters, original_court_key_points)
+
+        return Tracks.from_dense(output_player_positions, num_frames), Tracks.from_dense({1: output_ball_positions}, num_frames)
 
 
     def draw_points_on_mini_court(self, frames, positions, color = (0, 255, 0)):
         for frame_num, frame in enumerate(frames):
-            for _, position in positions[frame_num].items():
-                x, y = position
-                x = int(x)
-                y = int(y)
-                cv2.circle(frame, (x, y), 5, color, -1)
+            self.draw_points(frame, positions[frame_num], color)
 
         return frames
+
+    def draw_points(self, frame, positions, color = (0, 255, 0)):
+        # Draw the mini court positions of a single frame
+        for _, position in positions.items():
+            x, y = position
+            x = int(x)
+            y = int(y)
+            cv2.circle(frame, (x, y), 5, color, -1)
+
+        return frame
     
     # --- WIP ---
\ No newline at end of file
@@ -0,0 +1,289 @@
+# Long-running analysis service: the player, ball and court keypoint models stay loaded between videos
+#   python service.py --workers 2 --port 8765
+#   python service.py --socket /tmp/pickleball.sock
+# Jobs are JSON posted to the local HTTP API (bound to 127.0.0.1, or a Unix socket):
+#   curl -X POST localhost:8765/jobs -H 'Content-Type: application/json' -d '{"input_video_path": "input_videos/input_video2p.mp4"}'
+#   curl localhost:8765/jobs/1          status, progress (stage, frames done / total) and the result
+#   curl localhost:8765/jobs            every job
+#   curl localhost:8765/health          workers, queue length and loaded models
+#   curl --unix-socket /tmp/pickleball.sock http://localhost/jobs/1
+# A job takes the process_video options in JOB_OPTIONS, and "profile": true to get the job's stage timings
+# in its result. Jobs only read videos inside --input-root and write inside --output-root (output defaults
+# to <output root>/<input name>), stubs must be .det stores inside --stub-root (old .pkl stubs are pickles,
+# they are not loaded from the API). POSTs must be application/json, so a web page can't submit jobs with a
+# plain cross-origin form or text/plain request. Each worker thread owns one set of models and runs one job
+# at a time, tracker state (ByteTrack tracks, the ball's motion) is reset for every job.
+import argparse
+import json
+import os
+import queue
+import shutil
+import socketserver
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils import limit_threads, Profiler, use_profiler
+from trackers import PlayerTracker, BallTracker
+from court_line_detector import CourtLineDetector
+from main import process_video
+
+# process_video options a job may set, the model paths are fixed by the service
+JOB_OPTIONS = ('output_video_path', 'player_stub_path', 'ball_stub_path', 'read_from_stub', 'detection_batch_size',
+               'player_detection_stride', 'ball_search_window_size', 'track_court_keypoints', 'mini_court_projection')
+STUB_OPTIONS = ('player_stub_path', 'ball_stub_path')
+
+
+class AnalysisService:
+    def __init__(self, num_workers = 1, player_model_path = 'yolov8x.pt', ball_model_path = 'models/yolov8n_last.pt',
+                 court_model_path = 'models/keypoint_model2.pth', render_workers = 1, stub_root = None,
+                 input_root = None, output_root = None):
+        self.num_workers = num_workers
+        self.player_model_path = player_model_path
+        self.ball_model_path = ball_model_path
+        self.court_model_path = court_model_path
+        # Render processes per job, 1 renders in a thread. The workers already share the cores between them
+        self.render_workers = render_workers
+        # Paths from jobs must be inside these directories, None allows any path (e.g. when used as a library)
+        self.input_root = os.path.realpath(input_root) if input_root is not None else None
+        self.output_root = os.path.realpath(output_root) if output_root is not None else None
+        self.stub_root = os.path.realpath(stub_root) if stub_root is not None else None
+        self.jobs = {} # job_id -> status dict, see submit
+        self.job_queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.next_job_id = 1
+        self.workers = []
+
+    def start(self):
+        # Loads one set of models per worker up front, so the first job does not pay for it
+        for i in range(self.num_workers):
+            start = time.perf_counter()
+            detectors = {
+                'player_tracker': PlayerTracker(model_path=self.player_model_path),
+                'ball_tracker': BallTracker(model_path=self.ball_model_path),
+                'court_line_detector': CourtLineDetector(self.court_model_path),
+            }
+            for detector in detectors.values():
+                detector.model
+            print(f"worker {i}: models loaded in {time.perf_counter() - start:.1f}s")
+            worker = threading.Thread(target=self._work, args=(detectors,), name=f'worker-{i}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        # Workers finish their current job, queued jobs are left as they are
+        for _ in self.workers:
+            self.job_queue.put(None)
+        for worker in self.workers:
+            worker.join()
+
+    def submit(self, input_video_path, profile = False, **options):
+        unknown = set(options) - set(JOB_OPTIONS)
+        if unknown:
+            raise ValueError(f"Unknown job options: {', '.join(sorted(unknown))}")
+        check_path(input_video_path, self.input_root, 'Input video')
+        if not os.path.isfile(input_video_path):
+            raise ValueError(f"Input video not found: {input_video_path}")
+        if options.get('output_video_path') is not None:
+            check_path(options['output_video_path'], self.output_root, 'Output video')
+        elif self.output_root is not None:
+            # process_video would write to output_videos/ in the working directory
+            extension = '.mp4' if shutil.which('ffmpeg') is not None else '.avi'
+            options['output_video_path'] = os.path.join(self.output_root, os.path.splitext(os.path.basename(input_video_path))[0] + extension)
+        for name in STUB_OPTIONS:
+            if options.get(name) is not None:
+                self.check_stub_path(options[name])
+
+        with self.lock:
+            job_id = str(self.next_job_id)
+            self.next_job_id += 1
+            self.jobs[job_id] = {
+                'job_id': job_id,
+                'status': 'queued',
+                'input_video_path': input_video_path,
+                'options': options,
+                'profile': bool(profile),
+                'submitted': time.time(),
+                'progress': None,
+            }
+            job = dict(self.jobs[job_id])
+        self.job_queue.put(job_id)
+        return job
+
+    def check_stub_path(self, stub_path):
+        # load_stub unpickles .pkl stubs, only detection stores (plain .npy columns) are read for a job
+        if not isinstance(stub_path, str) or not stub_path.rstrip('/').endswith('.det'):
+            raise ValueError(f"Stub paths must be .det detection stores: {stub_path}")
+        check_path(stub_path, self.stub_root, 'Stub path')
+
+    def get_job(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def list_jobs(self):
+        with self.lock:
+            return [dict(job) for job in self.jobs.values()]
+
+    def health(self):
+        with self.lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+        return {
+            'workers': self.num_workers,
+            'workers_alive': sum(worker.is_alive() for worker in self.workers),
+            'queued': self.job_queue.qsize(),
+            'jobs': counts,
+            'models': {'player': self.player_model_path, 'ball': self.ball_model_path, 'court': self.court_model_path},
+        }
+
+    def _update(self, job_id, **fields):
+        with self.lock:
+            self.jobs[job_id].update(fields)
+
+    def _work(self, detectors):
+        while True:
+            job_id = self.job_queue.get()
+            if job_id is None:
+                return
+            job = self.get_job(job_id)
+            self._update(job_id, status='running', started=time.time(), worker=threading.current_thread().name)
+
+            def progress(stage, frames_done, total_frames):
+                self._update(job_id, progress={'stage': stage, 'frames_done': frames_done, 'total_frames': total_frames,
+                                               'fraction': round(frames_done / total_frames, 4) if total_frames else None})
+
+            start = time.perf_counter()
+            # Own profiler per job, the workers run their jobs at the same time
+            profiler = Profiler(enabled=job['profile'])
+            try:
+                with use_profiler(profiler):
+                    result = process_video(job['input_video_path'], render_workers=self.render_workers,
+                                           progress=progress, **detectors, **job['options'])
+                if profiler.enabled:
+                    result['profile'] = profiler.summary()
+                self._update(job_id, status='done', result=result)
+            except Exception as e:
+                self._update(job_id, status='failed', error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc())
+            self._update(job_id, finished=time.time(), seconds=round(time.perf_counter() - start, 2))
+            print(f"job {job_id} {self.get_job(job_id)['status']} in {time.perf_counter() - start:.1f}s")
+
+
+def check_path(path, root, description):
+    # Raises ValueError unless path (symlinks resolved) is inside root, any path passes when root is None
+    if not isinstance(path, str):
+        raise ValueError(f"{description} must be a path: {path}")
+    if root is not None and os.path.commonpath([os.path.realpath(path), root]) != root:
+        raise ValueError(f"{description} is outside {root}: {path}")
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    # JSON in, JSON out. self.server.service is the AnalysisService
+    def do_GET(self):
+        service = self.server.service
+        path = self.path.rstrip('/')
+        if path == '/health':
+            self.send_json(200, service.health())
+        elif path == '/jobs':
+            self.send_json(200, service.list_jobs())
+        elif path.startswith('/jobs/'):
+            job = service.get_job(path[len('/jobs/'):])
+            if job is None:
+                self.send_json(404, {'error': 'job not found'})
+            else:
+                self.send_json(200, job)
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            self.send_json(404, {'error': 'not found'})
+            return
+        if self.headers.get_content_type() != 'application/json':
+            # Browsers send text/plain and form posts cross-origin without a preflight, JSON needs one
+            self.send_json(415, {'error': 'Content-Type must be application/json'})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            input_video_path = body.pop('input_video_path')
+            job = self.server.service.submit(input_video_path, **body)
+        except KeyError:
+            self.send_json(400, {'error': 'input_video_path is required'})
+            return
+        except (ValueError, TypeError, AttributeError) as e:
+            # Bad JSON, a non-object body or an invalid option
+            self.send_json(400, {'error': str(e)})
+            return
+        self.send_json(202, job)
+
+    def send_json(self, status, data):
+        body = json.dumps(data, indent=2).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_request(self, code = '-', size = '-'):
+        # Only failed requests, progress polling would flood the log
+        if str(getattr(code, 'value', code)).startswith(('4', '5')):
+            super().log_request(code, size)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(service, host = '127.0.0.1', port = 8765, socket_path = None):
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.service = service
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep the models loaded and process videos posted to a local API')
+    parser.add_argument('--workers', type=int, default=1, help='jobs processed at the same time, each with its own models')
+    parser.add_argument('--threads-per-worker', type=int, help='torch / OpenCV threads per worker, default cores / workers')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', help='listen on this Unix socket instead of TCP')
+    parser.add_argument('--player-model', default='yolov8x.pt')
+    parser.add_argument('--ball-model', default='models/yolov8n_last.pt')
+    parser.add_argument('--court-model', default='models/keypoint_model2.pth')
+    parser.add_argument('--render-workers', type=int, default=1, help='render processes per job')
+    parser.add_argument('--input-root', default='input_videos', help='jobs may only read videos inside this directory')
+    parser.add_argument('--output-root', default='output_videos', help='jobs may only write videos inside this directory')
+    parser.add_argument('--stub-root', default='tracker_stubs', help='jobs may only use stubs inside this directory')
+    args = parser.parse_args()
+
+    # Thread pools are process-wide, share the cores between the workers
+    limit_threads(args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers))
+
+    service = AnalysisService(args.workers, args.player_model, args.ball_model, args.court_model, args.render_workers,
+                              args.stub_root, args.input_root, args.output_root)
+    service.start()
+    server = create_server(service, args.host, args.port, args.socket)
+    print(f"Listening on {args.socket or f'http://{args.host}:{args.port}'} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
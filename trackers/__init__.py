@@ -1,2 +1,5 @@
 from .player_tracker import PlayerTracker
-from .ball_tracker import BallTracker
\ No newline at end of file
+from .ball_tracker import BallTracker
+from .online_ball import OnlineBallInterpolator, OnlineShotDetector
+from .fused_detection import detect_players_and_ball
+from .segment_detection import detect_players_and_ball_segmented
\ No newline at end of file
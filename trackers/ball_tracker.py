@@ -1,90 +1,151 @@
-from ultralytics import YOLO
 from math import hypot
 import cv2
-import pickle
-import pandas as pd
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import batch_frames, load_stub, save_stub, Detections, Track, Tracks, as_tracks
 
 class BallTracker:
     def __init__(self, model_path):
-        self.model = YOLO(model_path)
+        self.model_path = model_path
+        self._model = None # loaded on first use, see model
+        self.ball_cls = None # set when the model is loaded
+        self.reset()
+
+    def reset(self):
+        # Forgets the ball's motion so the next video starts from a full-frame search, the model stays loaded
         self.prev_center  = None
         self.prev_box     = None
-        self.vel          = (0.0, 0.0)
-        self.misses       = 0
+        self.vel          = (0.0, 0.0) # px per frame, updated by update_motion
+        self.misses       = 0          # frames since the ball was last found
         self.area_avg     = None
         self.switch_votes = 0
-        names_lc = {i: n.lower() for i, n in self.model.names.items()}
-        self.ball_cls = next((i for i, n in names_lc.items()
-                            if n in ("pickleball", "sports ball", "ball")), None)
-        print("ball class idx =", self.ball_cls, "| classes =", self.model.names)
+        self.search_stats = {'window': 0, 'full_frame': 0} # frames searched per mode by track_frame
 
+    @property
+    def model(self):
+        # ultralytics is imported and the weights are loaded on the first detection, so runs from stubs never pay for them
+        if self._model is None:
+            from ultralytics import YOLO
+            self._model = YOLO(self.model_path)
+            names_lc = {i: n.lower() for i, n in self._model.names.items()}
+            self.ball_cls = next((i for i, n in names_lc.items()
+                                if n in ("pickleball", "sports ball", "ball")), None)
+            print("ball class idx =", self.ball_cls, "| classes =", self._model.names)
+        return self._model
 
-    def interpolate_ball_positions(self, ball_positions):
-        ball_positions = [x.get(1, []) for x in ball_positions]
-        # Convert the list into pandas DataFrame for easier manipulation
-        df_ball_positions = pd.DataFrame(ball_positions, columns=['x1', 'y1', 'x2', 'y2'])
 
-        # Interpolate missing values
-        df_ball_positions = df_ball_positions.interpolate()
-        df_ball_positions = df_ball_positions.bfill()
+    def __getstate__(self):
+        # Render workers only need draw_bbox, leave the weights out of the pickle
+        state = self.__dict__.copy()
+        state['_model'] = None
+        return state
+
+    def interpolate_ball_positions(self, ball_positions):
+        ball_positions = as_tracks(ball_positions)
+        if 1 not in ball_positions:
+            return Tracks(len(ball_positions))
 
-        # Convert back to list of dictionaries
-        ball_positions = [{1:x} for x in df_ball_positions.to_numpy().tolist()]
+        # Linear interpolation between detections, edges are filled with the first/last detection
+        # (same result as DataFrame.interpolate().bfill())
+        ball_track = ball_positions.track(1)
+        all_frames = np.arange(len(ball_positions))
+        interpolated = np.empty((len(all_frames), 4), np.float32)
+        for i in range(4):
+            interpolated[:, i] = np.interp(all_frames, ball_track.frames, ball_track.values[:, i])
 
-        return ball_positions
+        return Tracks(len(ball_positions), {1: Track(1, all_frames, interpolated)})
 
     def get_ball_shot_frames(self, ball_positions):
-        ball_positions = [x.get(1, []) for x in ball_positions]
-        # Convert the list into pandas DataFrame for easier manipulation
-        df_ball_positions = pd.DataFrame(ball_positions, columns=['x1', 'y1', 'x2', 'y2'])
-
-        df_ball_positions['ball_hit'] = 0
-        df_ball_positions['mid_y'] = (df_ball_positions['y1'] + df_ball_positions['y2']) / 2
-        df_ball_positions['mid_y_rolling_mean'] = df_ball_positions['mid_y'].rolling(window = 5, min_periods = 1, center = False).mean()
-        df_ball_positions['delta_y'] = df_ball_positions['mid_y_rolling_mean'].diff()
+        import pandas as pd # only needed here, importing trackers stays light
+        ball_positions = as_tracks(ball_positions)
+        if 1 not in ball_positions:
+            return []
+        ball_boxes = ball_positions.dense(1).astype(float)
+
+        mid_y = (ball_boxes[:, 1] + ball_boxes[:, 3]) / 2
+        mid_y_rolling_mean = pd.Series(mid_y).rolling(window = 5, min_periods = 1, center = False).mean().to_numpy()
+        delta_y = np.diff(mid_y_rolling_mean, prepend=np.nan)
+
         minimum_change_frames_for_hit = 18 # Change sensitivity for hit detection
-        for i in range(1, len(df_ball_positions) - int(minimum_change_frames_for_hit * 1.2)):
-            negative_position_change = df_ball_positions['delta_y'].iloc[i] > 0 and df_ball_positions['delta_y'].iloc[i + 1] < 0 
-            positive_position_change = df_ball_positions['delta_y'].iloc[i] < 0 and df_ball_positions['delta_y'].iloc[i + 1] > 0
+        window = int(minimum_change_frames_for_hit * 1.2)
+        num_frames = len(delta_y)
+        if num_frames - window <= 1:
+            return []
 
-            if negative_position_change or positive_position_change:
-                change_count = 0
-                for change_frame in range(i + 1, i + int(minimum_change_frames_for_hit * 1.2)+1):
-                    negative_position_change_following_frame = df_ball_positions['delta_y'].iloc[i] > 0 and df_ball_positions['delta_y'].iloc[change_frame] < 0 
-                    positive_position_change_following_frame = df_ball_positions['delta_y'].iloc[i] < 0 and df_ball_positions['delta_y'].iloc[change_frame] > 0
+        # NaN deltas count as neither direction (same as the comparisons in the old loop)
+        moving_down = np.nan_to_num(delta_y, nan=0.0) > 0
+        moving_up = np.nan_to_num(delta_y, nan=0.0) < 0
 
-                    if negative_position_change and negative_position_change_following_frame:
-                        change_count += 1
-                    elif positive_position_change and positive_position_change_following_frame:
-                        change_count += 1
+        # Direction flips between frame i and i + 1
+        frame_nums = np.arange(1, num_frames - window)
+        negative_position_change = moving_down[frame_nums] & moving_up[frame_nums + 1]
+        positive_position_change = moving_up[frame_nums] & moving_down[frame_nums + 1]
 
-                if change_count > minimum_change_frames_for_hit-1:
-                    df_ball_positions['ball_hit'].iloc[i] = 1
+        # Frames in (i, i + window] that move in the new direction, from prefix sums
+        moving_up_cumsum = np.concatenate(([0], np.cumsum(moving_up)))
+        moving_down_cumsum = np.concatenate(([0], np.cumsum(moving_down)))
+        moving_up_count = moving_up_cumsum[frame_nums + window + 1] - moving_up_cumsum[frame_nums + 1]
+        moving_down_count = moving_down_cumsum[frame_nums + window + 1] - moving_down_cumsum[frame_nums + 1]
 
-        frame_nums_with_ball_hits = df_ball_positions[df_ball_positions['ball_hit'] == 1].index.tolist()
+        ball_hit = ((negative_position_change & (moving_up_count > minimum_change_frames_for_hit - 1)) |
+                    (positive_position_change & (moving_down_count > minimum_change_frames_for_hit - 1)))
+
+        frame_nums_with_ball_hits = frame_nums[ball_hit].tolist()
         return frame_nums_with_ball_hits
 
 
-    def detect_frames(self, frames, read_from_stub = False, stub_path = None):
+    def detect_frames(self, frames, read_from_stub = False, stub_path = None, batch_size = 1,
+                      search_window_size = None, max_misses = 5):
+        # search_window_size (e.g. 512) searches a crop around the predicted ball position instead of the
+        # whole frame (see track_frame). Each crop depends on the previous frame, so it runs frame by frame.
         ball_detections = []
 
-        # If reading from stub, load detections from pickle file
+        # If reading from stub, load detections from the detection store (or an old pickle file)
         if read_from_stub and stub_path is not None:
-            with open(stub_path, 'rb') as f:
-                ball_detections = pickle.load(f)
-            return ball_detections
+            return load_stub(stub_path)
+
+        if search_window_size is not None:
+            for frame in frames:
+                ball_detections.append(self.track_frame(frame, search_window_size, max_misses))
+        elif batch_size > 1:
+            # Batched inference, prev_center candidate selection still runs frame by frame in order
+            for batch in batch_frames(frames, batch_size):
+                ball_detections.extend(self.detect_batch(batch))
+        else:
+            for frame in frames:
+                ball_dict = self.detect_frame(frame)
+                ball_detections.append(ball_dict)
 
-        for frame in frames:
-            ball_dict = self.detect_frame(frame)
-            ball_detections.append(ball_dict)
+        ball_detections = Tracks.from_detections(ball_detections)
 
         # Save detections to stub file if path is provided
         if stub_path is not None:
-            with open(stub_path, 'wb') as f:
-                pickle.dump(ball_detections, f)
+            save_stub(ball_detections, stub_path, class_id=self.ball_cls if self.ball_cls is not None else -1)
 
         return ball_detections
 
+    def predict(self, frames, imgsz = 1280):
+        # predict (same API, but pass ball class if we found it and use a bigger input)
+        model = self.model # loads the model and sets ball_cls on the first call
+        return model.predict(
+            frames,
+            conf=0.15,                          # tune 0.12–0.22 as needed
+            iou=0.30,
+            imgsz=imgsz,                        # 1280 helps tiny balls on full frames
+            classes=[self.ball_cls] if self.ball_cls is not None else None,
+            verbose=False)
+
+    def detect_batch(self, frames, person_boxes = None):
+        # One forward pass for all frames, person_boxes is an optional list of per-frame player boxes
+        results = self.predict(frames)
+
+        ball_dicts = []
+        for i, (frame, res) in enumerate(zip(frames, results)):
+            frame_person_boxes = person_boxes[i] if person_boxes is not None else None
+            ball_dicts.append(self.choose_ball(res.boxes, frame.shape, frame_person_boxes))
+        return ball_dicts
+
     def detect_frame(self, frame, person_boxes = None):
         # results = self.model.predict(frame, conf = 0.15)[0]
     
@@ -98,22 +159,70 @@ class BallTracker:
         # -----------------------------------------------
         # --- Potential fix for tracking ball issues ---
         # -----------------------------------------------
+        results = self.predict(frame)[0]
+        return self.choose_ball(results.boxes, frame.shape, person_boxes)
+        # -----------------------------
+        # --- End of potential fix ---
+        # -----------------------------
+
+    def track_frame(self, frame, search_window_size = 512, max_misses = 5, person_boxes = None):
+        # Runs the detector on a search_window_size crop around the predicted position at native resolution,
+        # and on the full frame when there is no prediction yet or the ball was missed max_misses times in a row
+        window = self.get_search_window(frame.shape, search_window_size, max_misses)
+        if window is None:
+            self.search_stats['full_frame'] += 1
+            ball_dict = self.detect_frame(frame, person_boxes)
+        else:
+            self.search_stats['window'] += 1
+            x1, y1, x2, y2 = window
+            results = self.predict(np.ascontiguousarray(frame[y1:y2, x1:x2]), imgsz=search_window_size)[0]
+            ball_dict = self.choose_ball(results.boxes, frame.shape, person_boxes, offset=(x1, y1))
+        self.update_motion(ball_dict)
+        return ball_dict
+
+    def get_search_window(self, frame_shape, search_window_size, max_misses):
+        # (x1, y1, x2, y2) crop centered on prev_center + vel for every frame since the last hit, None for a full-frame search
+        if self.prev_center is None or self.misses >= max_misses:
+            return None
+        h, w = frame_shape[:2]
+        if search_window_size >= w and search_window_size >= h:
+            return None
+
+        frames_ahead = self.misses + 1
+        predicted_x = self.prev_center[0] + self.vel[0] * frames_ahead
+        predicted_y = self.prev_center[1] + self.vel[1] * frames_ahead
+        window_w, window_h = min(search_window_size, w), min(search_window_size, h)
+        x1 = int(min(max(predicted_x - window_w / 2, 0), w - window_w))
+        y1 = int(min(max(predicted_y - window_h / 2, 0), h - window_h))
+        return x1, y1, x1 + window_w, y1 + window_h
+
+    def update_motion(self, ball_dict):
+        # Velocity from the last two hits (spread over the missed frames in between) and a running ball area
+        if 1 not in ball_dict:
+            self.misses += 1
+            return
+
+        box = ball_dict[1]
+        if self.prev_box is not None:
+            prev_cx, prev_cy = 0.5*(self.prev_box[0]+self.prev_box[2]), 0.5*(self.prev_box[1]+self.prev_box[3])
+            cx, cy = 0.5*(box[0]+box[2]), 0.5*(box[1]+box[3])
+            self.vel = ((cx - prev_cx) / (self.misses + 1), (cy - prev_cy) / (self.misses + 1))
+        area = (box[2] - box[0]) * (box[3] - box[1])
+        self.area_avg = area if self.area_avg is None else 0.9 * self.area_avg + 0.1 * area
+        self.prev_box = box
+        self.misses = 0
+
+    def choose_ball(self, boxes, frame_shape, person_boxes = None, offset = None):
+        # Post-processing for one frame's detections, updates prev_center so frames must come in order.
+        # offset is the (x, y) of the crop the boxes were detected in, boxes are returned in frame coordinates.
         if person_boxes is None:
             person_boxes = []
-        # 1) predict (same API, but pass ball class if we found it and use a bigger input)
-        results = self.model.predict(
-            frame,
-            conf=0.15,                          # tune 0.12–0.22 as needed
-            iou=0.30,
-            imgsz=1280,                         # helps tiny balls
-            classes=[self.ball_cls] if self.ball_cls is not None else None)[0]
 
-        boxes = results.boxes
-        ball_dict = {}
+        ball_dict = Detections()
         if boxes is None or len(boxes) == 0:
             return ball_dict  # nothing this frame
 
-        h, w = frame.shape[:2]
+        h, w = frame_shape[:2]
 
         # 2) build candidates; keep small & roughly round-ish; drop anything inside a player box
         def center(b): 
@@ -126,6 +235,8 @@ class BallTracker:
         cands = []
         for b in boxes:
             xyxy = b.xyxy[0].cpu().numpy()
+            if offset is not None:
+                xyxy = xyxy + np.array([offset[0], offset[1], offset[0], offset[1]], xyxy.dtype)
             x1, y1, x2, y2 = xyxy
             bw, bh = x2 - x1, y2 - y1
             if bw <= 0 or bh <= 0:
@@ -155,20 +266,22 @@ class BallTracker:
 
         self.prev_center = (0.5*(pick[0]+pick[2]), 0.5*(pick[1]+pick[3]))
         ball_dict[1] = pick.tolist()
+        ball_dict.confidences[1] = conf
         return ball_dict
-        # -----------------------------
-        # --- End of potential fix ---
-        # -----------------------------
 
     
     def draw_bboxes(self, video_frames, player_detections):
         output_video_frames = []
         for frame, ball_dict in zip(video_frames, player_detections):
-            # Draw ball bounding boxes
-            for track_id, bbox in ball_dict.items():
-                x1, y1, x2, y2 = bbox
-                cv2.putText(frame, f"Ball ID: {track_id}", (int(bbox[0]), int(bbox[1] - 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 225, 255), 2)
-                cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 255), 2)
+            frame = self.draw_bbox(frame, ball_dict)
             output_video_frames.append(frame)
 
-        return output_video_frames
\ No newline at end of file
+        return output_video_frames
+
+    def draw_bbox(self, frame, ball_dict):
+        # Draw ball bounding boxes
+        for track_id, bbox in ball_dict.items():
+            x1, y1, x2, y2 = bbox
+            cv2.putText(frame, f"Ball ID: {track_id}", (int(bbox[0]), int(bbox[1] - 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 225, 255), 2)
+            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 255), 2)
+        return frame
\ No newline at end of file
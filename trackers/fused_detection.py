@@ -0,0 +1,95 @@
+import sys
+sys.path.append('../')
+from utils import batch_frames, load_stub, save_stub, Tracks, get_profiler
+
+
+def mark_last(frames):
+    # Yields (frame, is_last) with one frame of lookahead, so the last frame is known while streaming
+    frames = iter(frames)
+    previous = next(frames, None)
+    if previous is None:
+        return
+    for frame in frames:
+        yield previous, False
+        previous = frame
+    yield previous, True
+
+
+def detect_players_and_ball(player_tracker, ball_tracker, frames, read_from_stub = False,
+                            player_stub_path = None, ball_stub_path = None, batch_size = 1,
+                            detection_stride = 1, search_window_size = None, max_misses = 5):
+    """
+    Detect players and the ball in a single pass over the frames. Every batch of frames is decoded once
+    and goes to the player detector first, then to the ball detector together with that frame's player
+    boxes, so ball candidates inside a player box (sleeves, shoes) are rejected.
+
+    Parameters:
+    player_tracker (PlayerTracker): Player detector/tracker.
+    ball_tracker (BallTracker): Ball detector.
+    frames (iterable): Frames in order, e.g. read_video_frames.
+    read_from_stub (bool): Load both results from the stubs instead (when both paths are given).
+    player_stub_path (str): Player detection stub to load/save.
+    ball_stub_path (str): Ball detection stub to load/save.
+    batch_size (int): Frames per forward pass.
+    detection_stride (int): Detect players every detection_stride frames (and on the last one), the ball filter
+                            uses the latest player boxes in between and player tracks are interpolated.
+    search_window_size (int): Search the ball around its predicted position (see BallTracker.track_frame).
+    max_misses (int): Misses before the ball search falls back to the full frame.
+
+    Returns:
+    tuple: (player detections, ball detections) as Tracks.
+    """
+    if read_from_stub and player_stub_path is not None and ball_stub_path is not None:
+        return load_stub(player_stub_path), load_stub(ball_stub_path)
+
+    player_tracker.detection_stride = detection_stride
+    detected_frame_nums = []
+    player_dicts = []
+    ball_dicts = []
+    latest_player_dict = {}
+    frame_num = 0
+    profiler = get_profiler()
+
+    for batch in batch_frames(mark_last(frames), batch_size):
+        batch_frame_list = [frame for frame, _ in batch]
+
+        # -- Players on the frames the stride keeps
+        detect = [i for i, (_, is_last) in enumerate(batch) if (frame_num + i) % detection_stride == 0 or is_last]
+        with profiler.timer('player_detection', frames=len(detect)):
+            # Strided runs go through detect_batch too, so both paths get the same ByteTrack (see detect_frames)
+            if batch_size > 1 or detection_stride > 1:
+                detected = player_tracker.detect_batch([batch_frame_list[i] for i in detect]) if detect else []
+            else:
+                detected = [player_tracker.detect_frame(batch_frame_list[i]) for i in detect]
+        detected_by_index = dict(zip(detect, detected))
+
+        person_boxes = []
+        for i in range(len(batch)):
+            if i in detected_by_index:
+                latest_player_dict = detected_by_index[i]
+                detected_frame_nums.append(frame_num + i)
+                player_dicts.append(latest_player_dict)
+            person_boxes.append(list(latest_player_dict.values()))
+
+        # -- Ball, with the player boxes of the same frame
+        with profiler.timer('ball_detection', frames=len(batch)):
+            if search_window_size is not None:
+                for frame, frame_person_boxes in zip(batch_frame_list, person_boxes):
+                    ball_dicts.append(ball_tracker.track_frame(frame, search_window_size, max_misses, frame_person_boxes))
+            elif batch_size > 1:
+                ball_dicts.extend(ball_tracker.detect_batch(batch_frame_list, person_boxes))
+            else:
+                ball_dicts.append(ball_tracker.detect_frame(batch_frame_list[0], person_boxes[0]))
+
+        frame_num += len(batch)
+
+    player_detections = player_tracker.build_tracks(detected_frame_nums, player_dicts, frame_num, detection_stride)
+    ball_detections = Tracks.from_detections(ball_dicts)
+
+    # Save detections to stub files if paths are provided
+    if player_stub_path is not None:
+        save_stub(player_detections, player_stub_path, class_id=0)
+    if ball_stub_path is not None:
+        save_stub(ball_detections, ball_stub_path, class_id=ball_tracker.ball_cls if ball_tracker.ball_cls is not None else -1)
+
+    return player_detections, ball_detections
@@ -0,0 +1,104 @@
+from collections import deque
+import math
+
+# Streaming versions of BallTracker.interpolate_ball_positions and BallTracker.get_ball_shot_frames.
+# Both take one frame's ball dict at a time in frame order and only keep a few frames of state,
+# so they work on live input and on videos of any length.
+
+
+class OnlineBallInterpolator:
+    # Fills missed ball detections linearly once the next detection arrives.
+    # Latency: a detected frame is emitted right away, missed frames wait for the next detection
+    # (or max_gap frames, after which they are held at the last position). Frames before the first
+    # detection get the first detected box, frames after the last one the last box (on flush),
+    # the same as interpolate_ball_positions.
+    def __init__(self, max_gap = None):
+        self.max_gap = max_gap
+        self.frame_num = 0 # next frame to be pushed
+        self.last_frame_num = None
+        self.last_box = None
+        self.pending = 0 # frames since the last detection that have not been emitted yet
+
+    def update(self, ball_dict):
+        # Push the next frame's detection ({1: [x1, y1, x2, y2]} or {}), returns the frames that are now final
+        # as a list of (frame_num, ball_dict)
+        frame_num = self.frame_num
+        self.frame_num += 1
+
+        if 1 not in ball_dict:
+            self.pending += 1
+            if self.max_gap is not None and self.last_box is not None and self.pending > self.max_gap:
+                return self.flush()
+            return []
+
+        box = list(ball_dict[1])
+        output = []
+        first_pending = frame_num - self.pending
+        if self.last_box is None:
+            # No detection yet, fill backwards with this one
+            output = [(f, {1: list(box)}) for f in range(first_pending, frame_num)]
+        else:
+            span = frame_num - self.last_frame_num
+            for f in range(first_pending, frame_num):
+                t = (f - self.last_frame_num) / span
+                output.append((f, {1: [a + (b - a) * t for a, b in zip(self.last_box, box)]}))
+        output.append((frame_num, {1: box}))
+
+        self.last_frame_num = frame_num
+        self.last_box = box
+        self.pending = 0
+        return output
+
+    def flush(self):
+        # Emits the frames still waiting for a detection, held at the last position ({} if there never was one)
+        first_pending = self.frame_num - self.pending
+        self.pending = 0
+        if self.last_box is None:
+            return [(f, {}) for f in range(first_pending, self.frame_num)]
+        return [(f, {1: list(self.last_box)}) for f in range(first_pending, self.frame_num)]
+
+
+class OnlineShotDetector:
+    # Same hit rule as get_ball_shot_frames: the 5-frame rolling mean of the ball's mid y changes direction
+    # between frames i and i + 1 and keeps the new direction on more than minimum_change_frames_for_hit - 1
+    # of the next int(minimum_change_frames_for_hit * 1.2) frames.
+    # Latency: a hit at frame i is confirmed, and returned, when frame i + latency is pushed
+    # (latency = 21 frames with the default settings, 0.7s at 30 fps). Frames without a ball count as
+    # no movement, like NaN in the offline version.
+    def __init__(self, minimum_change_frames_for_hit = 18, rolling_window = 5):
+        self.minimum_change_frames_for_hit = minimum_change_frames_for_hit
+        self.latency = int(minimum_change_frames_for_hit * 1.2)
+        self.frame_num = 0
+        self.mid_ys = deque(maxlen=rolling_window) # last rolling_window mid y values, None where missing
+        self.prev_rolling_mean = math.nan
+        self.directions = deque(maxlen=self.latency + 1) # sign of delta y for frames frame_num - latency .. frame_num
+
+    def update(self, ball_dict):
+        # Push the next (interpolated) frame, returns the list of hit frame numbers confirmed by it (at most one)
+        frame_num = self.frame_num
+        self.frame_num += 1
+
+        if 1 in ball_dict:
+            x1, y1, x2, y2 = ball_dict[1]
+            self.mid_ys.append((y1 + y2) / 2)
+        else:
+            self.mid_ys.append(None)
+
+        # Rolling mean over the non-missing values, like pandas rolling(min_periods=1)
+        values = [y for y in self.mid_ys if y is not None]
+        rolling_mean = sum(values) / len(values) if values else math.nan
+        delta_y = rolling_mean - self.prev_rolling_mean
+        self.prev_rolling_mean = rolling_mean
+        self.directions.append(1 if delta_y > 0 else -1 if delta_y < 0 else 0)
+
+        # The candidate frame is the oldest one in the ring buffer
+        hit_frame = frame_num - self.latency
+        if hit_frame < 1 or len(self.directions) <= self.latency:
+            return []
+        direction = self.directions[0]
+        if direction == 0 or self.directions[1] != -direction:
+            return []
+        following_changes = sum(1 for i in range(1, self.latency + 1) if self.directions[i] == -direction)
+        if following_changes > self.minimum_change_frames_for_hit - 1:
+            return [hit_frame]
+        return []
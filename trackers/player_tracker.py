@@ -1,22 +1,46 @@
-from ultralytics import YOLO
 import cv2
-import pickle
+import numpy as np
 import sys
 sys.path.append('../')
-from utils import measure_distance, get_center_of_bbox
+from utils import measure_distance, get_center_of_bbox, batch_frames, stride_frames, load_stub, save_stub, Detections, Tracks, as_tracks
 
 class PlayerTracker:
     def __init__(self, model_path):
-        self.model = YOLO(model_path)
+        self.model_path = model_path
+        self._model = None # loaded on first use, see model
+        self.tracker = None # ByteTrack instance used by the batched path
+        self.detection_stride = 1 # set by detect_frames, the detector only sees every detection_stride-th frame
+
+    @property
+    def model(self):
+        # ultralytics is imported and the weights are loaded on the first detection, so runs from stubs never pay for them
+        if self._model is None:
+            from ultralytics import YOLO
+            self._model = YOLO(self.model_path)
+        return self._model
+
+    def reset(self):
+        # Forgets every track so the next video starts with fresh track IDs, the model stays loaded
+        self.tracker = None
+        self.detection_stride = 1
+        predictor = getattr(self._model, 'predictor', None)
+        if predictor is not None and hasattr(predictor, 'trackers'):
+            # model.track(persist=True) keeps its ByteTrack on the predictor, it is recreated on the next call
+            del predictor.trackers
+
+    def __getstate__(self):
+        # Copies sent to render workers only draw boxes: no model or ByteTrack state (the model reloads lazily if needed)
+        state = self.__dict__.copy()
+        state['_model'] = None
+        state['tracker'] = None
+        return state
 
     def choose_and_filter_players(self, court_keypoints, player_detections):
+        player_detections = as_tracks(player_detections)
         player_deterctions_first_name = player_detections[0]
         chosen_player = self.choose_players(court_keypoints, player_deterctions_first_name)
-        filtered_player_detections = []
-        for player_dict in player_detections:
-            filtered_player_dict = {track_id: bbox for track_id, bbox in player_dict.items() if track_id in chosen_player}
-            filtered_player_detections.append(filtered_player_dict)
-        return filtered_player_detections
+        # Drop every other track as a whole instead of filtering each frame's dict
+        return player_detections.select(chosen_player)
 
 
     def choose_players(self, court_keypoints, player_dict):
@@ -44,26 +68,91 @@ class PlayerTracker:
             
 
 
-    def detect_frames(self, frames, read_from_stub = False, stub_path = None):
+    def detect_frames(self, frames, read_from_stub = False, stub_path = None, batch_size = 1, detection_stride = 1):
+        # detection_stride > 1 runs the detector on every detection_stride-th frame (and the last one)
+        # and fills the frames in between by interpolating each track linearly
         player_detections = []
 
-        # If reading from stub, load detections from pickle file
+        # If reading from stub, load detections from the detection store (or an old pickle file)
         if read_from_stub and stub_path is not None:
-            with open(stub_path, 'rb') as f:
-                player_detections = pickle.load(f)
-            return player_detections
-
-        for frame in frames:
-            player_dict = self.detect_frame(frame)
-            player_detections.append(player_dict)
+            return load_stub(stub_path)
+
+        self.detection_stride = detection_stride
+        detected_frame_nums = []
+        def detected_frames():
+            for frame_num, frame in stride_frames(frames, detection_stride):
+                detected_frame_nums.append(frame_num)
+                yield frame
+
+        if batch_size > 1 or detection_stride > 1:
+            # Batched inference, track IDs are still assigned frame by frame in order.
+            # Also used for strided runs at batch_size 1: model.track's ByteTrack assumes 30 fps and would keep
+            # lost tracks detection_stride times longer, create_tracker scales its frame rate to the stride
+            for batch in batch_frames(detected_frames(), batch_size):
+                player_detections.extend(self.detect_batch(batch))
+        else:
+            for frame in detected_frames():
+                player_dict = self.detect_frame(frame)
+                player_detections.append(player_dict)
+
+        num_frames = detected_frame_nums[-1] + 1 if detected_frame_nums else 0
+        player_detections = self.build_tracks(detected_frame_nums, player_detections, num_frames, detection_stride)
 
         # Save detections to stub file if path is provided
         if stub_path is not None:
-            with open(stub_path, 'wb') as f:
-                pickle.dump(player_detections, f)
+            save_stub(player_detections, stub_path, class_id=0)
 
         return player_detections
 
+    def build_tracks(self, detected_frame_nums, player_dicts, num_frames, detection_stride = 1):
+        # Tracks from the player dicts of the detected frames, the frames in between are interpolated
+        if detection_stride == 1:
+            return Tracks.from_detections(player_dicts)
+        all_frames = [{} for _ in range(num_frames)]
+        for frame_num, player_dict in zip(detected_frame_nums, player_dicts):
+            all_frames[frame_num] = player_dict
+        # Only gaps left by the stride are filled, not frames where the detector lost a player
+        return Tracks.from_detections(all_frames).interpolate(max_gap=detection_stride)
+
+    def detect_batch(self, frames):
+        # One forward pass for all frames, then ByteTrack association runs sequentially
+        results = self.model.predict(
+            frames,
+            classes=[0], # person only
+            conf=0.45,
+            iou=0.5,
+            imgsz=960,
+            verbose=False
+        )
+
+        player_dicts = []
+        for frame, res in zip(frames, results):
+            player_dicts.append(self.track_detections(res, frame))
+        return player_dicts
+
+    def track_detections(self, result, frame):
+        # Runs ByteTrack on a single frame's detections (must be called in frame order)
+        if self.tracker is None:
+            self.tracker = self.create_tracker()
+
+        det = result.boxes.cpu().numpy()
+        tracks = self.tracker.update(det, frame)
+        if len(tracks) == 0:
+            return {}
+
+        # tracks rows: x1, y1, x2, y2, track_id, score, cls, idx
+        tracks = np.asarray(tracks)
+        return self.choose_tallest_players(tracks[:, :4], tracks[:, 4], tracks[:, 6], tracks[:, 5])
+
+    def create_tracker(self):
+        # Same tracker config that model.track(tracker='bytetrack.yaml') uses
+        from ultralytics.trackers.byte_tracker import BYTETracker
+        from ultralytics.utils import IterableSimpleNamespace, yaml_load
+        from ultralytics.utils.checks import check_yaml
+
+        cfg = IterableSimpleNamespace(**yaml_load(check_yaml('bytetrack.yaml')))
+        # The tracker only sees detected frames, keep its lost-track buffer the same length in seconds
+        return BYTETracker(args=cfg, frame_rate=max(1, round(30 / self.detection_stride)))
 
     def detect_frame(self, frame):
         # results = self.model.track(frame, persist = True)[0]
@@ -101,34 +190,45 @@ class PlayerTracker:
             xyxy = boxes.xyxy.cpu().numpy()
             ids  = (boxes.id.cpu().numpy() if boxes.id is not None else None)
             cls  = (boxes.cls.cpu().numpy() if boxes.cls is not None else None)
-
-            # Keep only "person" (defensive check) and take the two tallest (closest)
-            keep = []
-            for j in range(xyxy.shape[0]):
-                if cls is None or int(cls[j]) == 0:
-                    x1,y1,x2,y2 = xyxy[j]
-                    h = y2 - y1
-                    keep.append((h, j))
-            keep.sort(reverse=True)
-            keep = keep[:2]
-
-            for _, j in keep:
-                tid = int(ids[j]) if ids is not None else j  # fallback to index if no ID
-                player_dict[tid] = xyxy[j].tolist()
+            scores = (boxes.conf.cpu().numpy() if boxes.conf is not None else None)
+            player_dict = self.choose_tallest_players(xyxy, ids, cls, scores)
 
         return player_dict
         # --- End of potential fix ---
 
+    def choose_tallest_players(self, xyxy, ids, cls, scores = None):
+        # Keep only "person" (defensive check) and take the two tallest (closest), with their detector scores
+        keep = []
+        for j in range(xyxy.shape[0]):
+            if cls is None or int(cls[j]) == 0:
+                x1,y1,x2,y2 = xyxy[j]
+                h = y2 - y1
+                keep.append((h, j))
+        keep.sort(reverse=True)
+        keep = keep[:2]
+
+        player_dict = Detections()
+        for _, j in keep:
+            tid = int(ids[j]) if ids is not None else j  # fallback to index if no ID
+            player_dict[tid] = xyxy[j].tolist()
+            if scores is not None:
+                player_dict.confidences[tid] = float(scores[j])
+        return player_dict
+
     
 
     def draw_bboxes(self, video_frames, player_detections):
         output_video_frames = []
         for frame, player_dict in zip(video_frames, player_detections):
-            # Draw player bounding boxes
-            for track_id, bbox in player_dict.items():
-                x1, y1, x2, y2 = bbox
-                cv2.putText(frame, f"Player ID: {track_id}", (int(bbox[0]), int(bbox[1] - 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
-                cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 2)
+            frame = self.draw_bbox(frame, player_dict)
             output_video_frames.append(frame)
 
-        return output_video_frames
\ No newline at end of file
+        return output_video_frames
+
+    def draw_bbox(self, frame, player_dict):
+        # Draw player bounding boxes
+        for track_id, bbox in player_dict.items():
+            x1, y1, x2, y2 = bbox
+            cv2.putText(frame, f"Player ID: {track_id}", (int(bbox[0]), int(bbox[1] - 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
+            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 2)
+        return frame
\ No newline at end of file
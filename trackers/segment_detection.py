@@ -0,0 +1,191 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import read_frame_range, get_frame_count, limit_threads, measure_iou, save_stub, load_stub, Track, Tracks
+
+# A long video is cut into segments that are detected in parallel processes. Every segment after the first
+# starts `overlap` frames early: those frames warm up ByteTrack and the ball's prev_center, and are used to
+# match the segment's track IDs to the previous segment's. Results of the warm-up frames are then dropped
+# in favor of the previous segment's, so every frame comes from a tracker that has been running for a while.
+
+
+def plan_segments(num_frames, num_segments, overlap, align = 1):
+    # [(read_start, keep_start, keep_stop, read_stop)]: frames [read_start, read_stop) are detected and
+    # [keep_start, keep_stop) are kept. Reads start and end on multiples of align, so a detection stride
+    # detects (and interpolates between) the same frames as in the serial run.
+    bounds = np.linspace(0, num_frames, num_segments + 1).round().astype(int)
+    segments = []
+    for i in range(num_segments):
+        keep_start, keep_stop = int(bounds[i]), int(bounds[i + 1])
+        if keep_stop > keep_start:
+            read_start = max(0, keep_start - overlap) // align * align
+            read_stop = -(-(keep_stop - 1) // align) * align + 1
+            segments.append((read_start, keep_start, keep_stop, read_stop))
+    # The last segment reads to the end of the video, the header frame count is not always exact
+    if segments:
+        segments[-1] = segments[-1][:2] + (None, None)
+    return segments
+
+
+def detect_segment(video_path, read_start, stop, player_model_path, ball_model_path, detection_options):
+    # Runs in a worker process: fresh trackers, fused detection on one frame range (local frame numbers).
+    # Returns (player Tracks, ball Tracks, ball class id), the parent never loads the ball model itself
+    from trackers import PlayerTracker, BallTracker, detect_players_and_ball
+    player_tracker = PlayerTracker(model_path=player_model_path)
+    ball_tracker = BallTracker(model_path=ball_model_path)
+    player_tracks, ball_tracks = detect_players_and_ball(player_tracker, ball_tracker, read_frame_range(video_path, read_start, stop),
+                                                         **detection_options)
+    return player_tracks, ball_tracks, ball_tracker.ball_cls
+
+
+def match_track_ids(previous_tracks, tracks, overlap_frames, min_iou = 0.5):
+    """
+    Match the track IDs of a segment to the previous segment's on the frames both of them detected.
+
+    Parameters:
+    previous_tracks (dict): {track_id: (num_overlap_frames, 4) boxes, NaN where missing} of the previous segment.
+    tracks (dict): Same for the new segment.
+    overlap_frames (int): Number of overlapping frames.
+    min_iou (float): Minimum IoU, averaged over the overlap, for two tracks to be the same.
+
+    Returns:
+    dict: {new track_id: previous track_id} for the matched tracks.
+    """
+    scores = []
+    for track_id, boxes in tracks.items():
+        for previous_track_id, previous_boxes in previous_tracks.items():
+            both = ~np.isnan(boxes).any(axis=1) & ~np.isnan(previous_boxes).any(axis=1)
+            if not both.any():
+                continue
+            # Frames where only one of them exists count as 0, so tracks that only touch briefly don't match
+            score = measure_iou(boxes[both], previous_boxes[both]).sum() / overlap_frames
+            if score >= min_iou:
+                scores.append((score, track_id, previous_track_id))
+
+    # Greedy, best pairs first
+    matches = {}
+    used = set()
+    for score, track_id, previous_track_id in sorted(scores, key=lambda x: -x[0]):
+        if track_id not in matches and previous_track_id not in used:
+            matches[track_id] = previous_track_id
+            used.add(previous_track_id)
+    return matches
+
+
+def stitch_segments(segments, results, min_iou = 0.5):
+    # Combines per-segment (player Tracks, ball Tracks) with local frame numbers into whole-video Tracks,
+    # segments as returned by plan_segments
+    player_pieces = {} # global track_id -> [(frames, values, confidence)]
+    ball_pieces = []
+    previous = None # (player Tracks, read_start, id map) of the previous segment
+    next_track_id = 1
+    num_frames = 0
+
+    for (read_start, keep_start, keep_stop, _), (player_tracks, ball_tracks) in zip(segments, results):
+        if keep_stop is None:
+            keep_stop = read_start + len(player_tracks)
+        num_frames = max(num_frames, keep_stop)
+
+        if previous is None:
+            # First segment keeps its own IDs, like the serial run
+            id_map = {track_id: track_id for track_id in player_tracks.track_ids()}
+        else:
+            previous_tracks, previous_read_start, previous_id_map = previous
+            overlap_frames = keep_start - read_start
+            id_map = {}
+            if overlap_frames > 0:
+                # Boxes of both segments on the overlapping frames [read_start, keep_start)
+                previous_offset = read_start - previous_read_start
+                previous_boxes = {track_id: previous_tracks.dense(track_id)[previous_offset:previous_offset + overlap_frames]
+                                  for track_id in previous_tracks.track_ids()}
+                boxes = {track_id: player_tracks.dense(track_id)[:overlap_frames] for track_id in player_tracks.track_ids()}
+                matches = match_track_ids(previous_boxes, boxes, overlap_frames, min_iou)
+                id_map = {track_id: previous_id_map[previous_track_id] for track_id, previous_track_id in matches.items()}
+        # Unmatched tracks get new IDs that never collide with one handed out before
+        for track_id in player_tracks.track_ids():
+            if track_id not in id_map:
+                id_map[track_id] = next_track_id
+            next_track_id = max(next_track_id, id_map[track_id] + 1)
+
+        # Keep frames [keep_start, keep_stop), shifted to video frame numbers
+        for track_id, track in player_tracks.tracks.items():
+            frames = track.frames + read_start
+            keep = (frames >= keep_start) & (frames < keep_stop)
+            if keep.any():
+                player_pieces.setdefault(id_map[track_id], []).append((frames[keep], track.values[keep], piece_confidence(track, keep)))
+        for track in ball_tracks.tracks.values():
+            frames = track.frames + read_start
+            keep = (frames >= keep_start) & (frames < keep_stop)
+            ball_pieces.append((frames[keep], track.values[keep], piece_confidence(track, keep)))
+
+        previous = (player_tracks, read_start, id_map)
+
+    player_detections = Tracks(num_frames, {track_id: join_pieces(track_id, pieces) for track_id, pieces in player_pieces.items()})
+    ball_tracks = {}
+    if any(len(frames) for frames, _, _ in ball_pieces):
+        ball_tracks[1] = join_pieces(1, ball_pieces)
+    return player_detections, Tracks(num_frames, ball_tracks)
+
+
+def piece_confidence(track, keep):
+    # Detector scores of the kept rows, NaN for a segment whose track has none
+    if track.confidence is None:
+        return np.full(int(keep.sum()), np.nan, np.float32)
+    return track.confidence[keep]
+
+
+def join_pieces(track_id, pieces):
+    confidence = np.concatenate([c for _, _, c in pieces])
+    return Track(track_id, np.concatenate([f for f, _, _ in pieces]), np.concatenate([v for _, v, _ in pieces]),
+                 None if np.isnan(confidence).all() else confidence)
+
+
+def detect_players_and_ball_segmented(video_path, player_model_path = 'yolov8x.pt', ball_model_path = 'models/yolov8n_last.pt',
+                                      num_workers = 2, num_segments = None, overlap = 60, threads_per_worker = None,
+                                      min_iou = 0.5, player_stub_path = None, ball_stub_path = None, read_from_stub = False,
+                                      **detection_options):
+    """
+    Same result as detect_players_and_ball over the whole video (up to track ID numbering), computed
+    by num_workers processes on separate segments of the video.
+
+    Parameters:
+    video_path (str): Input video, every worker opens and seeks it itself.
+    player_model_path (str): Player YOLO model, loaded once per worker.
+    ball_model_path (str): Ball YOLO model, loaded once per worker.
+    num_workers (int): Worker processes.
+    num_segments (int): Segments to cut the video into, default num_workers.
+    overlap (int): Frames each segment starts early to warm up the trackers and match track IDs (2s at 30 fps).
+    threads_per_worker (int): torch / OpenCV threads per worker, default cores / workers.
+    min_iou (float): Minimum mean IoU over the overlap for two segment tracks to get the same ID.
+    detection_options: batch_size, detection_stride, search_window_size, max_misses for detect_players_and_ball.
+
+    Returns:
+    tuple: (player detections, ball detections) as Tracks.
+    """
+    if read_from_stub and player_stub_path is not None and ball_stub_path is not None:
+        return load_stub(player_stub_path), load_stub(ball_stub_path)
+
+    num_segments = num_segments or num_workers
+    threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+    segments = plan_segments(get_frame_count(video_path), num_segments, overlap, align=detection_options.get('detection_stride', 1))
+
+    # spawn: every worker loads its own models from scratch, nothing torch related is forked
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(num_workers, mp_context=context, initializer=limit_threads, initargs=(threads_per_worker,)) as executor:
+        futures = [executor.submit(detect_segment, video_path, read_start, read_stop, player_model_path, ball_model_path, detection_options)
+                   for read_start, _, _, read_stop in segments]
+        results = [future.result() for future in futures]
+
+    player_detections, ball_detections = stitch_segments(segments, [(player_tracks, ball_tracks) for player_tracks, ball_tracks, _ in results], min_iou)
+    # Same class id as the fused path stores (every worker loads the same ball model)
+    ball_class_id = next((ball_cls for _, _, ball_cls in results if ball_cls is not None), -1)
+
+    # Save detections to stub files if paths are provided
+    if player_stub_path is not None:
+        save_stub(player_detections, player_stub_path, class_id=0)
+    if ball_stub_path is not None:
+        save_stub(ball_detections, ball_stub_path, class_id=ball_class_id)
+    return player_detections, ball_detections
\ No newline at end of file
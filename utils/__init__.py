@@ -1,4 +1,12 @@
-from .video_utils import read_video, save_video
-from .bbox_utils import get_center_of_bbox, measure_distance, get_foot_position, get_closest_key_point_index, get_height_of_bbox, measure_xy_distance, get_center_of_bbox
+from .video_utils import read_video, read_video_frames, read_frame_range, get_frame_count, read_first_frame, batch_frames, stride_frames, save_video, get_video_fps, create_encoder, OpenCVEncoder, FFmpegEncoder, BackgroundEncoder, ENCODERS
+from .bbox_utils import get_center_of_bbox, measure_distance, get_foot_position, get_closest_key_point_index, get_height_of_bbox, measure_xy_distance, get_center_of_bbox, measure_iou
 from .conversions import convert_pixel_distance_to_meters, convert_meters_to_pixel_distance
-from .player_stats_drawer_utils import draw_player_stats
\ No newline at end of file
+from .player_stats_drawer_utils import draw_player_stats, draw_player_stats_frame, draw_player_stats_lines, get_player_stats_lines
+from .frame_pipeline import FramePipeline
+from .parallel_render import ParallelRenderer
+from .tracks import Detections, Track, Tracks, as_tracks, rolling_max
+from .detection_store import DetectionStore, save_detections, save_tracks, convert_pickle_stub, load_stub, save_stub
+from .overlay_utils import OverlaySprite
+from .process_utils import limit_threads
+from .profiler import Profiler, get_profiler, set_profiler, use_profiler
+from .live_source import LiveSource
\ No newline at end of file
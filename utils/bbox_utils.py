@@ -1,3 +1,5 @@
+import numpy as np
+
 def get_center_of_bbox(bbox):
     """
     Calculate the center point of a bounding box.
@@ -105,4 +107,25 @@ def get_center_of_bbox(bbox):
     x1, y1, x2, y2 = bbox
     center_x = int((x1 + x2) / 2)
     center_y = int((y1 + y2) / 2)
-    return (center_x, center_y)
\ No newline at end of file
+    return (center_x, center_y)
+
+def measure_iou(boxes_a, boxes_b):
+    """
+    Calculate the intersection over union of bounding boxes, pairwise and broadcasting like NumPy.
+
+    Parameters:
+    boxes_a (np.ndarray): Boxes of shape (..., 4) in the format [x1, y1, x2, y2].
+    boxes_b (np.ndarray): Boxes of shape (..., 4) in the format [x1, y1, x2, y2].
+
+    Returns:
+    np.ndarray: The IoU of every pair, 0 where the boxes don't overlap.
+    """
+    boxes_a = np.asarray(boxes_a, float)
+    boxes_b = np.asarray(boxes_b, float)
+    width = np.minimum(boxes_a[..., 2], boxes_b[..., 2]) - np.maximum(boxes_a[..., 0], boxes_b[..., 0])
+    height = np.minimum(boxes_a[..., 3], boxes_b[..., 3]) - np.maximum(boxes_a[..., 1], boxes_b[..., 1])
+    intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+    area_a = (boxes_a[..., 2] - boxes_a[..., 0]) * (boxes_a[..., 3] - boxes_a[..., 1])
+    area_b = (boxes_b[..., 2] - boxes_b[..., 0]) * (boxes_b[..., 3] - boxes_b[..., 1])
+    union = area_a + area_b - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
\ No newline at end of file
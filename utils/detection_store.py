@@ -0,0 +1,200 @@
+import os
+import pickle
+import shutil
+import tempfile
+import numpy as np
+from .tracks import Tracks, Track, as_tracks
+
+# A detection store is a directory of .npy columns, one row per detection, rows sorted by frame:
+#   frame_index.npy   int32   (n,)
+#   track_id.npy      int32   (n,)
+#   bbox.npy          float32 (n, 4)   x1, y1, x2, y2
+#   confidence.npy    float32 (n,)     NaN when the detector score was not kept
+#   class_id.npy      int16   (n,)     -1 when unknown
+#   frame_offsets.npy int64   (num_frames + 1,)  rows of frame f are [offsets[f], offsets[f + 1])
+# Columns are memory-mapped on load, so reading a frame range only touches those rows.
+
+COLUMNS = ('frame_index', 'track_id', 'bbox', 'confidence', 'class_id')
+
+
+def save_detections(detections, store_path, class_id = -1, confidences = None):
+    """
+    Save per-frame detections to a columnar detection store.
+
+    Parameters:
+    detections (list): A list with one {track_id: [x1, y1, x2, y2]} dict per frame.
+    store_path (str): Directory to write the columns to (created if missing).
+    class_id (int): Class id stored for every detection.
+    confidences (list): Optional list with one {track_id: confidence} dict per frame, by default the
+                        scores of Detections dicts are used.
+    """
+    num_rows = sum(len(frame_dict) for frame_dict in detections)
+    frame_index = np.empty(num_rows, np.int32)
+    track_id = np.empty(num_rows, np.int32)
+    bbox = np.empty((num_rows, 4), np.float32)
+    confidence = np.full(num_rows, np.nan, np.float32)
+    frame_offsets = np.zeros(len(detections) + 1, np.int64)
+
+    row = 0
+    for frame_num, frame_dict in enumerate(detections):
+        frame_confidences = confidences[frame_num] if confidences is not None else getattr(frame_dict, 'confidences', {})
+        for tid, box in frame_dict.items():
+            frame_index[row] = frame_num
+            track_id[row] = int(tid)
+            bbox[row] = box
+            if tid in frame_confidences:
+                confidence[row] = frame_confidences[tid]
+            row += 1
+        frame_offsets[frame_num + 1] = row
+
+    write_columns(store_path, frame_index, track_id, bbox, confidence,
+                  np.full(num_rows, class_id, np.int16), frame_offsets)
+
+
+def save_tracks(tracks, store_path, class_id = -1):
+    # Columnar Tracks map straight onto the store, no per-frame dicts needed
+    track_list = list(tracks.tracks.values())
+    if track_list:
+        frame_index = np.concatenate([track.frames for track in track_list])
+        track_id = np.concatenate([np.full(len(track), track.track_id, np.int32) for track in track_list])
+        bbox = np.concatenate([track.values for track in track_list])
+        confidence = np.concatenate([track.confidence if track.confidence is not None else np.full(len(track), np.nan, np.float32)
+                                     for track in track_list])
+    else:
+        frame_index = np.empty(0, np.int32)
+        track_id = np.empty(0, np.int32)
+        bbox = np.empty((0, 4), np.float32)
+        confidence = np.empty(0, np.float32)
+
+    order = np.argsort(frame_index, kind='stable')
+    frame_offsets = np.zeros(tracks.num_frames + 1, np.int64)
+    frame_offsets[1:] = np.cumsum(np.bincount(frame_index, minlength=tracks.num_frames)[:tracks.num_frames])
+
+    write_columns(store_path, frame_index[order], track_id[order], bbox[order],
+                  confidence[order], np.full(len(order), class_id, np.int16), frame_offsets)
+
+
+def write_columns(store_path, frame_index, track_id, bbox, confidence, class_id, frame_offsets):
+    # Columns are written to a temporary directory next to store_path that is renamed into place at the end,
+    # so a killed writer never leaves a partial store behind (at worst no store, or a stray .tmp-* directory)
+    store_path = os.path.normpath(store_path)
+    parent = os.path.dirname(store_path) or '.'
+    os.makedirs(parent, exist_ok=True)
+    columns = {
+        'frame_index': np.ascontiguousarray(frame_index, np.int32),
+        'track_id': np.ascontiguousarray(track_id, np.int32),
+        'bbox': np.ascontiguousarray(bbox, np.float32).reshape(-1, 4),
+        'confidence': np.ascontiguousarray(confidence, np.float32),
+        'class_id': np.ascontiguousarray(class_id, np.int16),
+        'frame_offsets': np.ascontiguousarray(frame_offsets, np.int64),
+    }
+    tmp_path = tempfile.mkdtemp(prefix=os.path.basename(store_path) + '.tmp-', dir=parent)
+    try:
+        for name, values in columns.items():
+            np.save(os.path.join(tmp_path, f'{name}.npy'), values)
+        if os.path.exists(store_path):
+            # A directory can only be renamed onto a missing (or empty) one, move the old store out first
+            old_path = tmp_path + '.old'
+            os.replace(store_path, old_path)
+            os.replace(tmp_path, store_path)
+            shutil.rmtree(old_path)
+        else:
+            os.replace(tmp_path, store_path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def convert_pickle_stub(pickle_path, store_path = None, class_id = -1):
+    # Converts an old tracker_stubs/*.pkl file (list of {track_id: bbox} dicts) to a detection store.
+    # Only use this on stubs you created yourself, unpickling runs arbitrary code.
+    if store_path is None:
+        store_path = os.path.splitext(pickle_path)[0] + '.det'
+    with open(pickle_path, 'rb') as f:
+        detections = pickle.load(f)
+    save_detections(detections, store_path, class_id=class_id)
+    return store_path
+
+
+def load_stub(stub_path):
+    # .pkl stubs use the old pickle format, anything else is read from a (memory-mapped) detection store
+    if stub_path.endswith('.pkl'):
+        with open(stub_path, 'rb') as f:
+            return as_tracks(pickle.load(f))
+    return DetectionStore(stub_path).to_tracks()
+
+
+def save_stub(detections, stub_path, class_id = -1):
+    if stub_path.endswith('.pkl'):
+        with open(stub_path, 'wb') as f:
+            pickle.dump(as_tracks(detections).to_detections(), f)
+    else:
+        save_tracks(as_tracks(detections), stub_path, class_id=class_id)
+
+
+class DetectionStore:
+    def __init__(self, store_path, mmap_mode = 'r'):
+        self.store_path = store_path
+        self.frame_offsets = np.load(os.path.join(store_path, 'frame_offsets.npy'))
+        for name in COLUMNS:
+            setattr(self, name, np.load(os.path.join(store_path, f'{name}.npy'), mmap_mode=mmap_mode))
+
+    def __len__(self):
+        # Number of frames (including frames without detections)
+        return len(self.frame_offsets) - 1
+
+    def __getitem__(self, frame_num):
+        # Same {track_id: [x1, y1, x2, y2]} dict the trackers return for a single frame
+        if frame_num < 0:
+            frame_num += len(self)
+        if not 0 <= frame_num < len(self):
+            raise IndexError(frame_num)
+        start, stop = self.frame_offsets[frame_num], self.frame_offsets[frame_num + 1]
+        return {int(tid): box.tolist() for tid, box in zip(self.track_id[start:stop], self.bbox[start:stop])}
+
+    def __iter__(self):
+        for frame_num in range(len(self)):
+            yield self[frame_num]
+
+    def frame_range(self, start_frame, stop_frame):
+        # Column slices (frame_index, track_id, bbox, confidence, class_id) for frames [start_frame, stop_frame)
+        start_frame = max(0, start_frame)
+        stop_frame = min(len(self), stop_frame)
+        start, stop = self.frame_offsets[start_frame], self.frame_offsets[max(start_frame, stop_frame)]
+        return tuple(getattr(self, name)[start:stop] for name in COLUMNS)
+
+    def track_boxes(self, track_id):
+        # Dense (num_frames, 4) float32 boxes of one track, NaN on frames without that track
+        boxes = np.full((len(self), 4), np.nan, np.float32)
+        mask = np.asarray(self.track_id) == track_id
+        boxes[np.asarray(self.frame_index)[mask]] = self.bbox[mask]
+        return boxes
+
+    def to_tracks(self):
+        # Group rows by track id into contiguous per-track arrays
+        track_id = np.asarray(self.track_id)
+        frame_index = np.asarray(self.frame_index)
+        confidence = np.asarray(self.confidence)
+        has_confidence = not np.isnan(confidence).all()
+        tracks = {}
+        for tid in np.unique(track_id):
+            mask = track_id == tid
+            tracks[int(tid)] = Track(int(tid), frame_index[mask], self.bbox[mask], confidence[mask] if has_confidence else None)
+        return Tracks(len(self), tracks)
+
+    def to_detections(self, start_frame = 0, stop_frame = None):
+        # List of per-frame dicts, same format as the old pickle stubs
+        if stop_frame is None:
+            stop_frame = len(self)
+        return [self[frame_num] for frame_num in range(start_frame, min(stop_frame, len(self)))]
+
+
+if __name__ == "__main__":
+    # python -m utils.detection_store tracker_stubs/player_detections2p.pkl [output.det] [--class-id 0]
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert a pickled tracker stub to a columnar detection store')
+    parser.add_argument('pickle_path')
+    parser.add_argument('store_path', nargs='?')
+    parser.add_argument('--class-id', type=int, default=-1)
+    args = parser.parse_args()
+    print(convert_pickle_stub(args.pickle_path, args.store_path, args.class_id))
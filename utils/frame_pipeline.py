@@ -0,0 +1,158 @@
+import contextvars
+import queue
+import threading
+import time
+
+_END = object() # marks the end of the stream on every queue
+
+
+class FramePipeline:
+    # Runs decode and every stage in its own thread, connected by bounded queues.
+    # A full queue blocks the stage before it (backpressure), so at most
+    # max_queue_size items wait between two stages. The caller consumes the
+    # output of the last stage (e.g. the encoder), so the slowest stage sets the pace.
+    def __init__(self, stages, max_queue_size = 8):
+        self.stages = list(stages) # list of (name, fn), fn maps one item to the next
+        self.max_queue_size = max_queue_size
+        self.queues = []
+        self.stage_stats = {}
+        self._error = None
+        self._stop = threading.Event()
+
+    def run(self, source):
+        # Generator yielding the last stage's output in order, source is any iterable (e.g. read_video_frames)
+        names = ['decode'] + [name for name, _ in self.stages]
+        self.queues = [queue.Queue(maxsize=self.max_queue_size) for _ in names]
+        self.stage_stats = {name: {'items': 0, 'busy_seconds': 0.0, 'max_queue_depth': 0, 'total_queue_depth': 0}
+                            for name in names}
+        self._error = None
+        self._stop.clear()
+
+        # Each thread runs in a copy of the caller's context, so the stages see the caller's profiler (use_profiler)
+        threads = [threading.Thread(target=contextvars.copy_context().run, args=(self._decode, source, self.queues[0]),
+                                    name='decode', daemon=True)]
+        for i, (name, fn) in enumerate(self.stages):
+            threads.append(threading.Thread(target=contextvars.copy_context().run,
+                                            args=(self._work, name, fn, self.queues[i], self.queues[i + 1]),
+                                            name=name, daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            output_queue = self.queues[-1]
+            while True:
+                item = self._get(output_queue)
+                if item is _END:
+                    break
+                yield item
+        finally:
+            # Also runs when the consumer stops early, unblock and stop every thread
+            self._stop.set()
+            for q in self.queues:
+                self._drain(q)
+            for thread in threads:
+                thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+    def queue_depths(self):
+        # Current number of items waiting in front of each consumer
+        names = [name for name, _ in self.stages] + ['output']
+        return {name: q.qsize() for name, q in zip(names, self.queues)}
+
+    def report(self):
+        # Per-stage items, busy time and output queue depth (max and mean, sampled on every put)
+        report = {}
+        for name, stats in self.stage_stats.items():
+            items = stats['items']
+            report[name] = {
+                'items': items,
+                'busy_seconds': round(stats['busy_seconds'], 4),
+                'max_queue_depth': stats['max_queue_depth'],
+                'mean_queue_depth': round(stats['total_queue_depth'] / items, 2) if items else 0.0,
+            }
+        return report
+
+    def print_report(self):
+        for name, stats in self.report().items():
+            print(f"{name:>10s}: {stats['items']} items, {stats['busy_seconds']:.2f}s busy, "
+                  f"queue depth max {stats['max_queue_depth']} / mean {stats['mean_queue_depth']}")
+
+    def _decode(self, source, output_queue):
+        stats = self.stage_stats['decode']
+        try:
+            source = iter(source)
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                item = next(source, _END)
+                if item is _END:
+                    break
+                stats['busy_seconds'] += time.perf_counter() - start
+                self._put(output_queue, item, stats)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._put(output_queue, _END)
+
+    def _work(self, name, fn, input_queue, output_queue):
+        stats = self.stage_stats[name]
+        try:
+            while not self._stop.is_set():
+                item = self._get(input_queue)
+                if item is _END:
+                    break
+                start = time.perf_counter()
+                item = fn(item)
+                stats['busy_seconds'] += time.perf_counter() - start
+                self._put(output_queue, item, stats)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._put(output_queue, _END)
+
+    def _fail(self, error):
+        # Keep the first error, the consumer re-raises it once every thread has stopped
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _put(self, q, item, stats = None):
+        if item is _END:
+            # Sentinel must always get through, make room if the pipeline is stopping
+            while True:
+                try:
+                    q.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    if self._stop.is_set():
+                        self._drain(q)
+
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        else:
+            return
+        if stats is not None:
+            depth = q.qsize()
+            stats['items'] += 1
+            stats['total_queue_depth'] += depth
+            stats['max_queue_depth'] = max(stats['max_queue_depth'], depth)
+
+    def _get(self, q):
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return _END
+
+    def _drain(self, q):
+        while True:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                return
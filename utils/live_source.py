@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+import cv2
+
+
+class LiveSource:
+    # Reads a cv2.VideoCapture source in its own thread and only keeps the newest frame, so a consumer that
+    # falls behind jumps to the latest frame instead of working through a backlog. Frames replaced before
+    # they were read are counted in frames_dropped.
+    # source is a camera index (0 or '0'), a stream URL or a video file. Files are replayed at their native
+    # frame rate by default, so they behave like a camera for testing. With realtime=False a file is read
+    # as fast as the consumer takes the frames instead, nothing is dropped.
+    def __init__(self, source, realtime = None, default_fps = 30):
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        self.source = source
+        self.is_file = isinstance(source, str) and os.path.isfile(source)
+        self.realtime = self.is_file if realtime is None else realtime
+
+        self.cap = cv2.VideoCapture(source)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Failed to open video source {source}")
+        if not self.is_file:
+            # Cameras and streams queue frames inside OpenCV too, keep that queue as short as the backend allows
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and fps > 0 else default_fps
+
+        self.frames_captured = 0
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self._latest = None # (frame_num, frame, capture_time) not read yet
+        self._ended = False
+        self._error = None
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._capture, name='capture', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def read(self):
+        # Newest frame that was not returned yet as (frame_num, frame, capture_time), waits for the next one.
+        # capture_time is time.perf_counter() right after the frame was decoded, None at the end of the stream.
+        with self._condition:
+            while self._latest is None and not self._ended:
+                self._condition.wait()
+            if self._error is not None:
+                raise self._error
+            item = self._latest
+            self._latest = None
+            self._condition.notify()
+        if item is not None:
+            self.frames_read += 1
+        return item
+
+    def _capture(self):
+        start = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                if self.realtime:
+                    # Wait until the frame is due, as a camera would deliver it
+                    delay = start + self.frames_captured / self.fps - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                with self._condition:
+                    if not self.realtime and self.is_file:
+                        # Wait for the consumer instead of dropping
+                        while self._latest is not None and not self._stop.is_set():
+                            self._condition.wait(0.1)
+                        if self._stop.is_set():
+                            break
+                    capture_time = time.perf_counter()
+                    if self._latest is not None:
+                        self.frames_dropped += 1
+                    self._latest = (self.frames_captured, frame, capture_time)
+                    self.frames_captured += 1
+                    self._condition.notify()
+        except BaseException as e:
+            self._error = e
+        finally:
+            self.cap.release()
+            with self._condition:
+                self._ended = True
+                self._condition.notify_all()
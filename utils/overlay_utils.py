@@ -0,0 +1,81 @@
+import cv2
+import numpy as np
+
+
+class OverlaySprite:
+    # A static overlay rendered once as pre-blended patches: for every blob of drawn pixels, the premultiplied
+    # color and (1 - alpha) of its bounding box. composite() only touches those boxes, so the per-frame cost
+    # depends on the overlay area, not the frame size.
+    def __init__(self, patches):
+        self.patches = patches # list of (x, y, premultiplied_color, inverse_alpha), float32 (h, w, 3) arrays
+
+    @classmethod
+    def render(cls, frame_shape, draw, translucent_rect = None, translucent_color = (255, 255, 255), translucent_alpha = 0.5):
+        """
+        Render an overlay once from normal cv2 drawing code.
+
+        Parameters:
+        frame_shape (tuple): Shape of the frames the overlay will be composited on.
+        draw (callable): draw(canvas) draws shapes/text onto a full-frame canvas.
+        translucent_rect (tuple): Optional (x1, y1, x2, y2) box (inclusive, like cv2.rectangle) tinted under the drawing.
+        translucent_color (tuple): BGR color of the tinted box.
+        translucent_alpha (float): Opacity of the tinted box.
+
+        Returns:
+        OverlaySprite: The pre-blended overlay.
+        """
+        height, width = frame_shape[:2]
+        # Drawing on a black and a white canvas gives both the premultiplied color (black canvas) and the
+        # coverage of every pixel (white - black = 255 * (1 - alpha)), anti-aliased edges included
+        black_canvas = np.zeros((height, width, 3), np.uint8)
+        white_canvas = np.full((height, width, 3), 255, np.uint8)
+        draw(black_canvas)
+        draw(white_canvas)
+        coverage = cv2.subtract(white_canvas, black_canvas)
+        # Untouched pixels have coverage 255 in every channel
+        visible = cv2.bitwise_not(cv2.inRange(coverage, (255, 255, 255), (255, 255, 255)))
+
+        tint = None
+        if translucent_rect is not None:
+            x1, y1, x2, y2 = translucent_rect
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(width - 1, x2), min(height - 1, y2)
+            tint = (x1, y1, x2 + 1, y2 + 1)
+            visible[y1:y2 + 1, x1:x2 + 1] = 255
+
+        # One patch per blob of visible pixels, float math only inside the patches
+        num_blobs, _, stats, _ = cv2.connectedComponentsWithStats(visible, connectivity=8)
+        patches = []
+        for x, y, w, h, _ in stats[1:num_blobs]:
+            premultiplied_color = black_canvas[y:y + h, x:x + w].astype(np.float32)
+            inverse_alpha = coverage[y:y + h, x:x + w].astype(np.float32) / 255
+            if tint is not None:
+                # Put the tinted box under the drawing: what shows through the drawing is now the tinted frame
+                tx1, ty1 = max(tint[0], x) - x, max(tint[1], y) - y
+                tx2, ty2 = min(tint[2], x + w) - x, min(tint[3], y + h) - y
+                if tx1 < tx2 and ty1 < ty2:
+                    box = (slice(ty1, ty2), slice(tx1, tx2))
+                    premultiplied_color[box] += inverse_alpha[box] * (translucent_alpha * np.array(translucent_color, np.float32))
+                    inverse_alpha[box] *= 1 - translucent_alpha
+            patches.append((int(x), int(y), premultiplied_color, inverse_alpha))
+        return cls(patches)
+
+    def composite(self, frame):
+        # Blends the overlay into frame in place and returns frame
+        frame_height, frame_width = frame.shape[:2]
+        for x, y, premultiplied_color, inverse_alpha in self.patches:
+            h, w = inverse_alpha.shape[:2]
+            if x + w > frame_width or y + h > frame_height:
+                # Rendered for a bigger frame, clip to this one
+                w, h = min(w, frame_width - x), min(h, frame_height - y)
+                if w <= 0 or h <= 0:
+                    continue
+                premultiplied_color = premultiplied_color[:h, :w]
+                inverse_alpha = inverse_alpha[:h, :w]
+            roi = frame[y:y + h, x:x + w]
+            blended = roi * inverse_alpha
+            blended += premultiplied_color
+            # Round half to even like cv2.addWeighted
+            np.rint(blended, out=blended)
+            roi[:] = blended
+        return frame
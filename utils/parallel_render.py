@@ -0,0 +1,105 @@
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+
+# Per-process state of a render worker, set by _init_worker
+_worker = {}
+
+
+def _init_worker(render_frame, buffer, frame_shape):
+    # Every worker renders single-threaded, the pool provides the parallelism
+    cv2.setNumThreads(1)
+    _worker['render_frame'] = render_frame
+    _worker['frames'] = np.frombuffer(buffer, np.uint8).reshape((-1,) + frame_shape)
+
+
+def _render_chunk(start_frame, slots):
+    # Renders frames start_frame, start_frame + 1, ... in place in their shared memory slots
+    frames = _worker['frames']
+    render_frame = _worker['render_frame']
+    for i, slot in enumerate(slots):
+        frame = frames[slot]
+        rendered = render_frame(start_frame + i, frame)
+        if rendered is not frame:
+            frame[:] = rendered
+    return start_frame
+
+
+class ParallelRenderer:
+    # Renders frames on a process pool. Decoded frames are copied into a ring of shared memory
+    # slots, workers draw on them in place and only (frame number, slot) pairs are pickled.
+    # Output comes back in order, with at most max_in_flight chunks rendering at a time.
+    # Workers come from a forkserver (spawn where there is none), never from a fork of the caller: by the time
+    # frames are rendered the decode / encode threads and torch's thread pools are running, and a forked
+    # child can inherit their locks in a held state and deadlock.
+    # A worker that dies (e.g. render_frame can't be unpickled in the child, or the calling script has no
+    # __main__ guard) breaks the pool and run() raises BrokenProcessPool, instead of waiting on a respawned one.
+    def __init__(self, render_frame, num_workers = None, chunk_size = 1, max_in_flight = None):
+        self.render_frame = render_frame # render_frame(frame_num, frame) -> frame, pickled once to every worker
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self.max_in_flight = max_in_flight or 2 * self.num_workers
+        self.stats = {'frames': 0, 'seconds': 0.0, 'waiting_seconds': 0.0}
+
+    def run(self, frames):
+        # Generator yielding rendered frames in input order, frames is any iterable of same-sized frames
+        start = time.perf_counter()
+        frames = iter(frames)
+        first_frame = next(frames, None)
+        if first_frame is None:
+            return
+        frame_shape = first_frame.shape
+
+        num_slots = self.max_in_flight * self.chunk_size
+        # The shared buffer and the render state go to every worker once, at start-up
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+        buffer = context.RawArray('B', num_slots * first_frame.size)
+        slot_frames = np.frombuffer(buffer, np.uint8).reshape((num_slots,) + frame_shape)
+        free_slots = deque(range(num_slots))
+        in_flight = deque() # (slots, future), oldest first
+        pending_frame = first_frame
+        frame_num = 0
+
+        pool = ProcessPoolExecutor(self.num_workers, mp_context=context, initializer=_init_worker,
+                                   initargs=(self.render_frame, buffer, frame_shape))
+        try:
+            while True:
+                # Hand out as many chunks as there are free slots
+                while pending_frame is not None and len(free_slots) >= self.chunk_size:
+                    slots = []
+                    while pending_frame is not None and len(slots) < self.chunk_size:
+                        if pending_frame.shape != frame_shape:
+                            raise ValueError(f"Frame {frame_num + len(slots)} has shape {pending_frame.shape}, expected {frame_shape}")
+                        slot = free_slots.popleft()
+                        slot_frames[slot] = pending_frame
+                        slots.append(slot)
+                        pending_frame = next(frames, None)
+                    in_flight.append((slots, pool.submit(_render_chunk, frame_num, slots)))
+                    frame_num += len(slots)
+
+                if not in_flight:
+                    break
+
+                # Then wait for the oldest one so frames come out in order (re-raises worker errors)
+                slots, result = in_flight.popleft()
+                waiting_start = time.perf_counter()
+                result.result()
+                self.stats['waiting_seconds'] += time.perf_counter() - waiting_start
+                for slot in slots:
+                    # Copy out so the slot can be reused while the caller still holds the frame
+                    frame = slot_frames[slot].copy()
+                    free_slots.append(slot)
+                    self.stats['frames'] += 1
+                    yield frame
+        finally:
+            # Also runs when the consumer stops early, chunks that did not start are dropped
+            pool.shutdown(wait=True, cancel_futures=True)
+            self.stats['seconds'] += time.perf_counter() - start
+
+    def print_report(self):
+        frames, seconds = self.stats['frames'], self.stats['seconds']
+        print(f"    render: {frames} frames on {self.num_workers} processes, {seconds:.2f}s "
+              f"({frames / seconds if seconds else 0.0:.1f} fps), {self.stats['waiting_seconds']:.2f}s waiting for workers")
@@ -1,65 +1,85 @@
+import re
+from functools import lru_cache
 import numpy as np
 import cv2
+from .overlay_utils import OverlaySprite
+
+# (label, column suffix) of every stats row in the panel, columns are named player_<id>_<suffix>
+PLAYER_STATS = [
+    ("Shot Speed", 'last_shot_speed'),
+    ("Player Speed", 'last_player_speed'),
+    ("avg. S. Speed", 'average_shot_speed'),
+    ("avg. P. Speed", 'average_player_speed'),
+]
+
+PANEL_WIDTH = 350 # for 2 players
+PANEL_PLAYER_WIDTH = 120 # added per extra player
+PANEL_HEIGHT = 230
+
+
+def get_player_ids(columns):
+    # Player ids that have stats columns, e.g. [1, 2] for player_1_* and player_2_*
+    player_ids = set()
+    for column in columns:
+        match = re.fullmatch(r'player_(\d+)_last_shot_speed', str(column))
+        if match:
+            player_ids.add(int(match.group(1)))
+    return sorted(player_ids)
+
+
+def format_player_stats(player_ids, stats_values):
+    # Panel text as a tuple of lines: the header, then one values line per entry of PLAYER_STATS.
+    # stats_values[i][j] is the value of PLAYER_STATS[i] for player_ids[j]
+    header = "".join(f"     Player {player_id}" for player_id in player_ids)
+    return (header,) + tuple("    ".join(f"{value:.1f} km/h" for value in values) for values in stats_values)
+
+
+def get_player_stats_lines(player_stats):
+    # Panel text for every row of the stats DataFrame, read from plain NumPy columns
+    player_ids = get_player_ids(player_stats.columns)
+    columns = [[player_stats[f'player_{player_id}_{suffix}'].to_numpy() for player_id in player_ids]
+               for _, suffix in PLAYER_STATS]
+    return [format_player_stats(player_ids, [[column[i] for column in stat_columns] for stat_columns in columns])
+            for i in range(len(player_stats))]
+
+
+@lru_cache(maxsize=4)
+def render_player_stats_panel(frame_shape, lines):
+    # The panel only changes when a shot is detected, so each distinct text is rendered once and reused.
+    # Frames are drawn in order, only the last few texts are kept (a 1080p panel is about 2 MB of float32)
+    num_players = lines[0].count("Player")
+    width = PANEL_WIDTH + PANEL_PLAYER_WIDTH * max(0, num_players - 2)
+
+    start_x = frame_shape[1] - 50 - width
+    start_y = frame_shape[0] - 500
+    end_x = start_x + width
+    end_y = start_y + PANEL_HEIGHT
+
+    def draw(canvas):
+        cv2.putText(canvas, lines[0], (start_x+80, start_y+30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+        for i, ((label, _), text) in enumerate(zip(PLAYER_STATS, lines[1:])):
+            y = start_y + 80 + 40 * i
+            cv2.putText(canvas, label, (start_x+10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+            cv2.putText(canvas, text, (start_x+130, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+
+    return OverlaySprite.render(frame_shape, draw, translucent_rect=(start_x, start_y, end_x, end_y),
+                                translucent_color=(0, 0, 0), translucent_alpha=0.5)
+
+
+def draw_player_stats_lines(frame, lines):
+    # Blends the (cached) panel for these lines into the panel's box of frame
+    return render_player_stats_panel(frame.shape, lines).composite(frame)
+
 
 def draw_player_stats(output_video_frames, player_stats):
 
-    for index, row in player_stats.iterrows():
-        player_1_shot_speed = row['player_1_last_shot_speed']
-        player_2_shot_speed = row['player_2_last_shot_speed']
-        player_1_speed = row['player_1_last_player_speed']
-        player_2_speed = row['player_2_last_player_speed']
-
-        avg_player_1_shot_speed = row['player_1_average_shot_speed']
-        avg_player_2_shot_speed = row['player_2_average_shot_speed']
-        avg_player_1_speed = row['player_1_average_player_speed']
-        avg_player_2_speed = row['player_2_average_player_speed']
-
-        frame = output_video_frames[index]
-
-
-        shapes = np.zeros_like(frame, np.uint8)
-
-        width = 350
-        height = 230
-
-        start_x = frame.shape[1]-400
-        start_y = frame.shape[0]-500
-        end_x = start_x + width
-        end_y = start_y + height
-
-        overlay = frame.copy()
-        cv2.rectangle(overlay, (start_x, start_y), (end_x, end_y), (0, 0, 0), -1)
-        alpha = 0.5
-        cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
-        output_video_frames[index] = frame
-
-
-        # --- FIX HERE FOR 4 PLAYERS(if 4 player works) ---
-
-        text = "     Player 1     Player 2"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+80, start_y+30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-        
-        text = "Shot Speed"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+10, start_y+80), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
-        text = f"{player_1_shot_speed:.1f} km/h    {player_2_shot_speed:.1f} km/h"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+130, start_y+80), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-
-        text = "Player Speed"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+10, start_y+120), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
-        text = f"{player_1_speed:.1f} km/h    {player_2_speed:.1f} km/h"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+130, start_y+120), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-        
-        
-        text = "avg. S. Speed"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+10, start_y+160), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
-        text = f"{avg_player_1_shot_speed:.1f} km/h    {avg_player_2_shot_speed:.1f} km/h"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+130, start_y+160), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-        
-        text = "avg. P. Speed"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+10, start_y+200), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
-        text = f"{avg_player_1_speed:.1f} km/h    {avg_player_2_speed:.1f} km/h"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+130, start_y+200), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-        # ---------------------------------------------------
-
-
-    return output_video_frames
\ No newline at end of file
+    for index, lines in zip(player_stats.index.to_numpy(), get_player_stats_lines(player_stats)):
+        output_video_frames[index] = draw_player_stats_lines(output_video_frames[index], lines)
+
+    return output_video_frames
+
+def draw_player_stats_frame(frame, row):
+    # Draws the stats panel for a single frame, row holds that frame's stats (Series or dict)
+    player_ids = get_player_ids(row.keys())
+    stats_values = [[row[f'player_{player_id}_{suffix}'] for player_id in player_ids] for _, suffix in PLAYER_STATS]
+    return draw_player_stats_lines(frame, format_player_stats(player_ids, stats_values))
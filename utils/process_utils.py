@@ -0,0 +1,18 @@
+import os
+
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS')
+
+
+def limit_threads(num_threads):
+    # Use as the initializer of worker processes: runs before torch / OpenCV create their thread pools,
+    # so num_workers * num_threads stays within the machine's cores
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(num_threads)
+    import cv2
+    cv2.setNumThreads(num_threads)
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+        torch.set_num_interop_threads(1)
+    except ImportError:
+        pass
\ No newline at end of file
@@ -0,0 +1,167 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+import numpy as np
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+# Stage timings for a whole run. Stages are timed with `with profiler.stage('name', frames=n):`, per-frame
+# costs of the detectors and draw calls with `with profiler.timer('name', frames=n):` (one sample of
+# elapsed / n per call). A disabled profiler hands out one shared nullcontext and records nothing, so the
+# calls can stay in the code. Results are written as a JSON summary and a Chrome trace-event file
+# (open in chrome://tracing or https://ui.perfetto.dev).
+# CPU time is process CPU time (all threads), worker processes (ParallelRenderer, segmented detection)
+# are only seen through their wall time and peak RSS.
+
+_DISABLED = nullcontext()
+
+
+class Profiler:
+    def __init__(self, enabled = False):
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self.stages = {} # name -> {'calls', 'wall_seconds', 'cpu_seconds', 'frames'}
+        self.samples = {} # name -> [seconds per frame]
+        self.events = [] # Chrome trace 'X' events
+        self._lock = threading.Lock()
+
+    def stage(self, name, frames = 0):
+        if not self.enabled:
+            return _DISABLED
+        return self._stage(name, frames)
+
+    def timer(self, name, frames = 1):
+        if not self.enabled:
+            return _DISABLED
+        return self._timer(name, frames)
+
+    @contextmanager
+    def _stage(self, name, frames):
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            cpu = time.process_time() - start_cpu
+            with self._lock:
+                stats = self.stages.setdefault(name, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'frames': 0})
+                stats['calls'] += 1
+                stats['wall_seconds'] += end - start
+                stats['cpu_seconds'] += cpu
+                stats['frames'] += frames
+                self._add_event(name, 'stage', start, end, {'frames': frames, 'cpu_ms': round(cpu * 1000, 3)})
+
+    @contextmanager
+    def _timer(self, name, frames):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.samples.setdefault(name, []).append((end - start) / max(frames, 1))
+                self._add_event(name, 'frame', start, end, {'frames': frames})
+
+    def add_frames(self, name, frames):
+        # For stages whose frame count is only known at the end (e.g. a streamed video)
+        if self.enabled and name in self.stages:
+            self.stages[name]['frames'] += frames
+
+    def _add_event(self, name, category, start, end, args):
+        self.events.append({'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                            'ts': round((start - self.start) * 1e6, 1), 'dur': round((end - start) * 1e6, 1), 'args': args})
+
+    def summary(self):
+        stages = {}
+        for name, stats in self.stages.items():
+            wall = stats['wall_seconds']
+            stages[name] = {
+                'calls': stats['calls'],
+                'wall_seconds': round(wall, 4),
+                'cpu_seconds': round(stats['cpu_seconds'], 4),
+                'frames': stats['frames'],
+                'fps': round(stats['frames'] / wall, 2) if stats['frames'] and wall else None,
+            }
+
+        latencies = {}
+        for name, samples in self.samples.items():
+            ms = np.array(samples) * 1000
+            p50, p90, p95, p99 = np.percentile(ms, [50, 90, 95, 99])
+            latencies[name] = {'samples': len(ms), 'mean_ms': round(ms.mean(), 3), 'p50_ms': round(p50, 3),
+                               'p90_ms': round(p90, 3), 'p95_ms': round(p95, 3), 'p99_ms': round(p99, 3),
+                               'max_ms': round(ms.max(), 3)}
+
+        return {
+            'wall_seconds': round(time.perf_counter() - self.start, 4),
+            'cpu_seconds': round(time.process_time(), 4),
+            'peak_rss_mb': peak_rss_mb(),
+            'peak_rss_children_mb': peak_rss_mb(children=True),
+            'stages': stages,
+            'per_frame_latency': latencies,
+        }
+
+    def save(self, summary_path, trace_path = None):
+        # JSON summary, and the Chrome trace next to it (<name>.trace.json) unless a path is given
+        if trace_path is None:
+            trace_path = os.path.splitext(summary_path)[0] + '.trace.json'
+        for path in (summary_path, trace_path):
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(summary_path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        with open(trace_path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+        return summary_path, trace_path
+
+    def print_report(self):
+        summary = self.summary()
+        for name, stats in summary['stages'].items():
+            fps = f", {stats['fps']:.1f} fps" if stats['fps'] else ''
+            print(f"{name:>22s}: {stats['wall_seconds']:8.3f}s wall, {stats['cpu_seconds']:8.3f}s cpu{fps}")
+        for name, stats in summary['per_frame_latency'].items():
+            print(f"{name:>22s}: p50 {stats['p50_ms']:.2f}ms, p95 {stats['p95_ms']:.2f}ms, p99 {stats['p99_ms']:.2f}ms per frame")
+        print(f"peak RSS {summary['peak_rss_mb']} MB (children {summary['peak_rss_children_mb']} MB)")
+
+
+def peak_rss_mb(children = False):
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    scale = 1 if os.uname().sysname == 'Darwin' else 1024
+    return round(usage.ru_maxrss * scale / 2**20, 1)
+
+
+# Profiler used by the trackers and renderers, disabled unless set_profiler is called with an enabled one
+_profiler = Profiler()
+# Overrides it for one job (see use_profiler), so concurrent jobs in one process keep their timings apart.
+# Context variables are per thread, FramePipeline runs its threads in a copy of the caller's context.
+_job_profiler = contextvars.ContextVar('job_profiler', default=None)
+
+
+def get_profiler():
+    profiler = _job_profiler.get()
+    return profiler if profiler is not None else _profiler
+
+
+def set_profiler(profiler):
+    global _profiler
+    _profiler = profiler
+    return profiler
+
+
+@contextmanager
+def use_profiler(profiler):
+    # get_profiler() returns profiler in this thread (and the pipelines it starts) until the block ends
+    token = _job_profiler.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _job_profiler.reset(token)
@@ -0,0 +1,202 @@
+import numpy as np
+
+
+class Detections(dict):
+    # One frame's {track_id: [x1, y1, x2, y2]} dict as returned by the trackers, with the detector score of
+    # each track in confidences. Works everywhere a plain dict does, Tracks.from_detections keeps the scores.
+    __slots__ = ('confidences',)
+
+    def __init__(self, boxes = (), confidences = None):
+        super().__init__(boxes)
+        self.confidences = {} if confidences is None else confidences
+
+
+class Track:
+    # One track as contiguous arrays: sorted frame numbers and one float32 row of values per frame
+    # (x1, y1, x2, y2 for detections, x, y for mini court positions), and optionally the detector
+    # score per frame (NaN on interpolated frames)
+    __slots__ = ('track_id', 'frames', 'values', 'confidence')
+
+    def __init__(self, track_id, frames, values, confidence = None):
+        self.track_id = track_id
+        self.frames = np.ascontiguousarray(frames, np.int32)
+        self.values = np.ascontiguousarray(values, np.float32).reshape(len(self.frames), -1)
+        self.confidence = None if confidence is None else np.ascontiguousarray(confidence, np.float32).reshape(len(self.frames))
+
+    def __len__(self):
+        return len(self.frames)
+
+    def dense(self, num_frames):
+        # (num_frames, k) array with NaN rows on frames where the track is missing
+        dense = np.full((num_frames, self.values.shape[1]), np.nan, np.float32)
+        dense[self.frames] = self.values
+        return dense
+
+    def interpolate(self, max_gap = None):
+        # Fills the frames between consecutive rows linearly, only across gaps of at most max_gap frames
+        if len(self.frames) < 2:
+            return self
+        gaps = np.diff(self.frames)
+        fill = gaps > 1
+        if max_gap is not None:
+            fill &= gaps <= max_gap
+        counts = np.where(fill, gaps - 1, 0)
+        if not counts.any():
+            return self
+
+        # Missing frame numbers of every filled gap, e.g. frames [0, 3] -> [1, 2]
+        first_missing = np.repeat(self.frames[:-1] + 1, counts)
+        missing = first_missing + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        missing_values = np.column_stack([np.interp(missing, self.frames, column) for column in self.values.T])
+
+        frames = np.concatenate([self.frames, missing])
+        order = np.argsort(frames, kind='stable')
+        confidence = None
+        if self.confidence is not None:
+            confidence = np.concatenate([self.confidence, np.full(len(missing), np.nan, np.float32)])[order]
+        return Track(self.track_id, frames[order], np.concatenate([self.values, missing_values])[order], confidence)
+
+    def at(self, frame_num):
+        # Row for a single frame or None if the track is missing there
+        i = np.searchsorted(self.frames, frame_num)
+        if i < len(self.frames) and self.frames[i] == frame_num:
+            return self.values[i]
+        return None
+
+
+class Tracks:
+    # All tracks of a video. Indexing and iterating give the old per-frame {track_id: [values]} dicts,
+    # while filtering, interpolation and projection work on the per-track arrays.
+    __slots__ = ('num_frames', 'tracks')
+
+    def __init__(self, num_frames, tracks = None):
+        self.num_frames = num_frames
+        self.tracks = {} if tracks is None else tracks # track_id -> Track
+
+    @classmethod
+    def from_detections(cls, detections):
+        # Build from a list of per-frame {track_id: bbox} dicts, scores of Detections dicts are kept
+        frames = {}
+        values = {}
+        confidences = {}
+        has_confidences = False
+        num_frames = 0
+        for frame_num, frame_dict in enumerate(detections):
+            num_frames = frame_num + 1
+            frame_confidences = getattr(frame_dict, 'confidences', None) or {}
+            has_confidences |= bool(frame_confidences)
+            for track_id, value in frame_dict.items():
+                if track_id not in frames:
+                    frames[track_id] = []
+                    values[track_id] = []
+                    confidences[track_id] = []
+                frames[track_id].append(frame_num)
+                values[track_id].append(value)
+                confidences[track_id].append(frame_confidences.get(track_id, np.nan))
+        return cls(num_frames, {track_id: Track(track_id, frames[track_id], values[track_id],
+                                                confidences[track_id] if has_confidences else None)
+                                for track_id in frames})
+
+    @classmethod
+    def from_dense(cls, dense_values, num_frames = None):
+        # Build from {track_id: (num_frames, k) array}, rows containing NaN are treated as missing
+        if num_frames is None:
+            num_frames = max((len(dense) for dense in dense_values.values()), default=0)
+        tracks = {}
+        for track_id, dense in dense_values.items():
+            dense = np.asarray(dense)
+            frames = np.flatnonzero(~np.isnan(dense).any(axis=1))
+            if len(frames):
+                tracks[track_id] = Track(track_id, frames, dense[frames])
+        return cls(num_frames, tracks)
+
+    def __len__(self):
+        return self.num_frames
+
+    def __getitem__(self, frame_num):
+        if frame_num < 0:
+            frame_num += self.num_frames
+        if not 0 <= frame_num < self.num_frames:
+            raise IndexError(frame_num)
+        frame_dict = {}
+        for track_id, track in self.tracks.items():
+            value = track.at(frame_num)
+            if value is not None:
+                frame_dict[track_id] = value.tolist()
+        return frame_dict
+
+    def __iter__(self):
+        # Walk all tracks with one cursor each instead of a search per frame
+        cursors = {track_id: 0 for track_id in self.tracks}
+        for frame_num in range(self.num_frames):
+            frame_dict = {}
+            for track_id, track in self.tracks.items():
+                i = cursors[track_id]
+                if i < len(track.frames) and track.frames[i] == frame_num:
+                    frame_dict[track_id] = track.values[i].tolist()
+                    cursors[track_id] = i + 1
+            yield frame_dict
+
+    def __contains__(self, track_id):
+        return track_id in self.tracks
+
+    def track_ids(self):
+        return list(self.tracks.keys())
+
+    def track(self, track_id):
+        return self.tracks[track_id]
+
+    def dense(self, track_id):
+        # (num_frames, k) values of one track, NaN where it is missing
+        return self.tracks[track_id].dense(self.num_frames)
+
+    def select(self, track_ids):
+        # Keep only the given tracks (arrays are shared, not copied)
+        return Tracks(self.num_frames, {track_id: self.tracks[track_id] for track_id in track_ids if track_id in self.tracks})
+
+    def interpolate(self, max_gap = None):
+        # Every track with its short gaps filled in, see Track.interpolate
+        return Tracks(self.num_frames, {track_id: track.interpolate(max_gap) for track_id, track in self.tracks.items()})
+
+    def to_detections(self):
+        return list(self)
+
+
+def as_tracks(detections):
+    # Accepts Tracks, a DetectionStore or a list of per-frame dicts
+    if isinstance(detections, Tracks):
+        return detections
+    if hasattr(detections, 'to_tracks'):
+        return detections.to_tracks()
+    return Tracks.from_detections(detections)
+
+
+def rolling_max(values, before, after):
+    """
+    Maximum of values[i - before : i + after + 1] for every i, in O(n) using the
+    van Herk / Gil-Werman block prefix/suffix max. NaN values are ignored.
+
+    Parameters:
+    values (np.ndarray): 1D array of values, NaN where missing.
+    before (int): Number of frames before i in the window.
+    after (int): Number of frames after i in the window.
+
+    Returns:
+    np.ndarray: The windowed maximum, NaN where the whole window is missing.
+    """
+    values = np.where(np.isnan(values), -np.inf, np.asarray(values, float))
+    num_values = len(values)
+    window = before + after + 1
+    num_blocks = -(-(num_values + before + after) // window)
+
+    padded = np.full(num_blocks * window, -np.inf)
+    padded[before:before + num_values] = values
+    blocks = padded.reshape(num_blocks, window)
+    prefix_max = np.maximum.accumulate(blocks, axis=1).ravel()
+    suffix_max = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+
+    # Window [i, i + window) of the padded array spans at most two blocks
+    starts = np.arange(num_values)
+    result = np.maximum(suffix_max[starts], prefix_max[starts + window - 1])
+    result[np.isneginf(result)] = np.nan
+    return result
@@ -1,4 +1,9 @@
+import queue
+import subprocess
+import tempfile
+import threading
 import cv2
+import numpy as np
 
 def read_video(video_path):
     # Reads a video from the specified path and returns a list of frames.
@@ -12,14 +17,210 @@ def read_video(video_path):
     cap.release()
     return frames
 
-def save_video(output_video_frames, output_video_path):
-    fourcc = cv2.VideoWriter_fourcc(*'MJPG')
-    out = cv2.VideoWriter(output_video_path, fourcc, 24, (output_video_frames[0].shape[1], output_video_frames[0].shape[0]))
-
-    # catch silent failures
-    if not out.isOpened():
-        raise RuntimeError(f"Failed to open VideoWriter for {output_video_path}")
-    
-    for frame in output_video_frames:
-        out.write(frame)
-    out.release()
\ No newline at end of file
+def read_video_frames(video_path):
+    # Yields frames one at a time so only the current frame is held in memory.
+    cap = cv2.VideoCapture(video_path)
+    try:
+        while cap.isOpened():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        cap.release()
+
+def read_frame_range(video_path, start_frame, stop_frame = None):
+    # Yields frames [start_frame, stop_frame) (to the end when stop_frame is None), seeking to start_frame first
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if start_frame > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        frame_num = start_frame
+        while cap.isOpened() and (stop_frame is None or frame_num < stop_frame):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+            frame_num += 1
+    finally:
+        cap.release()
+
+def get_frame_count(video_path):
+    # Frame count from the container header (can be off by a few frames for some codecs)
+    cap = cv2.VideoCapture(video_path)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return frame_count
+
+def batch_frames(frames, batch_size):
+    # Groups any iterable of frames into lists of up to batch_size frames
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def stride_frames(frames, stride):
+    # Yields (frame_num, frame) for every stride-th frame, plus the last frame so tracks can be interpolated to the end
+    last = None
+    for frame_num, frame in enumerate(frames):
+        if frame_num % stride == 0:
+            yield frame_num, frame
+            last = None
+        else:
+            last = (frame_num, frame)
+    if last is not None:
+        yield last
+
+def read_first_frame(video_path):
+    # Reads only the first frame of a video (used for court keypoints and mini court setup).
+    cap = cv2.VideoCapture(video_path)
+    ret, frame = cap.read()
+    cap.release()
+    if not ret:
+        raise RuntimeError(f"Failed to read a frame from {video_path}")
+    return frame
+
+def get_video_fps(video_path, default = 24):
+    # Frame rate stored in the video's header, default when OpenCV can't tell
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    return fps if fps and fps > 0 else default
+
+class OpenCVEncoder:
+    # cv2.VideoWriter, MJPG AVI by default (big files, but needs nothing besides OpenCV)
+    def __init__(self, output_video_path, fps, frame_size, fourcc = 'MJPG'):
+        self.out = cv2.VideoWriter(output_video_path, cv2.VideoWriter_fourcc(*fourcc), fps, frame_size)
+        # catch silent failures
+        if not self.out.isOpened():
+            raise RuntimeError(f"Failed to open VideoWriter for {output_video_path}")
+
+    def write(self, frame):
+        self.out.write(frame)
+
+    def close(self):
+        self.out.release()
+
+class FFmpegEncoder:
+    # Pipes raw BGR frames to an ffmpeg process, H.264 (libx264) or H.265 (libx265) with a preset and CRF
+    def __init__(self, output_video_path, fps, frame_size, codec = 'libx264', preset = 'veryfast', crf = 23,
+                 pix_fmt = 'yuv420p', ffmpeg_path = 'ffmpeg'):
+        self.output_video_path = output_video_path
+        self.frame_size = frame_size
+        command = [ffmpeg_path, '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{frame_size[0]}x{frame_size[1]}', '-r', str(fps), '-i', '-',
+                   '-an', '-c:v', codec, '-preset', preset, '-crf', str(crf), '-pix_fmt', pix_fmt]
+        if codec == 'libx265':
+            command += ['-tag:v', 'hvc1', '-x265-params', 'log-level=error']
+        # stderr goes to a file, a pipe nobody reads until close() can fill up and stall ffmpeg (and this writer)
+        self.stderr = tempfile.TemporaryFile()
+        try:
+            self.process = subprocess.Popen(command + [output_video_path], stdin=subprocess.PIPE, stderr=self.stderr)
+        except FileNotFoundError:
+            self.stderr.close()
+            raise RuntimeError(f"ffmpeg not found ({ffmpeg_path}), install it or use the opencv encoder")
+
+    def write(self, frame):
+        if (frame.shape[1], frame.shape[0]) != self.frame_size:
+            raise ValueError(f"Frame size {frame.shape[1]}x{frame.shape[0]} does not match {self.frame_size[0]}x{self.frame_size[1]}")
+        try:
+            self.process.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError:
+            self.close()
+
+    def close(self):
+        if self.process.stdin and not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        returncode = self.process.wait()
+        if self.stderr.closed:
+            return
+        self.stderr.seek(0)
+        error = self.stderr.read().decode(errors='replace')
+        self.stderr.close()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg failed writing {self.output_video_path}: {error.strip()}")
+
+ENCODERS = {
+    'opencv': OpenCVEncoder,
+    'ffmpeg': FFmpegEncoder,
+}
+
+class BackgroundEncoder:
+    # Runs an encoder in its own thread so encoding overlaps with producing the next frames.
+    # write() only blocks when max_queue_size frames are already waiting.
+    def __init__(self, encoder, max_queue_size = 16):
+        self.encoder = encoder
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self._encode, name='encode', daemon=True)
+        self.thread.start()
+
+    def write(self, frame):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(frame)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _encode(self):
+        try:
+            while True:
+                frame = self.queue.get()
+                if frame is None:
+                    break
+                self.encoder.write(frame)
+        except BaseException as e:
+            self.error = e
+            # Keep draining so write() / close() never block on a full queue
+            while self.queue.get() is not None:
+                pass
+            return
+        try:
+            self.encoder.close()
+        except BaseException as e:
+            self.error = e
+
+def create_encoder(output_video_path, fps, frame_size, encoder = 'opencv', **encoder_options):
+    # encoder is a name from ENCODERS, encoder_options go to its constructor (e.g. codec, preset, crf, fourcc)
+    if encoder not in ENCODERS:
+        raise ValueError(f"Unknown encoder {encoder!r}, expected one of {sorted(ENCODERS)}")
+    return ENCODERS[encoder](output_video_path, fps, frame_size, **encoder_options)
+
+def save_video(output_video_frames, output_video_path, fps = 24, encoder = 'opencv', background = True, **encoder_options):
+    # Accepts a list or any iterable of frames (e.g. a generator) and writes frames as they arrive,
+    # from a background thread unless background is False. Returns the number of frames written.
+    output_video_frames = iter(output_video_frames)
+    first_frame = next(output_video_frames, None)
+    if first_frame is None:
+        raise ValueError(f"No frames to write to {output_video_path}")
+
+    out = create_encoder(output_video_path, fps, (first_frame.shape[1], first_frame.shape[0]), encoder, **encoder_options)
+    if background:
+        out = BackgroundEncoder(out)
+
+    num_frames = 1
+    try:
+        out.write(first_frame)
+        for frame in output_video_frames:
+            out.write(frame)
+            num_frames += 1
+    except BaseException:
+        # Still stop the encoder thread / ffmpeg process, but report the original error
+        try:
+            out.close()
+        except Exception:
+            pass
+        raise
+    out.close()
+    return num_frames